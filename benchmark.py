@@ -0,0 +1,251 @@
+"""Benchmark alur pembelian bot tanpa jaringan.
+
+Setiap ukuran katalog dijalankan di proses terpisah dalam direktori sementara
+(products.json, shop.db, fsm.db baru), sehingga peak RSS tidak tercampur.
+Update sintetis dimasukkan lewat dp.feed_update dengan sesi bot tiruan yang
+hanya mencatat panggilan API. N pembeli berjalan bersamaan melewati
+/start -> product_ -> order_ -> qty_ -> bukti transfer -> verify_ (oleh admin).
+
+Contoh:
+    python benchmark.py
+    python benchmark.py --users 200 --accounts 10 1000 100000 --storage sqlite
+    python benchmark.py --max-p99 250   # exit code 1 jika p99 alur > 250 ms
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+ADMIN_ID = 1
+BOT_TOKEN = "123456789:BENCHMARK-TOKEN"
+STEPS = ("start", "product", "order", "quantity", "proof", "verify")
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def make_stub_session(main):
+    """Sesi aiogram tiruan: semua request langsung berhasil tanpa jaringan."""
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Message
+
+    class StubSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.calls = {}
+            self._message_ids = itertools.count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            name = method.__api_method__
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if name.startswith(("send", "edit", "copy", "forward")):
+                return Message.model_validate({
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": getattr(method, "chat_id", None) or ADMIN_ID, "type": "private"},
+                    "text": "ok"
+                }, context={"bot": bot})
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id}", "username": f"bench{user_id}"}
+
+    def message(self, user_id, text=None, **fields):
+        from aiogram.types import Update
+        message = {
+            "message_id": next(self._ids), "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id)
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        message.update(fields)
+        return Update.model_validate({"update_id": next(self._ids), "message": message}, context={"bot": self.bot})
+
+    def callback(self, user_id, data):
+        from aiogram.types import Update
+        return Update.model_validate({"update_id": next(self._ids), "callback_query": {
+            "id": str(next(self._ids)), "from": self._user(user_id), "chat_instance": "bench", "data": data,
+            "message": {"message_id": next(self._ids), "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"}, "text": "menu"}
+        }}, context={"bot": self.bot})
+
+async def seed_catalog(main, products, accounts):
+    """Buat produk dan bagi `accounts` akun secara merata ke semuanya."""
+    product_ids = []
+    for n in range(products):
+        product = main.store.add_product({
+            "name": f"Produk Bench {n + 1}",
+            "description": "Produk untuk benchmark",
+            "price": "Rp 10.000",
+            "stock": 0,
+            "file_id": None
+        })
+        product_ids.append(product["id"])
+    for n, product_id in enumerate(product_ids):
+        share = accounts // products + (1 if n < accounts % products else 0)
+        batch = [{"username": f"bench{product_id}_{i}", "password": "rahasia"} for i in range(share)]
+        if batch:
+            await main.inventory.add(product_id, batch)
+    return product_ids
+
+async def run_funnel(main, dp, bot, factory, user_id, product_id, quantity, latencies):
+    async def timed(step, update):
+        start = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies[step].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await timed("start", factory.message(user_id, "/start"))
+    await timed("product", factory.callback(user_id, f"product_{product_id}"))
+    await timed("order", factory.callback(user_id, f"order_{product_id}"))
+    await timed("quantity", factory.callback(user_id, f"qty_{product_id}_{quantity}"))
+    await timed("proof", factory.message(
+        user_id, photo=[{"file_id": f"AgACbench{user_id}", "file_unique_id": f"p{user_id}", "width": 1, "height": 1}]
+    ))
+    placed = main.orders.list_by_user(user_id, limit=1)
+    if placed:
+        await timed("verify", factory.callback(ADMIN_ID, f"verify_{placed[0]['code']}"))
+    latencies["funnel"].append(time.perf_counter() - start)
+
+async def worker(args):
+    os.chdir(tempfile.mkdtemp(prefix="bench-"))
+    with open("config.json", "w") as f:
+        json.dump({
+            "BOT_TOKEN": BOT_TOKEN, "ADMIN_ID": ADMIN_ID,
+            "STORAGE": args.storage, "METRICS_PORT": 0
+        }, f)
+    sys.path.insert(0, REPO_DIR)
+    import main
+    logging.disable(logging.WARNING)
+
+    stub = make_stub_session(main)
+    main.bot.session = stub
+    if args.rate_limit:
+        # Ikut menunggu token bucket seperti di produksi (pesan admin 1/detik!)
+        stub.middleware(main.outbox)
+    stub.middleware(main.ApiMetricsMiddleware())
+
+    seed_start = time.perf_counter()
+    product_ids = await seed_catalog(main, args.products, args.accounts)
+    seed_seconds = time.perf_counter() - seed_start
+
+    factory = UpdateFactory(main.bot)
+    latencies = {step: [] for step in STEPS + ("funnel",)}
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_funnel(
+            main, main.dp, main.bot, factory, 10_000 + n, product_ids[n % len(product_ids)], args.quantity, latencies
+        )
+        for n in range(args.users)
+    ))
+    elapsed = time.perf_counter() - start
+
+    flush_start = time.perf_counter()
+    await main.store.flush()
+    await main.credentials.flush()
+    flush_seconds = time.perf_counter() - flush_start
+
+    updates = sum(len(latencies[step]) for step in STEPS)
+    result = {
+        "accounts": args.accounts,
+        "users": args.users,
+        "storage": args.storage,
+        "seconds": elapsed,
+        "funnels_per_sec": args.users / elapsed if elapsed else 0.0,
+        "updates_per_sec": updates / elapsed if elapsed else 0.0,
+        "delivered": main.orders.count_by_status(main.ORDER_VERIFIED),
+        "seed_seconds": seed_seconds,
+        "flush_seconds": flush_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "api_calls": stub.calls,
+        "latency_ms": {
+            step: {"p50": percentile(values, 0.5) * 1000, "p99": percentile(values, 0.99) * 1000}
+            for step, values in latencies.items()
+        }
+    }
+    print(json.dumps(result))
+
+def run_size(args, accounts):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker",
+        "--accounts", str(accounts), "--users", str(args.users),
+        "--products", str(args.products), "--storage", args.storage, "--quantity", str(args.quantity)
+    ]
+    if args.rate_limit:
+        command.append("--rate-limit")
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"Benchmark gagal untuk {accounts} akun")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def print_report(results):
+    print(f"{'akun':>8} {'alur/dtk':>9} {'update/dtk':>10} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>7} {'terkirim':>8}")
+    for r in results:
+        funnel = r["latency_ms"]["funnel"]
+        print(
+            f"{r['accounts']:>8} {r['funnels_per_sec']:>9.1f} {r['updates_per_sec']:>10.1f} "
+            f"{funnel['p50']:>8.1f} {funnel['p99']:>8.1f} {r['peak_rss_mb']:>7.1f} {r['delivered']:>8}"
+        )
+    print()
+    print(f"{'akun':>8} " + " ".join(f"{step + ' p50/p99':>18}" for step in STEPS))
+    for r in results:
+        cells = (f"{r['latency_ms'][step]['p50']:.1f}/{r['latency_ms'][step]['p99']:.1f}" for step in STEPS)
+        print(f"{r['accounts']:>8} " + " ".join(f"{cell:>18}" for cell in cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark alur pembelian bot dengan sesi Bot API tiruan")
+    parser.add_argument("--users", type=int, default=100, help="jumlah pembeli bersamaan")
+    parser.add_argument("--accounts", type=int, nargs="+", default=[10, 1000, 100000], help="ukuran stok akun")
+    parser.add_argument("--products", type=int, default=10, help="jumlah produk di katalog")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--quantity", type=int, default=1, help="akun per order")
+    parser.add_argument("--rate-limit", action="store_true", help="lewatkan kiriman lewat antrean outbox")
+    parser.add_argument("--max-p99", type=float, help="gagal (exit 1) jika p99 alur melebihi nilai ini (ms)")
+    parser.add_argument("--json", action="store_true", help="cetak hasil mentah sebagai JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.accounts = args.accounts[0]
+        asyncio.run(worker(args))
+        return
+
+    results = [run_size(args, accounts) for accounts in args.accounts]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+    if args.max_p99 is not None:
+        slow = [r for r in results if r["latency_ms"]["funnel"]["p99"] > args.max_p99]
+        if slow:
+            print(f"\n❌ p99 melebihi {args.max_p99} ms untuk: {', '.join(str(r['accounts']) for r in slow)} akun")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,44 @@
+import bisect
+import codecs
+import contextvars
+import csv
+import fcntl
+import functools
+import gzip
+import hashlib
+import io
 import json
 import logging
 import os
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import CommandStart, Command
+import re
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from aiogram import BaseMiddleware, Bot, Dispatcher, types, F
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.enums import ParseMode
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import FSInputFile
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import BufferedInputFile, FSInputFile
+from aiogram.types.update import UpdateTypeLookupError
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 import asyncio
+import signal
 
 # === SETUP LOGGING ===
 logging.basicConfig(
@@ -25,65 +53,2879 @@ try:
         config = json.load(f)
     BOT_TOKEN = config["BOT_TOKEN"]
     ADMIN_ID = config["ADMIN_ID"]
+    # Admin tambahan: {"<user_id>": "owner" | "verifier"}; ADMIN_ID selalu owner
+    ADMINS = {int(user_id): role for user_id, role in config.get("ADMINS", {}).items()}
+    # Pembagian bukti transfer ke admin online: "least_pending" atau "round_robin"
+    PROOF_ROUTING = config.get("PROOF_ROUTING", "least_pending")
+    # "json" (default, products.json) atau "sqlite"
+    STORAGE_BACKEND = config.get("STORAGE", "json")
+    DATABASE_FILE = config.get("DATABASE_FILE", "shop.db")
+    # "polling" (default) atau "webhook"
+    BOT_MODE = config.get("MODE", "polling")
+    # URL publik tanpa path, mis. https://toko.example.com (kosong = webhook diatur manual)
+    WEBHOOK_URL = config.get("WEBHOOK_URL", "")
+    WEBHOOK_PATH = config.get("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = config.get("WEBHOOK_SECRET", "")
+    WEBHOOK_HOST = config.get("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT = int(config.get("WEBHOOK_PORT", os.environ.get("PORT", 8080)))
+    # Base URL Bot API alternatif (server lokal / endpoint Telegram palsu untuk tes)
+    API_SERVER = config.get("API_SERVER", "")
+    # State FSM (order/restock yang sedang berjalan) disimpan di sini agar tahan restart
+    FSM_DATABASE_FILE = config.get("FSM_DATABASE_FILE", "fsm.db")
+    # State yang tidak disentuh selama ini (detik) dianggap kedaluwarsa
+    FSM_STATE_TTL = int(config.get("FSM_STATE_TTL", 3 * 24 * 3600))
+    # Endpoint metrik Prometheus (GET /metrics); port 0 = nonaktif
+    METRICS_HOST = config.get("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(config.get("METRICS_PORT", 9100))
+    # Jumlah proses worker (butuh MODE webhook + STORAGE sqlite jika > 1)
+    WORKERS = max(1, int(config.get("WORKERS", 1)))
+    # Diisi oleh proses induk untuk tiap worker (1..WORKERS); 0 = proses tunggal/induk
+    WORKER_INDEX = int(os.environ.get("BOT_WORKER", 0))
+    # Mata uang default untuk harga tanpa simbol (kode ISO 4217)
+    CURRENCY = config.get("CURRENCY", "IDR").upper()
+    # Interval (detik) rekonsiliasi stok & cek peringatan, dan ambang stok menipis default
+    STOCK_CHECK_INTERVAL = float(config.get("STOCK_CHECK_INTERVAL", 30))
+    LOW_STOCK_THRESHOLD = int(config.get("LOW_STOCK_THRESHOLD", 5))
+    # Batas per user (token/detik dan burst) untuk pesan dan callback; rate 0 = tanpa batas
+    THROTTLE_MESSAGE_RATE = float(config.get("THROTTLE_MESSAGE_RATE", 1.0))
+    THROTTLE_MESSAGE_BURST = float(config.get("THROTTLE_MESSAGE_BURST", 5))
+    THROTTLE_CALLBACK_RATE = float(config.get("THROTTLE_CALLBACK_RATE", 2.0))
+    THROTTLE_CALLBACK_BURST = float(config.get("THROTTLE_CALLBACK_BURST", 8))
+    # Backup inkremental: folder, interval (detik, 0 = hanya lewat /backup) dan jumlah generasi disimpan
+    BACKUP_DIR = config.get("BACKUP_DIR", "backups")
+    BACKUP_INTERVAL = float(config.get("BACKUP_INTERVAL", 3600))
+    BACKUP_KEEP = max(1, int(config.get("BACKUP_KEEP", 24)))
 except Exception as e:
     logger.error(f"Gagal memuat config: {e}")
     exit()
 
+# === ADMIN ROLES ===
+ROLE_OWNER = "owner"        # semua perintah admin
+ROLE_VERIFIER = "verifier"  # hanya verifikasi/tolak bukti transfer, /antrian, /online, /offline
+ADMIN_ROLES = {ADMIN_ID: ROLE_OWNER}
+for _admin_id, _role in ADMINS.items():
+    if _role not in (ROLE_OWNER, ROLE_VERIFIER):
+        logger.error(f"Role admin {_admin_id} tidak dikenal: {_role}")
+        continue
+    ADMIN_ROLES.setdefault(_admin_id, _role)
+ADMIN_IDS = frozenset(ADMIN_ROLES)
+
+def is_admin(user_id, role=ROLE_OWNER):
+    """Cek akses admin (O(1)); owner lolos semua role, verifier hanya role=ROLE_VERIFIER."""
+    user_role = ADMIN_ROLES.get(user_id)
+    return user_role == ROLE_OWNER or (user_role is not None and user_role == role)
+
+# === BACKUP ===
+class BackupManager:
+    """Backup online state toko sebagai generasi inkremental terkompresi.
+
+    Satu generasi = manifest gen-*.json (nama file -> sha256); isi tiap file
+    disimpan sekali di objects/<sha256>.gz, sehingga file yang tidak berubah
+    sejak generasi sebelumnya tidak ditulis ulang. Snapshot tidak menahan
+    handler: katalog JSON disalin dari memori, database SQLite disalin lewat
+    backup API (mode WAL, penulis tetap jalan), dan hashing/kompresi
+    dikerjakan di thread executor. Hanya `keep` generasi terbaru disimpan.
+    """
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.keep = keep
+        self.stats = {"generations": 0, "objects_written": 0, "bytes_written": 0}
+        self._lock = None
+
+    def manifests(self):
+        """Path manifest dari yang terlama ke terbaru."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("gen-") and n.endswith(".json"))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def latest(self):
+        for path in reversed(self.manifests()):
+            try:
+                with open(path, "r") as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Manifest backup {path} rusak: {e}")
+        return None
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, f"{digest}.gz")
+
+    def _store_object(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.stats["objects_written"] += 1
+            self.stats["bytes_written"] += os.path.getsize(path)
+        return digest
+
+    def read_object(self, digest):
+        with gzip.open(self._object_path(digest), "rb") as f:
+            return f.read()
+
+    def _copy_sqlite(self, path):
+        """Salinan konsisten database SQLite (backup API) sebagai bytes."""
+        tmp_path = os.path.join(self.directory, f".snapshot-{os.getpid()}.db")
+        source = sqlite3.connect(path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        try:
+            with open(tmp_path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(tmp_path)
+
+    def _write_generation(self, items):
+        os.makedirs(self.objects_dir, exist_ok=True)
+        files = {}
+        for name, kind, payload in items:
+            if kind == "sqlite":
+                data = self._copy_sqlite(payload)
+            elif kind == "file":
+                path, size = payload
+                with open(path, "rb") as f:
+                    data = f.read(size)
+            else:
+                data = payload() if callable(payload) else payload
+            files[name] = {"sha256": self._store_object(data), "size": len(data)}
+        
+        created = time.time()
+        manifest = {"created": created, "files": files}
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(created))
+        path = os.path.join(self.directory, f"gen-{stamp}-{int(created * 1e6) % 1000000:06d}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(f"{path}.tmp", path)
+        self.stats["generations"] += 1
+        self._prune()
+        return manifest
+
+    def _prune(self):
+        manifests = self.manifests()
+        for path in manifests[:-self.keep]:
+            os.remove(path)
+        referenced = set()
+        for path in manifests[-self.keep:]:
+            with open(path, "r") as f:
+                referenced.update(entry["sha256"] for entry in json.load(f)["files"].values())
+        for name in os.listdir(self.objects_dir):
+            if name.endswith(".gz") and name[:-3] not in referenced:
+                os.remove(os.path.join(self.objects_dir, name))
+
+    def _items(self):
+        """Daftar sumber snapshot; bagian yang harus konsisten dengan memori diambil di sini (di event loop)."""
+        items = []
+        if STORAGE_BACKEND == "json":
+            snapshot = store.snapshot()
+            items.append((PRODUCTS_FILE, "bytes", lambda: json.dumps(snapshot, indent=4, ensure_ascii=False).encode()))
+        for path in (DATABASE_FILE, FSM_DATABASE_FILE):
+            if os.path.exists(path):
+                items.append((path, "sqlite", path))
+        for path in (SNK_FILE, TEMPLATES_FILE, CREDENTIAL_INDEX_FILE):
+            if os.path.exists(path):
+                # Ukuran dicatat sekarang: index kredensial append-only, sisanya ditulis atomik
+                items.append((path, "file", (path, os.path.getsize(path))))
+        return items
+
+    async def run(self):
+        """Ambil satu generasi baru; kembalikan manifest-nya."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await credentials.flush()
+            items = self._items()
+            with metrics.timer("bot_storage_seconds", op="backup"):
+                manifest = await asyncio.get_running_loop().run_in_executor(None, self._write_generation, items)
+            logger.info(f"Backup selesai: {len(manifest['files'])} file")
+            return manifest
+
+    def build_archive(self, manifest):
+        """ZIP berisi semua file satu generasi (untuk dikirim lewat /backup)."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, entry in manifest["files"].items():
+                archive.writestr(os.path.basename(name), self.read_object(entry["sha256"]))
+        return buffer.getvalue()
+
+    @staticmethod
+    def _intact(path, kind):
+        try:
+            if kind == "sqlite":
+                conn = sqlite3.connect(path)
+                try:
+                    return conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+                finally:
+                    conn.close()
+            with open(path, "r") as f:
+                json.load(f)
+            return True
+        except (sqlite3.DatabaseError, ValueError, UnicodeDecodeError):
+            return False
+
+    def ensure_intact(self, path, kind):
+        """Dipanggil sebelum file dibuka saat start: pulihkan dari generasi terbaru jika file rusak."""
+        if not os.path.exists(path) or self._intact(path, kind):
+            return False
+        for manifest_path in reversed(self.manifests()):
+            try:
+                with open(manifest_path, "r") as f:
+                    entry = json.load(f)["files"].get(path)
+                if entry is None:
+                    continue
+                data = self.read_object(entry["sha256"])
+            except Exception as e:
+                logger.error(f"Backup {manifest_path} tidak bisa dipakai: {e}")
+                continue
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            suffixes = ("", "-wal", "-shm") if kind == "sqlite" else ("",)
+            for suffix in suffixes:
+                if os.path.exists(path + suffix):
+                    os.replace(path + suffix, f"{path}{suffix}.corrupt-{stamp}")
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f"{path}.tmp", path)
+            logger.error(
+                f"{path} rusak; dipulihkan dari {os.path.basename(manifest_path)}, "
+                f"file rusak disimpan sebagai {path}.corrupt-{stamp}"
+            )
+            return True
+        logger.error(f"{path} rusak dan tidak ada backup yang bisa dipakai")
+        return False
+
+backups = BackupManager(BACKUP_DIR, BACKUP_KEEP)
+
+# === FSM STORAGE ===
+class SQLiteStorage(BaseStorage):
+    """Storage FSM aiogram di SQLite dengan cache di memori.
+
+    Semua state dibaca sekali saat start; baca berikutnya langsung dari
+    memori, sedangkan setiap perubahan ditulis langsung (write-through)
+    sehingga state pembeli tidak hilang saat deploy atau crash. State yang
+    tidak disentuh lebih lama dari TTL dianggap kosong dan dibersihkan.
+    Dengan shared=True (beberapa worker) cache dimatikan dan setiap baca
+    langsung ke database, karena update user yang sama bisa ditangani
+    proses yang berbeda.
+    """
+
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, path, ttl=FSM_STATE_TTL, shared=False):
+        self.ttl = ttl
+        self.shared = shared
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._cache = {}
+        self._purged_at = 0
+        self.purge_expired()
+        if not shared:
+            for key, state, data, updated_at in self.conn.execute("SELECT key, state, data, updated_at FROM fsm"):
+                self._cache[key] = [state, json.loads(data), updated_at]
+
+    @staticmethod
+    def _key(key: StorageKey):
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _entry(self, key):
+        if self.shared:
+            row = self.conn.execute("SELECT state, data, updated_at FROM fsm WHERE key = ?", (key,)).fetchone()
+            entry = [row[0], json.loads(row[1]), row[2]] if row else None
+        else:
+            entry = self._cache.get(key)
+        if entry is not None and time.time() - entry[2] > self.ttl:
+            self._cache.pop(key, None)
+            self.conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            return None
+        return entry
+
+    def _save(self, key, state, data):
+        now = time.time()
+        if state is None and not data:
+            self._cache.pop(key, None)
+            self.conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+        else:
+            if not self.shared:
+                self._cache[key] = [state, data, now]
+            self.conn.execute(
+                "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                (key, state, json.dumps(data, ensure_ascii=False), now)
+            )
+        if now - self._purged_at > self.PURGE_INTERVAL:
+            self.purge_expired()
+
+    def purge_expired(self):
+        self._purged_at = time.time()
+        cutoff = self._purged_at - self.ttl
+        self.conn.execute("DELETE FROM fsm WHERE updated_at < ?", (cutoff,))
+        for key in [k for k, entry in self._cache.items() if entry[2] < cutoff]:
+            del self._cache[key]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self._key(key)
+        entry = self._entry(key)
+        state = state.state if isinstance(state, State) else state
+        self._save(key, state, entry[1] if entry else {})
+
+    async def get_state(self, key: StorageKey):
+        entry = self._entry(self._key(key))
+        return entry[0] if entry else None
+
+    async def set_data(self, key: StorageKey, data):
+        key = self._key(key)
+        entry = self._entry(key)
+        self._save(key, entry[0] if entry else None, dict(data))
+
+    async def get_data(self, key: StorageKey):
+        entry = self._entry(self._key(key))
+        return dict(entry[1]) if entry else {}
+
+    async def close(self) -> None:
+        self.conn.close()
+
 # === SETUP BOT ===
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = MemoryStorage()
+session = AiohttpSession(api=TelegramAPIServer.from_base(API_SERVER)) if API_SERVER else None
+bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+backups.ensure_intact(FSM_DATABASE_FILE, "sqlite")
+storage = SQLiteStorage(FSM_DATABASE_FILE, shared=WORKERS > 1)
 dp = Dispatcher(storage=storage)
 
-# === STATE CLASSES ===
-class AddProductState(StatesGroup):
-    waiting_for_name = State()
-    waiting_for_description = State()
-    waiting_for_price = State()
-    waiting_for_stock = State()
-    waiting_for_file = State()
+# === METRICS ===
+# Batas bucket histogram latensi (detik)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Histogram bucket tetap ala Prometheus; kuantil diperkirakan dari bucket."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """Counter, histogram dan gauge di memori, dirender dalam format teks Prometheus."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.descriptions = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, kind, text):
+        self.descriptions[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, collect):
+        """Daftarkan gauge; collect() mengembalikan list (labels dict, nilai) saat di-scrape."""
+        self.gauges[name] = collect
+
+    def counter(self, name, collect):
+        """Seperti gauge(), untuk nilai yang hanya naik (stats objek lain); di-render sebagai counter."""
+        self.gauges[name] = collect
+        self.descriptions.setdefault(name, ("counter", ""))
+
+    def histograms_of(self, name):
+        return {labels: h for (n, labels), h in self.histograms.items() if n == name}
+
+    def counters_of(self, name):
+        return {labels: v for (n, labels), v in self.counters.items() if n == name}
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{key}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def _header(self, lines, name, kind):
+        described_kind, text = self.descriptions.get(name, (kind, ""))
+        if text:
+            lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {described_kind}")
+
+    def render(self):
+        lines = []
+        counters = {}
+        for (name, labels), value in self.counters.items():
+            counters.setdefault(name, []).append((labels, value))
+        for name in sorted(counters):
+            self._header(lines, name, "counter")
+            for labels, value in sorted(counters[name]):
+                lines.append(f"{name}{self._labels(labels)} {value}")
+        histograms = {}
+        for (name, labels), histogram in self.histograms.items():
+            histograms.setdefault(name, []).append((labels, histogram))
+        for name in sorted(histograms):
+            self._header(lines, name, "histogram")
+            for labels, histogram in sorted(histograms[name], key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        for name in sorted(self.gauges):
+            try:
+                samples = self.gauges[name]()
+            except Exception as e:
+                logger.error(f"Error collecting metric {name}: {e}")
+                continue
+            self._header(lines, name, "gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{self._labels(sorted(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe("bot_updates_total", "counter", "Update Telegram yang diterima per tipe")
+metrics.describe("bot_update_errors_total", "counter", "Update yang gagal diproses per tipe")
+metrics.describe("bot_update_seconds", "histogram", "Lama pemrosesan satu update")
+metrics.describe("bot_handler_seconds", "histogram", "Latensi per handler")
+metrics.describe("bot_handler_errors_total", "counter", "Exception yang lolos dari handler")
+metrics.describe("bot_storage_seconds", "histogram", "Waktu baca/tulis penyimpanan produk per operasi")
+metrics.describe("bot_api_seconds", "histogram", "Latensi panggilan Bot API per method (tanpa antre)")
+metrics.describe("bot_api_errors_total", "counter", "Panggilan Bot API yang gagal per method")
+
+# === STATE CLASSES ===
+class AddProductState(StatesGroup):
+    waiting_for_name = State()
+    waiting_for_description = State()
+    waiting_for_price = State()
+    waiting_for_stock = State()
+    waiting_for_file = State()
+
+class OrderState(StatesGroup):
+    waiting_for_quantity = State()
+    waiting_for_payment = State()
+
+class RestockState(StatesGroup):
+    input_accounts = State()
+
+class CatalogImportState(StatesGroup):
+    waiting_for_file = State()
+
+class SnkState(StatesGroup):
+    waiting_for_text = State()
+
+# === UTILITY FUNCTIONS ===
+PRODUCTS_FILE = "products.json"
+# Seberapa sering (detik) cache memeriksa mtime/size products.json
+CATALOG_CHECK_INTERVAL = 5.0
+# Jeda (detik) sebelum perubahan ditulis; mutasi beruntun digabung jadi satu tulisan
+SAVE_DELAY = 1.0
+# Batas unduh file Bot API dan jeda minimal antar update progres restock
+MAX_DOWNLOAD_SIZE = 20 * 1024 * 1024
+RESTOCK_PROGRESS_INTERVAL = 2.0
+# Akun dari file restock disimpan per batch ini agar memori tidak ikut membesar dengan ukuran file
+RESTOCK_BATCH_SIZE = 5000
+CREDENTIAL_INDEX_FILE = "credentials.idx"
+# Teks SNK dan override template pesan; dicek perubahan file paling sering tiap interval ini
+SNK_FILE = "snk.txt"
+TEMPLATES_FILE = "templates.json"
+TEMPLATE_CHECK_INTERVAL = 5.0
+# Jumlah produk per halaman etalase /start dan order per halaman /antrian
+STOREFRONT_PAGE_SIZE = 20
+ORDER_PAGE_SIZE = 10
+# Akun per halaman di browser /hapusakun
+ACCOUNT_PAGE_SIZE = 10
+# Hasil inline search per halaman (maks. 50 dari Telegram) dan cache hasil di sisi Telegram (detik)
+INLINE_PAGE_SIZE = 20
+INLINE_CACHE_TIME = 30
+# Verifikasi massal: pengiriman paralel maksimal dan baris detail di laporan
+BULK_DELIVERY_CONCURRENCY = 10
+BULK_REPORT_LIMIT = 20
+# Jumlah akun maksimal per order; di atas INLINE_DELIVERY_LIMIT akun dikirim sebagai file CSV
+MAX_ORDER_QUANTITY = 1000
+INLINE_DELIVERY_LIMIT = 5
+# Batas ukuran dokumen yang boleh dikirim bot lewat Bot API (/ekspor, /backup)
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+ORDER_QUANTITY_PRESETS = (1, 2, 5, 10)
+# Batas waktu (detik) menunggu update yang sedang diproses saat webhook dimatikan
+WEBHOOK_DRAIN_TIMEOUT = 30
+# Batas kirim Bot API: pesan/detik untuk semua chat dan per chat pribadi
+RATE_LIMIT_GLOBAL = 30
+RATE_LIMIT_CHAT = 1.0
+RATE_LIMITED_METHODS = {
+    "sendMessage", "sendPhoto", "sendDocument", "sendVideo", "sendAnimation", "sendAudio",
+    "sendVoice", "sendSticker", "sendMediaGroup", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageCaption", "editMessageReplyMarkup",
+}
+
+class ProductCatalog:
+    """Cache katalog produk di memori dengan index id -> produk.
+
+    version naik di setiap perubahan; search_version hanya jika nama atau
+    deskripsi mungkin berubah (bukan perubahan stok), sehingga index
+    pencarian tidak perlu dicek ulang setiap ada penjualan.
+    """
+
+    SEARCH_FIELDS = ("id", "name", "description")
+
+    def __init__(self):
+        self.version = 0
+        self.search_version = 0
+        self.products = []
+        self._index = {}
+        self._available = []
+
+    def replace(self, products, search_changed=True):
+        self.products = products
+        self._index = {p["id"]: p for p in products}
+        self._available = [p for p in products if p.get("stock", 0) > 0]
+        self.version += 1
+        if search_changed:
+            self.search_version += 1
+
+    def same_search_fields(self, products):
+        """True jika products berisi produk dengan nama/deskripsi yang sama persis dengan cache."""
+        return len(products) == len(self.products) and all(
+            old.get(field) == new.get(field)
+            for old, new in zip(self.products, products)
+            for field in self.SEARCH_FIELDS
+        )
+
+    def available(self):
+        return self._available
+
+    def get(self, product_id):
+        return self._index.get(product_id)
+
+class ProductStore(ABC):
+    """Antarmuka backend penyimpanan produk & akun.
+
+    Handler tidak boleh menyentuh product["accounts"] langsung; semua operasi
+    akun lewat method di bawah agar backend bisa menyimpannya per baris.
+    Produk yang dikembalikan adalah cache bersama; setelah mengubah field
+    produk panggil update_product()/save_products(). Id produk yang berubah
+    dicatat di self.changed sampai diambil dengan pop_changed().
+    """
+
+    def __init__(self):
+        self.changed = set()
+
+    def pop_changed(self):
+        """Ambil (dan kosongkan) id produk yang berubah sejak panggilan terakhir."""
+        changed, self.changed = self.changed, set()
+        return changed
+
+    @abstractmethod
+    def all_products(self):
+        ...
+
+    @abstractmethod
+    def available_products(self):
+        ...
+
+    @abstractmethod
+    def get_product(self, product_id):
+        ...
+
+    @abstractmethod
+    def save_products(self, products):
+        ...
+
+    @abstractmethod
+    def add_product(self, product):
+        ...
+
+    @abstractmethod
+    def update_product(self, product):
+        ...
+
+    @abstractmethod
+    def count_accounts(self, product_id):
+        ...
+
+    @abstractmethod
+    def page_accounts(self, product_id, limit, after_id=None, before_id=None):
+        """Maks. `limit` akun (urut id) setelah after_id atau sebelum before_id."""
+
+    @abstractmethod
+    def account_id_span(self, product_id, start, stop):
+        """(id pertama, id terakhir) akun di posisi antrean [start, stop), atau None."""
+
+    @abstractmethod
+    def iter_accounts(self, product_id):
+        ...
+
+    @abstractmethod
+    def add_accounts(self, product_id, accounts):
+        ...
+
+    @abstractmethod
+    def take_accounts(self, product_id, count):
+        ...
+
+    @abstractmethod
+    def delete_accounts(self, product_id, first_id=None, last_id=None, prefix=None):
+        """Hapus akun dengan first_id <= id <= last_id (dan username berawalan prefix).
+
+        Batas None berarti terbuka. Satu operasi store; kembalikan akun yang dihapus.
+        """
+
+    @abstractmethod
+    def clear_accounts(self, product_id):
+        ...
+
+    async def flush(self):
+        """Tulis semua perubahan yang masih tertunda (dipanggil saat shutdown)."""
+
+class WriteBehindWriter:
+    """Penulis file di belakang layar untuk JsonProductStore.
+
+    schedule() hanya menandai data kotor; setelah SAVE_DELAY detik snapshot
+    diambil di event loop lalu diserialisasi dan ditulis di thread executor
+    (file sementara + os.replace), sehingga handler tidak ikut menunggu.
+    Tanpa event loop yang berjalan, penulisan dilakukan langsung.
+    """
+
+    def __init__(self, path, snapshot, delay=SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self._snapshot = snapshot
+        self._dirty = False
+        self._task = None
+        self._lock = None
+        self.on_written = None
+
+    @property
+    def pending(self):
+        return self._dirty or (self._lock is not None and self._lock.locked())
+
+    def schedule(self):
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._dirty = False
+            self._write(self._snapshot())
+            self._written()
+            return
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.delay)
+        await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._dirty:
+                self._dirty = False
+                data = self._snapshot()
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+                except Exception as e:
+                    # Biarkan tetap kotor; mutasi berikutnya akan mencoba lagi
+                    logger.error(f"Error saving products: {e}")
+                    self._dirty = True
+                    return
+                self._written()
+
+    def _write(self, data):
+        tmp_path = f"{self.path}.tmp"
+        with metrics.timer("bot_storage_seconds", op="json_write"):
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    def _written(self):
+        if self.on_written:
+            self.on_written()
+
+class AccountPool:
+    """Antrean akun satu produk: list + pointer kepala.
+
+    take() hanya menggeser pointer (tanpa pop(0) yang O(n)); bagian yang
+    sudah terjual dibuang sekaligus saat sudah lebih dari separuh list.
+    Setiap akun punya account["id"] yang naik terus (next_id ikut disimpan),
+    sehingga list _ids selalu urut dan halaman/rentang dicari dengan bisect.
+    """
+
+    COMPACT_THRESHOLD = 1024
+
+    def __init__(self, accounts=None, next_id=None):
+        self._items = list(accounts or [])
+        self._head = 0
+        self.next_id = max(next_id or 1, max((a.get("id", 0) for a in self._items), default=0) + 1)
+        if any("id" not in a for a in self._items):
+            # Data lama tanpa id: beri nomor ulang sesuai urutan antrean
+            for account in self._items:
+                account["id"] = self.next_id
+                self.next_id += 1
+        self._ids = [a["id"] for a in self._items]
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def extend(self, accounts):
+        for account in accounts:
+            account["id"] = self.next_id
+            self.next_id += 1
+            self._ids.append(account["id"])
+        self._items.extend(accounts)
+
+    def take(self, count):
+        if count <= 0 or len(self) < count:
+            return []
+        taken = self._items[self._head:self._head + count]
+        self._head += count
+        if self._head >= self.COMPACT_THRESHOLD and self._head * 2 >= len(self._items):
+            del self._items[:self._head]
+            del self._ids[:self._head]
+            self._head = 0
+        return taken
+
+    def page(self, limit, after_id=None, before_id=None):
+        if before_id is not None:
+            stop = bisect.bisect_left(self._ids, before_id, self._head)
+            return self._items[max(self._head, stop - limit):stop]
+        start = self._head if after_id is None else bisect.bisect_right(self._ids, after_id, self._head)
+        return self._items[start:start + limit]
+
+    def id_span(self, start, stop):
+        stop = min(stop, len(self))
+        if not 0 <= start < stop:
+            return None
+        return self._ids[self._head + start], self._ids[self._head + stop - 1]
+
+    def delete(self, first_id=None, last_id=None, prefix=None):
+        lo = self._head if first_id is None else bisect.bisect_left(self._ids, first_id, self._head)
+        hi = len(self._ids) if last_id is None else bisect.bisect_right(self._ids, last_id, lo)
+        if prefix is None:
+            removed, kept = self._items[lo:hi], []
+        else:
+            removed, kept = [], []
+            for account in self._items[lo:hi]:
+                (removed if account["username"].startswith(prefix) else kept).append(account)
+        if removed:
+            self._items[lo:hi] = kept
+            self._ids[lo:hi] = [a["id"] for a in kept]
+        return removed
+
+    def clear(self):
+        count = len(self)
+        self._items = []
+        self._ids = []
+        self._head = 0
+        return count
+
+    def snapshot(self):
+        return self._items[self._head:]
+
+class JsonProductStore(ProductStore):
+    """Backend default: seluruh toko disimpan di satu file products.json.
+
+    Data dibaca dari disk hanya jika mtime/size file berubah (dicek paling
+    sering tiap CATALOG_CHECK_INTERVAL detik) atau setelah bot menulis sendiri.
+    Di memori akun tiap produk dipisah ke AccountPool dan digabung lagi saat
+    file ditulis.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.catalog = ProductCatalog()
+        self._pools = {}
+        self._signature = None
+        self._checked_at = None
+        self.writer = WriteBehindWriter(path, self._serialize)
+        self.writer.on_written = self._on_written
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _serialize(self):
+        # Salinan dangkal: aman diserialisasi di thread lain selama loop terus berjalan
+        return [
+            dict(p, accounts=pool.snapshot(), next_account_id=pool.next_id)
+            for p, pool in ((p, self._pools[p["id"]]) for p in self.catalog.products)
+        ]
+
+    def _on_written(self):
+        # Tulisan bot sendiri: cache tetap dipakai tanpa membaca ulang
+        self._signature = self._stat()
+        self._checked_at = time.monotonic()
+
+    def _adopt(self, products, search_changed=True):
+        # Pindahkan product["accounts"] (jika ada) ke pool masing-masing
+        for product in products:
+            if "accounts" in product:
+                self._pools[product["id"]] = AccountPool(product.pop("accounts"), product.pop("next_account_id", None))
+            else:
+                self._pools.setdefault(product["id"], AccountPool())
+        self.catalog.replace(products, search_changed)
+
+    def _reload(self):
+        if not os.path.exists(self.path):
+            with open(self.path, "w") as f:
+                json.dump([], f)
+        with metrics.timer("bot_storage_seconds", op="json_load"), open(self.path, "r") as f:
+            products = json.load(f)
+        self._signature = self._stat()
+        self._pools = {}
+        self._adopt(products)
+        # File diubah dari luar: anggap semua produk berubah
+        self.changed.update(p["id"] for p in products)
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < CATALOG_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self.writer.pending:
+            # Data di memori lebih baru dari file; jangan ditimpa
+            return
+        try:
+            if self._signature is None or not os.path.exists(self.path) or self._stat() != self._signature:
+                self._reload()
+        except Exception as e:
+            logger.error(f"Error loading products: {e}")
+
+    def _pool(self, product_id):
+        self._ensure_fresh()
+        return self._pools.setdefault(product_id, AccountPool())
+
+    def all_products(self):
+        self._ensure_fresh()
+        return self.catalog.products
+
+    def available_products(self):
+        self._ensure_fresh()
+        return self.catalog.available()
+
+    def get_product(self, product_id):
+        self._ensure_fresh()
+        return self.catalog.get(product_id)
+
+    def _save(self, products, search_changed=True):
+        self._adopt(products, search_changed)
+        self.writer.schedule()
+
+    def save_products(self, products):
+        self.changed.update(p["id"] for p in products)
+        self._save(products)
+
+    async def flush(self):
+        await self.writer.flush()
+
+    def snapshot(self):
+        """Salinan seluruh toko (format products.json) untuk backup."""
+        # Setelah restart katalog belum tentu sudah dimuat
+        self._ensure_fresh()
+        return self._serialize()
+
+    def add_product(self, product):
+        products = self.all_products()
+        product["id"] = max([p['id'] for p in products], default=0) + 1
+        products.append(product)
+        self.changed.add(product["id"])
+        self._save(products)
+        return product
+
+    def update_product(self, product):
+        self.changed.add(product["id"])
+        self._save(self.all_products())
+
+    def _sync_stock(self, product_id):
+        product = self.get_product(product_id)
+        if product is not None:
+            product["stock"] = len(self._pool(product_id))
+        self.changed.add(product_id)
+        self._save(self.all_products(), search_changed=False)
+
+    def count_accounts(self, product_id):
+        return len(self._pool(product_id))
+
+    def page_accounts(self, product_id, limit, after_id=None, before_id=None):
+        return self._pool(product_id).page(limit, after_id, before_id)
+
+    def account_id_span(self, product_id, start, stop):
+        return self._pool(product_id).id_span(start, stop)
+
+    def iter_accounts(self, product_id):
+        return iter(self._pool(product_id).snapshot())
+
+    def add_accounts(self, product_id, accounts):
+        pool = self._pool(product_id)
+        pool.extend(accounts)
+        self._sync_stock(product_id)
+        return len(pool)
+
+    def take_accounts(self, product_id, count):
+        taken = self._pool(product_id).take(count)
+        if taken:
+            self._sync_stock(product_id)
+        return taken
+
+    def delete_accounts(self, product_id, first_id=None, last_id=None, prefix=None):
+        removed = self._pool(product_id).delete(first_id, last_id, prefix)
+        if removed:
+            self._sync_stock(product_id)
+        return removed
+
+    def clear_accounts(self, product_id):
+        count = self._pool(product_id).clear()
+        self._sync_stock(product_id)
+        return count
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    price TEXT,
+    stock INTEGER NOT NULL DEFAULT 0,
+    file_id TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL
+);
+-- Urutan dispense = urutan id di dalam satu produk
+CREATE INDEX IF NOT EXISTS idx_accounts_product ON accounts(product_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class SqliteProductStore(ProductStore):
+    """Backend SQLite (mode WAL): produk & akun di tabel terpisah.
+
+    Metadata produk dan jumlah akun per produk di-cache di memori, sehingga
+    verifikasi order hanya menyentuh baris akun yang diambil. Setiap tulisan
+    menaikkan meta catalog_version; proses lain yang memakai file yang sama
+    melihat PRAGMA data_version berubah, lalu memuat ulang cache jika versi
+    katalog ikut berubah. Transaksi tulis selalu dimulai dengan cache segar.
+    """
+
+    PRODUCT_COLUMNS = ("id", "name", "description", "price", "stock", "file_id")
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('catalog_version', 0)")
+        self.catalog = ProductCatalog()
+        self._counts = {}
+        self._version = None
+        self._data_version = None
+        self._refresh()
+
+    @contextmanager
+    def _transaction(self):
+        with metrics.timer("bot_storage_seconds", op="sqlite_write"):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._sync()
+                yield self.conn
+                self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            self._version += 1
+
+    def _catalog_version(self):
+        return int(self.conn.execute("SELECT value FROM meta WHERE key = 'catalog_version'").fetchone()[0])
+
+    def _sync(self):
+        """Muat ulang cache jika proses lain mengubah katalog sejak dicek terakhir."""
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        if self._catalog_version() != self._version:
+            self._refresh()
+
+    def _product_from_row(self, row):
+        product = {key: row[key] for key in self.PRODUCT_COLUMNS}
+        if row["extra"]:
+            product.update(json.loads(row["extra"]))
+        return product
+
+    def _product_params(self, product):
+        extra = {
+            k: v for k, v in product.items()
+            if k not in self.PRODUCT_COLUMNS and k not in ("accounts", "next_account_id")
+        }
+        return (
+            product["id"], product["name"], product.get("description"), product.get("price"),
+            product.get("stock", 0), product.get("file_id"),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    def _upsert_product(self, conn, product):
+        conn.execute(
+            "INSERT INTO products (id, name, description, price, stock, file_id, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET name = excluded.name, description = excluded.description, "
+            "price = excluded.price, stock = excluded.stock, file_id = excluded.file_id, extra = excluded.extra",
+            self._product_params(product)
+        )
+
+    def _refresh(self):
+        self._version = self._catalog_version()
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        rows = self.conn.execute("SELECT * FROM products ORDER BY id").fetchall()
+        self._counts = {
+            row[0]: row[1]
+            for row in self.conn.execute("SELECT product_id, COUNT(*) FROM accounts GROUP BY product_id")
+        }
+        products = [self._product_from_row(row) for row in rows]
+        # Tulisan proses lain yang hanya mengubah stok tidak perlu mengindeks ulang pencarian
+        self.catalog.replace(products, not self.catalog.same_search_fields(products))
+        # Dimuat ulang (start atau tulisan proses lain): anggap semua produk berubah
+        self.changed.update(row["id"] for row in rows)
+
+    def migrate_from_json(self, json_path):
+        """Impor satu kali isi products.json ke database (jika belum pernah)."""
+        done = self.conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done or not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r") as f:
+            products = json.load(f)
+        with self._transaction() as conn:
+            for product in products:
+                self._upsert_product(conn, product)
+                conn.executemany(
+                    "INSERT INTO accounts (product_id, username, password) VALUES (?, ?, ?)",
+                    ((product["id"], a["username"], a["password"]) for a in product.get("accounts", []))
+                )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (json_path,))
+        self._refresh()
+        logger.info(f"Migrasi {len(products)} produk dari {json_path} ke {self.path} selesai")
+        return len(products)
+
+    def all_products(self):
+        self._sync()
+        return self.catalog.products
+
+    def available_products(self):
+        self._sync()
+        return self.catalog.available()
+
+    def get_product(self, product_id):
+        self._sync()
+        return self.catalog.get(product_id)
+
+    def save_products(self, products):
+        with self._transaction() as conn:
+            for product in products:
+                self._upsert_product(conn, product)
+        self.catalog.replace(products)
+        self.changed.update(p["id"] for p in products)
+
+    def add_product(self, product):
+        with self._transaction() as conn:
+            product["id"] = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM products").fetchone()[0]
+            self._upsert_product(conn, product)
+        self.catalog.replace(self.catalog.products + [product])
+        self.changed.add(product["id"])
+        return product
+
+    def update_product(self, product):
+        with self._transaction() as conn:
+            self._upsert_product(conn, product)
+        self.catalog.replace(self.catalog.products)
+        self.changed.add(product["id"])
+
+    def _set_stock(self, conn, product_id, count):
+        self._counts[product_id] = count
+        conn.execute("UPDATE products SET stock = ? WHERE id = ?", (count, product_id))
+
+    def _after_stock_change(self, product_id):
+        product = self.catalog.get(product_id)
+        if product is not None:
+            product["stock"] = self._counts.get(product_id, 0)
+        self.catalog.replace(self.catalog.products, search_changed=False)
+        self.changed.add(product_id)
+
+    def count_accounts(self, product_id):
+        self._sync()
+        return self._counts.get(product_id, 0)
+
+    def page_accounts(self, product_id, limit, after_id=None, before_id=None):
+        if before_id is not None:
+            rows = self.conn.execute(
+                "SELECT id, username, password FROM accounts WHERE product_id = ? AND id < ? "
+                "ORDER BY id DESC LIMIT ?",
+                (product_id, before_id, limit)
+            ).fetchall()[::-1]
+        else:
+            rows = self.conn.execute(
+                "SELECT id, username, password FROM accounts WHERE product_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (product_id, after_id or 0, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def account_id_span(self, product_id, start, stop):
+        if not 0 <= start < stop:
+            return None
+        ids = [
+            row[0] for row in self.conn.execute(
+                "SELECT id FROM accounts WHERE product_id = ? ORDER BY id LIMIT ? OFFSET ?",
+                (product_id, stop - start, start)
+            )
+        ]
+        return (ids[0], ids[-1]) if ids else None
+
+    def iter_accounts(self, product_id):
+        rows = self.conn.execute(
+            "SELECT username, password FROM accounts WHERE product_id = ? ORDER BY id", (product_id,)
+        )
+        for row in rows:
+            yield {"username": row["username"], "password": row["password"]}
+
+    def add_accounts(self, product_id, accounts):
+        with self._transaction() as conn:
+            cur = conn.executemany(
+                "INSERT INTO accounts (product_id, username, password) VALUES (?, ?, ?)",
+                ((product_id, a["username"], a["password"]) for a in accounts)
+            )
+            self._set_stock(conn, product_id, self.count_accounts(product_id) + cur.rowcount)
+        self._after_stock_change(product_id)
+        return self.count_accounts(product_id)
+
+    def take_accounts(self, product_id, count):
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, username, password FROM accounts WHERE product_id = ? ORDER BY id LIMIT ?",
+                (product_id, count)
+            ).fetchall()
+            if len(rows) < count:
+                return []
+            conn.execute(
+                "DELETE FROM accounts WHERE product_id = ? AND id <= ?",
+                (product_id, rows[-1]["id"])
+            )
+            self._set_stock(conn, product_id, self.count_accounts(product_id) - count)
+        self._after_stock_change(product_id)
+        return [{"username": row["username"], "password": row["password"]} for row in rows]
+
+    def delete_accounts(self, product_id, first_id=None, last_id=None, prefix=None):
+        where = "product_id = ? AND id BETWEEN ? AND ?"
+        params = [product_id, first_id or 0, last_id if last_id is not None else sys.maxsize]
+        if prefix is not None:
+            # substr, bukan LIKE: peka huruf besar/kecil dan tanpa wildcard
+            where += " AND substr(username, 1, ?) = ?"
+            params += [len(prefix), prefix]
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"DELETE FROM accounts WHERE {where} RETURNING id, username, password", params
+            ).fetchall()
+            if rows:
+                self._set_stock(conn, product_id, self.count_accounts(product_id) - len(rows))
+        if rows:
+            self._after_stock_change(product_id)
+        return sorted((dict(row) for row in rows), key=lambda a: a["id"])
+
+    def clear_accounts(self, product_id):
+        with self._transaction() as conn:
+            count = self._counts.get(product_id, 0)
+            conn.execute("DELETE FROM accounts WHERE product_id = ?", (product_id,))
+            self._set_stock(conn, product_id, 0)
+        self._after_stock_change(product_id)
+        return count
+
+def create_store():
+    if STORAGE_BACKEND == "sqlite":
+        sqlite_store = SqliteProductStore(DATABASE_FILE)
+        sqlite_store.migrate_from_json(PRODUCTS_FILE)
+        return sqlite_store
+    return JsonProductStore(PRODUCTS_FILE)
+
+backups.ensure_intact(DATABASE_FILE, "sqlite")
+if STORAGE_BACKEND == "json":
+    backups.ensure_intact(PRODUCTS_FILE, "json")
+store = create_store()
+
+class CredentialIndex:
+    """Index hash semua kredensial yang sedang di-stok atau sudah terjual.
+
+    Setiap akun diwakili digest blake2b 16 byte dari username+password,
+    sehingga cek duplikat saat restock O(1) per baris. Index disimpan
+    sebagai log append-only (digest + 1 byte status); record terakhir untuk
+    sebuah digest yang berlaku, dan log dipadatkan ulang jika terlalu
+    banyak record usang.
+    """
+
+    REMOVED = 0
+    IN_STOCK = 1
+    SOLD = 2
+    RECORD_SIZE = 17
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._pending = bytearray()
+        self._records = 0
+        self._task = None
+        self._lock = None
+        self.loaded = os.path.exists(path)
+        if self.loaded:
+            self._load()
+
+    @staticmethod
+    def digest(account):
+        key = f"{account['username']}\0{account['password']}".encode()
+        return hashlib.blake2b(key, digest_size=16).digest()
+
+    def _load(self):
+        size = os.path.getsize(self.path)
+        if size % self.RECORD_SIZE:
+            # Record terakhir terpotong (crash saat menulis): buang
+            with open(self.path, "r+b") as f:
+                f.truncate(size - size % self.RECORD_SIZE)
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(self.RECORD_SIZE * 4096)
+                if not chunk:
+                    break
+                for i in range(0, len(chunk), self.RECORD_SIZE):
+                    digest = chunk[i:i + 16]
+                    if chunk[i + 16] == self.REMOVED:
+                        self._entries.pop(digest, None)
+                    else:
+                        self._entries[digest] = chunk[i + 16]
+                    self._records += 1
+
+    def rebuild(self, store):
+        """Bangun index pertama kali dari semua akun yang sedang di-stok."""
+        for product in store.all_products():
+            self.mark(store.iter_accounts(product["id"]), self.IN_STOCK)
+        self.loaded = True
+        logger.info(f"Index kredensial dibuat: {len(self)} akun")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _statuses(self, digests):
+        return self._entries
+
+    def classify(self, accounts):
+        """Pisahkan akun baru dari duplikat (di stok, terjual, atau ganda di batch)."""
+        accounts = list(accounts)
+        digests = [self.digest(account) for account in accounts]
+        statuses = self._statuses(digests)
+        fresh = []
+        report = {"added": 0, "in_stock": 0, "sold": 0, "in_batch": 0}
+        seen = set()
+        for account, digest in zip(accounts, digests):
+            status = statuses.get(digest)
+            if status == self.IN_STOCK:
+                report["in_stock"] += 1
+            elif status == self.SOLD:
+                report["sold"] += 1
+            elif digest in seen:
+                report["in_batch"] += 1
+            else:
+                seen.add(digest)
+                fresh.append(account)
+        report["added"] = len(fresh)
+        return fresh, report
+
+    def mark(self, accounts, status):
+        for account in accounts:
+            digest = self.digest(account)
+            if status == self.REMOVED:
+                self._entries.pop(digest, None)
+            else:
+                self._entries[digest] = status
+            self._pending += digest + bytes([status])
+        self._schedule()
+
+    def _schedule(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(*self._take_pending())
+            return
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(SAVE_DELAY)
+        await self.flush()
+
+    def _take_pending(self):
+        self._records += len(self._pending) // self.RECORD_SIZE
+        if self._records > 2 * len(self._entries) + 100000:
+            # Terlalu banyak record usang: tulis ulang isi index saja
+            self._pending = bytearray()
+            self._records = len(self._entries)
+            data = b"".join(digest + bytes([status]) for digest, status in self._entries.items())
+            return data, True
+        data, self._pending = bytes(self._pending), bytearray()
+        return data, False
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return
+            data, rewrite = self._take_pending()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, data, rewrite)
+            except Exception as e:
+                logger.error(f"Error saving credential index: {e}")
+
+    def _write(self, data, rewrite=False):
+        if rewrite:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        elif data:
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+class SqliteCredentialIndex(CredentialIndex):
+    """Varian CredentialIndex di tabel SQLite untuk backend sqlite.
+
+    Semua worker membaca dan menulis tabel yang sama, sehingga akun yang
+    di-restock atau terjual di satu proses langsung terlihat di proses lain.
+    mark() langsung ditulis dalam satu transaksi. Index file lama
+    (credentials.idx) diimpor sekali jika tabel masih kosong.
+    """
+
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS credentials (digest BLOB PRIMARY KEY, status INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        self.loaded = self.conn.execute("SELECT 1 FROM credentials LIMIT 1").fetchone() is not None
+        if not self.loaded and legacy_path and os.path.exists(legacy_path):
+            legacy = CredentialIndex(legacy_path)
+            self._store(legacy._entries.items())
+            self.loaded = True
+            logger.info(f"Index kredensial {legacy_path} diimpor ke {path}: {len(legacy)} akun")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM credentials").fetchone()[0]
+
+    def _statuses(self, digests):
+        unique = list(set(digests))
+        statuses = {}
+        for i in range(0, len(unique), self.LOOKUP_CHUNK):
+            chunk = unique[i:i + self.LOOKUP_CHUNK]
+            statuses.update(self.conn.execute(
+                f"SELECT digest, status FROM credentials WHERE digest IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return statuses
+
+    def _store(self, entries, removed=()):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT INTO credentials (digest, status) VALUES (?, ?) "
+                "ON CONFLICT(digest) DO UPDATE SET status = excluded.status",
+                entries
+            )
+            self.conn.executemany("DELETE FROM credentials WHERE digest = ?", ((d,) for d in removed))
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def mark(self, accounts, status):
+        digests = [self.digest(account) for account in accounts]
+        if status == self.REMOVED:
+            self._store((), digests)
+        else:
+            self._store((digest, status) for digest in digests)
+
+    async def flush(self):
+        """Tidak ada yang tertunda: setiap mark() sudah ditulis."""
+
+def create_credential_index():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteCredentialIndex(DATABASE_FILE, legacy_path=CREDENTIAL_INDEX_FILE)
+    return CredentialIndex(CREDENTIAL_INDEX_FILE)
+
+credentials = create_credential_index()
+if not credentials.loaded:
+    credentials.rebuild(store)
+
+class ProcessLock:
+    """Lock antar-proses per produk memakai byte-range lock fcntl di satu file.
+
+    Byte ke-N file dikunci untuk produk N. Menunggu dilakukan dengan polling
+    singkat agar event loop tidak ikut terblokir.
+    """
+
+    POLL_INTERVAL = 0.005
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @asynccontextmanager
+    async def hold(self, offset):
+        while True:
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+                break
+            except OSError:
+                await asyncio.sleep(self.POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+
+class InventoryAllocator:
+    """Pintu tunggal semua mutasi akun, diserialisasi dengan lock per produk.
+
+    Verifikasi, /kirimulang, restock, dan penghapusan akun untuk produk yang
+    sama tidak pernah berjalan bersamaan, sehingga satu akun tidak bisa
+    terkirim ke dua pembeli dan restock tidak hilang. take() bersifat
+    semua-atau-tidak: jika stok kurang dari jumlah diminta, tidak ada akun
+    yang diambil. Setiap mutasi juga memperbarui index kredensial.
+    Dengan process_lock (mode multi-worker) lock per produk juga berlaku
+    antar proses.
+    """
+
+    def __init__(self, store, credentials, process_lock=None):
+        self.store = store
+        self.credentials = credentials
+        self.process_lock = process_lock
+        self._locks = {}
+
+    @asynccontextmanager
+    async def lock(self, product_id):
+        lock = self._locks.get(product_id)
+        if lock is None:
+            lock = self._locks[product_id] = asyncio.Lock()
+        async with lock:
+            if self.process_lock is None:
+                yield
+            else:
+                async with self.process_lock.hold(product_id):
+                    yield
+
+    async def take(self, product_id, count=1):
+        async with self.lock(product_id):
+            accounts = self.store.take_accounts(product_id, count)
+            self.credentials.mark(accounts, CredentialIndex.SOLD)
+            return accounts
+
+    async def take_many(self, product_id, quantities):
+        """Ambil akun untuk beberapa order sekaligus dengan satu operasi store.
+
+        Order dilayani berurutan (FIFO) selama stok cukup; hasilnya list akun
+        untuk setiap order yang terpenuhi, order sisanya tidak mendapat akun.
+        """
+        async with self.lock(product_id):
+            available = self.store.count_accounts(product_id)
+            granted = []
+            for quantity in quantities:
+                if sum(granted) + quantity > available:
+                    break
+                granted.append(quantity)
+            accounts = self.store.take_accounts(product_id, sum(granted)) if granted else []
+            self.credentials.mark(accounts, CredentialIndex.SOLD)
+            allocations = []
+            for quantity in granted:
+                allocations.append(accounts[:quantity])
+                accounts = accounts[quantity:]
+            return allocations
+
+    async def add(self, product_id, accounts):
+        """Tambah akun yang belum pernah di-stok/terjual; kembalikan laporan duplikat."""
+        async with self.lock(product_id):
+            fresh, report = self.credentials.classify(accounts)
+            if fresh:
+                self.store.add_accounts(product_id, fresh)
+                self.credentials.mark(fresh, CredentialIndex.IN_STOCK)
+            report["total"] = self.store.count_accounts(product_id)
+            return report
+
+    async def delete(self, product_id, first_id=None, last_id=None, prefix=None):
+        """Hapus akun berdasarkan rentang id dan/atau awalan username."""
+        async with self.lock(product_id):
+            accounts = self.store.delete_accounts(product_id, first_id, last_id, prefix)
+            self.credentials.mark(accounts, CredentialIndex.REMOVED)
+            return accounts
+
+    async def delete_positions(self, product_id, start, stop, prefix=None):
+        """Hapus akun di posisi antrean [start, stop), mis. halaman 3-5 browser akun."""
+        async with self.lock(product_id):
+            span = self.store.account_id_span(product_id, start, stop)
+            if span is None:
+                return []
+            accounts = self.store.delete_accounts(product_id, span[0], span[1], prefix)
+            self.credentials.mark(accounts, CredentialIndex.REMOVED)
+            return accounts
+
+    async def clear(self, product_id):
+        async with self.lock(product_id):
+            self.credentials.mark(list(self.store.iter_accounts(product_id)), CredentialIndex.REMOVED)
+            return self.store.clear_accounts(product_id)
+
+inventory = InventoryAllocator(
+    store, credentials, ProcessLock(f"{DATABASE_FILE}.lock") if WORKERS > 1 else None
+)
+
+class Storefront:
+    """Keyboard etalase (produk yang ada stoknya) per halaman.
+
+    Markup setiap halaman dibuat sekali lalu disimpan; cache dibuang hanya
+    saat versi katalog berubah (produk baru atau stok berubah).
+    """
+
+    def __init__(self, store, page_size=STOREFRONT_PAGE_SIZE, columns=2):
+        self.store = store
+        self.page_size = page_size
+        self.columns = columns
+        self._version = None
+        self._pages = {}
+
+    def page_count(self):
+        return max(1, -(-len(self.store.available_products()) // self.page_size))
+
+    def page(self, page=0):
+        """Kembalikan (markup, nomor halaman) atau (None, 0) jika stok habis."""
+        products = self.store.available_products()
+        if not products:
+            return None, 0
+        if self.store.catalog.version != self._version:
+            self._version = self.store.catalog.version
+            self._pages = {}
+        page = min(max(page, 0), self.page_count() - 1)
+        markup = self._pages.get(page)
+        if markup is None:
+            markup = self._pages[page] = self._render(products, page)
+        return markup, page
+
+    def _render(self, products, page):
+        kb = InlineKeyboardBuilder()
+        start = page * self.page_size
+        for product in products[start:start + self.page_size]:
+            kb.add(types.InlineKeyboardButton(
+                text=f"{product['name']} ({product['stock']})",
+                callback_data=f"product_{product['id']}"
+            ))
+        kb.adjust(self.columns)
+        
+        total_pages = self.page_count()
+        if total_pages > 1:
+            nav = []
+            if page > 0:
+                nav.append(types.InlineKeyboardButton(text="⬅️ Sebelumnya", callback_data=f"shop_page_{page - 1}"))
+            nav.append(types.InlineKeyboardButton(text=f"📄 {page + 1}/{total_pages}", callback_data="shop_noop"))
+            if page < total_pages - 1:
+                nav.append(types.InlineKeyboardButton(text="Berikutnya ➡️", callback_data=f"shop_page_{page + 1}"))
+            kb.row(*nav)
+        return kb.as_markup()
+
+storefront = Storefront(store)
+
+class ProductSearch:
+    """Index token/prefix nama & deskripsi produk untuk inline search.
+
+    Index hanya dicek ulang saat catalog.search_version berubah (produk
+    ditambah/diedit, bukan penjualan atau restock), dan hanya produk yang
+    nama/deskripsinya berubah yang diindeks ulang. Urutan hasil per query di-cache; filter stok
+    diterapkan saat paging, sehingga perubahan stok tidak membuang cache.
+    Skor per kata query: cocok di nama > di deskripsi, kata utuh > prefix.
+    """
+
+    NAME_WEIGHT = 2
+    DESCRIPTION_WEIGHT = 1
+    CACHE_SIZE = 512
+    # Di atas jumlah perubahan ini daftar token diurutkan ulang sekaligus
+    BULK_THRESHOLD = 100
+
+    def __init__(self, store):
+        self.store = store
+        self._version = None
+        self._fields = {}
+        self._product_tokens = {}
+        self._postings = {}
+        self._tokens = []
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r"\w+", (text or "").lower())
+
+    def _sync(self):
+        products = self.store.all_products()
+        if self.store.catalog.search_version == self._version:
+            return
+        self._version = self.store.catalog.search_version
+        current = {p["id"]: (p.get("name") or "", p.get("description") or "") for p in products}
+        changed = [pid for pid, fields in current.items() if self._fields.get(pid) != fields]
+        removed = [pid for pid in self._fields if pid not in current]
+        if not changed and not removed:
+            return
+        bulk = len(changed) + len(removed) > self.BULK_THRESHOLD
+        for pid in removed:
+            self._unindex(pid, bulk)
+        for pid in changed:
+            self._index(pid, current[pid], bulk)
+        if bulk:
+            self._tokens = sorted(self._postings)
+        self._cache.clear()
+
+    def _index(self, product_id, fields, bulk=False):
+        self._unindex(product_id, bulk)
+        self._fields[product_id] = fields
+        weights = {token: self.DESCRIPTION_WEIGHT for token in self.tokenize(fields[1])}
+        weights.update((token, self.NAME_WEIGHT) for token in self.tokenize(fields[0]))
+        self._product_tokens[product_id] = weights
+        for token, weight in weights.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                if not bulk:
+                    bisect.insort(self._tokens, token)
+            posting[product_id] = weight
+
+    def _unindex(self, product_id, bulk=False):
+        self._fields.pop(product_id, None)
+        for token in self._product_tokens.pop(product_id, {}):
+            posting = self._postings[token]
+            del posting[product_id]
+            if not posting:
+                del self._postings[token]
+                if not bulk:
+                    del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def _match(self, query_tokens):
+        scores = None
+        for query_token in query_tokens:
+            token_scores = {}
+            i = bisect.bisect_left(self._tokens, query_token)
+            while i < len(self._tokens) and self._tokens[i].startswith(query_token):
+                exact = self._tokens[i] == query_token
+                for product_id, weight in self._postings[self._tokens[i]].items():
+                    score = weight * 2 + exact
+                    if score > token_scores.get(product_id, 0):
+                        token_scores[product_id] = score
+                i += 1
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: score + token_scores[pid] for pid, score in scores.items() if pid in token_scores}
+            if not scores:
+                break
+        return scores or {}
+
+    def ranked(self, query):
+        """Id produk yang cocok dengan semua kata query, urut skor (stok belum difilter)."""
+        self._sync()
+        tokens = self.tokenize(query)
+        key = " ".join(tokens)
+        ranked = self._cache.get(key)
+        if ranked is not None:
+            self._cache.move_to_end(key)
+            return ranked
+        if tokens:
+            scores = self._match(tokens)
+            ranked = sorted(scores, key=lambda pid: (-scores[pid], len(self._fields[pid][0]), self._fields[pid][0].lower()))
+        else:
+            ranked = sorted(self._fields, key=lambda pid: self._fields[pid][0].lower())
+        self._cache[key] = ranked
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return ranked
+
+    def search(self, query, offset=0, limit=INLINE_PAGE_SIZE):
+        """Kembalikan (produk berstok mulai posisi offset, offset berikutnya atau None)."""
+        ranked = self.ranked(query)
+        results = []
+        position = offset
+        while position < len(ranked) and len(results) < limit:
+            product = self.store.catalog.get(ranked[position])
+            position += 1
+            if product and product.get("stock", 0) > 0:
+                results.append(product)
+        return results, (position if position < len(ranked) else None)
+
+product_search = ProductSearch(store)
+
+ORDER_PENDING = "pending"
+ORDER_VERIFIED = "verified"
+ORDER_REJECTED = "rejected"
+# Lama (detik) klaim admin atas order pending berlaku sebelum admin lain boleh mengambil alih
+ORDER_CLAIM_TTL = 15 * 60
+
+class OrderLedger:
+    """Catatan semua order (pending/verified/rejected) di SQLite.
+
+    Setiap order punya ID ringkas (base36 dari nomor urut) yang dipakai di
+    callback verifikasi/tolak, sehingga callback tidak lagi membawa state.
+    Perubahan status memakai compare-and-set agar satu bukti transfer tidak
+    bisa diverifikasi dua kali. Admin yang diberi notifikasi dicatat di
+    assigned_to; order baru diklaim (claimed_by) saat seorang admin menekan
+    tombol verifikasi/tolak, dan selama klaim belum lewat ORDER_CLAIM_TTL
+    admin lain tidak bisa memverifikasi/menolaknya.
+    """
+
+    COLUMNS = (
+        "id", "user_id", "product_id", "product_name", "price", "price_amount", "currency", "quantity", "status",
+        "proof_file_id", "proof_type", "buyer_name", "buyer_username", "accounts",
+        "assigned_to", "claimed_by", "claimed_at", "created_at", "updated_at"
+    )
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS orders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                product_name TEXT,
+                price TEXT,
+                price_amount INTEGER,
+                currency TEXT,
+                quantity INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL,
+                proof_file_id TEXT,
+                proof_type TEXT,
+                buyer_name TEXT,
+                buyer_username TEXT,
+                accounts TEXT,
+                assigned_to INTEGER,
+                claimed_by INTEGER,
+                claimed_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status, id);
+            CREATE INDEX IF NOT EXISTS idx_orders_status_product ON orders(status, product_id, id);
+            CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id, id);
+        """)
+        # Database lama: tambahkan kolom harga terstruktur dan klaim
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(orders)")}
+        for column, kind in (
+            ("price_amount", "INTEGER"), ("currency", "TEXT"), ("assigned_to", "INTEGER"),
+            ("claimed_by", "INTEGER"), ("claimed_at", "REAL")
+        ):
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE orders ADD COLUMN {column} {kind}")
+
+    @staticmethod
+    def format_id(order_id):
+        digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+        code = ""
+        while True:
+            order_id, rem = divmod(order_id, 36)
+            code = digits[rem] + code
+            if not order_id:
+                return code
+
+    @staticmethod
+    def parse_id(code):
+        code = code.lstrip("#")
+        # int() menerima "_" sebagai pemisah digit; callback lama verify_<user>_<produk> harus ditolak
+        if not code.isalnum():
+            return None
+        try:
+            return int(code, 36)
+        except ValueError:
+            return None
+
+    def _order(self, row):
+        if row is None:
+            return None
+        order = dict(row)
+        order["code"] = self.format_id(order["id"])
+        order["accounts"] = json.loads(order["accounts"]) if order["accounts"] else []
+        return order
+
+    def create(self, **fields):
+        now = time.time()
+        fields.setdefault("status", ORDER_PENDING)
+        fields.update(created_at=now, updated_at=now)
+        keys = [k for k in self.COLUMNS if k in fields]
+        cur = self.conn.execute(
+            f"INSERT INTO orders ({', '.join(keys)}) VALUES ({', '.join('?' for _ in keys)})",
+            [fields[k] for k in keys]
+        )
+        return self.get(cur.lastrowid)
+
+    def get(self, order_id):
+        return self._order(self.conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone())
+
+    def _update(self, order_id, fields, where="", params=()):
+        if "accounts" in fields:
+            fields["accounts"] = json.dumps(fields["accounts"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        cur = self.conn.execute(
+            f"UPDATE orders SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?{where}",
+            [*fields.values(), order_id, *params]
+        )
+        return cur.rowcount == 1
+
+    def update(self, order_id, **fields):
+        return self._update(order_id, fields)
+
+    def transition(self, order_id, from_status, to_status, **fields):
+        """Ubah status hanya jika status saat ini from_status; True jika berhasil."""
+        fields["status"] = to_status
+        return self._update(order_id, fields, " AND status = ?", (from_status,))
+
+    def claim(self, order_id, admin_id, ttl=None):
+        """Klaim order pending untuk admin_id; gagal jika masih diklaim admin lain."""
+        now = time.time()
+        cur = self.conn.execute(
+            "UPDATE orders SET claimed_by = ?, claimed_at = ? WHERE id = ? AND status = ? "
+            "AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?)",
+            (admin_id, now, order_id, ORDER_PENDING, admin_id, now - (ttl or ORDER_CLAIM_TTL))
+        )
+        return cur.rowcount == 1
+
+    def release_claims(self, admin_id):
+        """Lepas semua klaim order pending milik admin (mis. saat admin offline)."""
+        return self.conn.execute(
+            "UPDATE orders SET claimed_by = NULL, claimed_at = NULL WHERE status = ? AND claimed_by = ?",
+            (ORDER_PENDING, admin_id)
+        ).rowcount
+
+    @staticmethod
+    def claim_holder(order, now=None):
+        """Admin yang masih memegang klaim order, atau None."""
+        if order.get("claimed_by") is None or order["claimed_at"] < (now or time.time()) - ORDER_CLAIM_TTL:
+            return None
+        return order["claimed_by"]
+
+    @contextmanager
+    def batch(self):
+        """Gabungkan banyak perubahan order dalam satu transaksi."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def list_pending_for_product(self, product_id):
+        rows = self.conn.execute(
+            "SELECT * FROM orders WHERE status = ? AND product_id = ? ORDER BY id", (ORDER_PENDING, product_id)
+        ).fetchall()
+        return [self._order(row) for row in rows]
+
+    def count_by_status(self, status):
+        return self.conn.execute("SELECT COUNT(*) FROM orders WHERE status = ?", (status,)).fetchone()[0]
+
+    def list_by_status(self, status, limit, offset=0):
+        rows = self.conn.execute(
+            "SELECT * FROM orders WHERE status = ? ORDER BY id LIMIT ? OFFSET ?", (status, limit, offset)
+        ).fetchall()
+        return [self._order(row) for row in rows]
+
+    def list_by_user(self, user_id, limit=10):
+        rows = self.conn.execute(
+            "SELECT * FROM orders WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+        ).fetchall()
+        return [self._order(row) for row in rows]
+
+orders = OrderLedger(DATABASE_FILE)
+
+class AdminRouter:
+    """Pembagi bukti transfer baru ke admin yang sedang online.
+
+    Penugasan hanya menentukan siapa yang diberi notifikasi (orders.assigned_to),
+    bukan klaim: admin lain tetap bisa memverifikasi lewat /antrian atau
+    /verifsemua selama belum ada yang menekan tombol verifikasi/tolak.
+    Status online dan waktu penugasan terakhir disimpan di tabel admins
+    (file database yang sama dengan orders), dan pemilihan admin dilakukan
+    dalam satu transaksi BEGIN IMMEDIATE sehingga aman dipakai beberapa
+    worker sekaligus. "least_pending" memilih admin dengan order pending
+    yang ditugaskan paling sedikit (seri: yang paling lama tidak diberi
+    tugas); "round_robin" selalu memilih yang paling lama tidak diberi tugas.
+    Jika tidak ada admin online, bukti dikirim ke ADMIN_ID.
+    """
+
+    def __init__(self, path, strategy=PROOF_ROUTING):
+        self.strategy = strategy
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS admins (
+                user_id INTEGER PRIMARY KEY,
+                online INTEGER NOT NULL DEFAULT 1,
+                last_assigned REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.executemany("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", ((a,) for a in ADMIN_IDS))
+
+    def set_online(self, admin_id, online):
+        self.conn.execute("UPDATE admins SET online = ? WHERE user_id = ?", (int(online), admin_id))
+
+    def status(self):
+        """{admin_id: (online, order pending yang ditugaskan)} untuk semua admin di config."""
+        online = {row[0]: bool(row[1]) for row in self.conn.execute("SELECT user_id, online FROM admins")}
+        load = self._load()
+        return {admin_id: (online.get(admin_id, True), load.get(admin_id, 0)) for admin_id in ADMIN_ROLES}
+
+    def _load(self):
+        return dict(self.conn.execute(
+            "SELECT assigned_to, COUNT(*) FROM orders WHERE status = ? AND assigned_to IS NOT NULL "
+            "GROUP BY assigned_to",
+            (ORDER_PENDING,)
+        ).fetchall())
+
+    def assign(self, order_id, exclude=()):
+        """Pilih admin yang diberi notifikasi order baru dan catat di order.
+
+        Admin di exclude (mis. gagal dikirimi) dilewati; kembalikan id admin,
+        atau None jika tidak ada lagi yang bisa dipilih.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute("SELECT user_id, online, last_assigned FROM admins").fetchall()
+            last_assigned = {row[0]: row[2] for row in rows}
+            candidates = [row[0] for row in rows if row[1] and row[0] in ADMIN_IDS and row[0] not in exclude]
+            if not candidates:
+                candidates = [ADMIN_ID] if ADMIN_ID not in exclude else []
+            if not candidates:
+                self.conn.execute("ROLLBACK")
+                return None
+            if self.strategy == "round_robin":
+                admin_id = min(candidates, key=lambda a: last_assigned.get(a, 0))
+            else:
+                load = self._load()
+                admin_id = min(candidates, key=lambda a: (load.get(a, 0), last_assigned.get(a, 0)))
+            self.conn.execute("UPDATE admins SET last_assigned = ? WHERE user_id = ?", (now, admin_id))
+            self.conn.execute("UPDATE orders SET assigned_to = ? WHERE id = ?", (admin_id, order_id))
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return admin_id
+
+admin_router = AdminRouter(DATABASE_FILE)
+
+class SalesStats:
+    """Agregat penjualan per hari per produk (order, akun, omzet) di SQLite.
+
+    Baris diperbarui setiap kali order diverifikasi, sehingga /statistik
+    cukup menjumlahkan paling banyak 30 baris per produk, berapa pun
+    panjang riwayat order. Omzet disimpan dalam unit terkecil mata uang.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sales_daily (
+                day TEXT NOT NULL,
+                product_id INTEGER NOT NULL,
+                currency TEXT NOT NULL,
+                orders INTEGER NOT NULL DEFAULT 0,
+                units INTEGER NOT NULL DEFAULT 0,
+                revenue INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, product_id, currency)
+            ) WITHOUT ROWID
+        """)
+
+    @staticmethod
+    def day(timestamp=None):
+        return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+    def record(self, product_id, units, revenue, currency, order_count=1):
+        self.conn.execute(
+            "INSERT INTO sales_daily (day, product_id, currency, orders, units, revenue) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(day, product_id, currency) DO UPDATE SET orders = orders + excluded.orders, "
+            "units = units + excluded.units, revenue = revenue + excluded.revenue",
+            (self.day(), product_id, currency, order_count, units, revenue)
+        )
+
+    def summary(self, days):
+        """Total per produk untuk `days` hari terakhir (termasuk hari ini)."""
+        since = self.day(time.time() - (days - 1) * 86400)
+        rows = self.conn.execute(
+            "SELECT product_id, currency, SUM(orders), SUM(units), SUM(revenue) FROM sales_daily "
+            "WHERE day >= ? GROUP BY product_id, currency",
+            (since,)
+        ).fetchall()
+        return [
+            {"product_id": row[0], "currency": row[1], "orders": row[2], "units": row[3], "revenue": row[4]}
+            for row in rows
+        ]
+
+sales = SalesStats(DATABASE_FILE)
+
+# === OUTBOUND DISPATCHER ===
+# Kelas prioritas pengiriman: angka kecil dikirim lebih dulu
+PRIORITY_DELIVERY = 0
+PRIORITY_NORMAL = 1
+PRIORITY_ADMIN = 2
+PRIORITY_NAMES = {PRIORITY_DELIVERY: "delivery", PRIORITY_NORMAL: "normal", PRIORITY_ADMIN: "admin"}
+
+send_priority = contextvars.ContextVar("send_priority", default=PRIORITY_NORMAL)
+
+def with_priority(priority):
+    """Dekorator handler: semua kiriman di dalamnya memakai prioritas ini."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            token = send_priority.set(priority)
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                send_priority.reset(token)
+        return wrapper
+    return decorator
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """Detik sampai satu token tersedia (0 = bisa kirim sekarang)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """Middleware sesi bot yang mengantrekan semua kiriman pesan.
+
+    Setiap kiriman menunggu token dari bucket global dan bucket per chat
+    (grup memakai batas yang lebih ketat). Antrean dilayani per prioritas,
+    sehingga pengiriman akun mendahului notifikasi admin, dan chat yang
+    sedang dibatasi tidak menahan chat lain. TelegramRetryAfter otomatis
+    ditunggu lalu dicoba ulang.
+    """
+
+    MAX_RETRIES = 3
+    IDLE_BUCKET_TTL = 60
+
+    def __init__(self, global_rate=RATE_LIMIT_GLOBAL, chat_rate=RATE_LIMIT_CHAT, chat_burst=3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.queues = {priority: deque() for priority in PRIORITY_NAMES}
+        self.stats = {"sent": 0, "queued": 0, "retry_after": 0, "max_wait": 0.0}
+        self._wakeup = None
+        self._task = None
+        self._swept_at = time.monotonic()
+
+    def queue_depth(self):
+        return {PRIORITY_NAMES[p]: len(q) for p, q in self.queues.items()}
+
+    def _bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Grup/channel (id negatif) dibatasi sekitar 20 pesan per menit
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(20 / 60, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or method.__api_method__ not in RATE_LIMITED_METHODS:
+            return await make_request(bot, method)
+        
+        priority = PRIORITY_ADMIN if chat_id in ADMIN_IDS else send_priority.get()
+        for attempt in range(self.MAX_RETRIES):
+            await self._acquire(priority, chat_id, retry=attempt > 0)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.stats["retry_after"] += 1
+                logger.warning(f"Flood control untuk chat {chat_id}, tunggu {e.retry_after} detik")
+                self._bucket(chat_id).blocked_until = time.monotonic() + e.retry_after
+        await self._acquire(priority, chat_id, retry=True)
+        return await make_request(bot, method)
+
+    async def _acquire(self, priority, chat_id, retry=False):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        entry = (chat_id, future, time.monotonic())
+        # Kiriman yang diulang tetap di depan agar urutan pesan dalam chat terjaga
+        if retry:
+            self.queues[priority].appendleft(entry)
+        else:
+            self.queues[priority].append(entry)
+        self.stats["queued"] += 1
+        self._wakeup.set()
+        await future
+
+    def _next_ready(self, now):
+        """Ambil entri prioritas tertinggi yang chat-nya punya token; kembalikan (entri, jeda)."""
+        wait = None
+        for queue in self.queues.values():
+            for entry in queue:
+                chat_id, future, _ = entry
+                if future.done():
+                    queue.remove(entry)
+                    return None, 0.0
+                delay = self._bucket(chat_id).delay(now)
+                if delay == 0:
+                    queue.remove(entry)
+                    return entry, 0.0
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _sweep(self, now):
+        # Buang bucket chat yang sudah lama penuh agar tabel tidak terus membesar
+        self._swept_at = now
+        for chat_id in [
+            c for c, b in self.chat_buckets.items()
+            if b.tokens >= b.capacity and now - b.updated > self.IDLE_BUCKET_TTL and now >= b.blocked_until
+        ]:
+            del self.chat_buckets[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if now - self._swept_at > self.IDLE_BUCKET_TTL:
+                self._sweep(now)
+            global_delay = self.global_bucket.delay(now)
+            if global_delay:
+                await asyncio.sleep(global_delay)
+                continue
+            entry, wait = self._next_ready(now)
+            if entry is not None:
+                chat_id, future, queued_at = entry
+                self.global_bucket.consume()
+                self._bucket(chat_id).consume()
+                self.stats["sent"] += 1
+                self.stats["max_wait"] = max(self.stats["max_wait"], now - queued_at)
+                future.set_result(None)
+                continue
+            if wait == 0.0:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+# Batas global Telegram berlaku per bot, jadi dibagi rata antar worker
+outbox = OutboundDispatcher(global_rate=RATE_LIMIT_GLOBAL / WORKERS)
+bot.session.middleware(outbox)
+
+# === THROTTLE ===
+class ThrottleMiddleware(BaseMiddleware):
+    """Inner middleware: token bucket per user untuk satu jenis event.
+
+    Tabel hanya berisi user_id -> [token, waktu isi terakhir, sudah diberi
+    peringatan]; entri yang sudah penuh kembali dan lama tidak aktif dibuang
+    tiap IDLE_TTL detik. Callback yang dibatasi cukup dijawab dengan
+    answerCallbackQuery (tanpa baca katalog/edit pesan), pesan dibuang diam-diam
+    setelah satu peringatan. Admin (ADMIN_IDS) tidak pernah dibatasi.
+    """
+
+    IDLE_TTL = 300
+
+    def __init__(self, kind, rate, burst):
+        self.kind = kind
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.buckets = {}
+        self.stats = {"allowed": 0, "throttled": 0, "evicted": 0}
+        self._swept_at = time.monotonic()
+
+    def allow(self, user_id, now):
+        """Ambil satu token milik user; False jika bucket-nya sedang kosong."""
+        entry = self.buckets.get(user_id)
+        if entry is None:
+            self.buckets[user_id] = [self.burst - 1, now, False]
+            return True
+        tokens = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+        entry[1] = now
+        if tokens >= 1:
+            entry[0] = tokens - 1
+            entry[2] = False
+            return True
+        entry[0] = tokens
+        return False
+
+    def _sweep(self, now):
+        self._swept_at = now
+        # Entri yang sudah penuh lagi sama saja dengan entri baru
+        idle = max(self.IDLE_TTL, self.burst / self.rate)
+        stale = [user_id for user_id, entry in self.buckets.items() if now - entry[1] > idle]
+        for user_id in stale:
+            del self.buckets[user_id]
+        self.stats["evicted"] += len(stale)
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if self.rate <= 0 or user is None or user.id in ADMIN_IDS:
+            return await handler(event, data)
+        
+        now = time.monotonic()
+        if now - self._swept_at > self.IDLE_TTL:
+            self._sweep(now)
+        if self.allow(user.id, now):
+            self.stats["allowed"] += 1
+            return await handler(event, data)
+        
+        self.stats["throttled"] += 1
+        metrics.inc("bot_throttled_total", kind=self.kind, handler=data["handler"].callback.__name__)
+        entry = self.buckets[user.id]
+        if isinstance(event, types.CallbackQuery):
+            await event.answer("⏳ Terlalu cepat, tunggu sebentar lalu coba lagi.")
+        elif not entry[2]:
+            entry[2] = True
+            await event.answer("⏳ Terlalu banyak pesan. Tunggu beberapa detik sebelum mengirim lagi.")
+        return None
+
+message_throttle = ThrottleMiddleware("message", THROTTLE_MESSAGE_RATE, THROTTLE_MESSAGE_BURST)
+callback_throttle = ThrottleMiddleware("callback", THROTTLE_CALLBACK_RATE, THROTTLE_CALLBACK_BURST)
+# Didaftarkan sebelum middleware metrik: update yang dibatasi tidak dihitung sebagai latensi handler
+dp.message.middleware(message_throttle)
+dp.callback_query.middleware(callback_throttle)
+
+metrics.describe("bot_throttled_total", "counter", "Event user yang ditolak throttle per jenis dan handler")
+metrics.gauge("bot_throttle_tracked_users", lambda: [
+    ({"kind": t.kind}, len(t.buckets)) for t in (message_throttle, callback_throttle)
+])
+metrics.counter("bot_throttle_allowed_total", lambda: [
+    ({"kind": t.kind}, t.stats["allowed"]) for t in (message_throttle, callback_throttle)
+])
+metrics.counter("bot_throttle_evicted_total", lambda: [
+    ({"kind": t.kind}, t.stats["evicted"]) for t in (message_throttle, callback_throttle)
+])
+
+# === METRICS MIDDLEWARE ===
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer middleware dp.update: hitung update, error dan lama pemrosesan per tipe."""
+
+    async def __call__(self, handler, event, data):
+        try:
+            update_type = event.event_type
+        except UpdateTypeLookupError:
+            update_type = "unknown"
+        metrics.inc("bot_updates_total", type=update_type)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.inc("bot_update_errors_total", type=update_type)
+            raise
+        finally:
+            metrics.observe("bot_update_seconds", time.perf_counter() - start, type=update_type)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: latensi per handler, diberi label nama fungsi handler."""
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.inc("bot_handler_errors_total", handler=name)
+            raise
+        finally:
+            metrics.observe("bot_handler_seconds", time.perf_counter() - start, handler=name)
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware sesi di dalam outbox: hanya mengukur waktu request ke Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.inc("bot_api_errors_total", method=api_method, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe("bot_api_seconds", time.perf_counter() - start, method=api_method)
+
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+dp.inline_query.middleware(HandlerMetricsMiddleware())
+bot.session.middleware(ApiMetricsMiddleware())
+
+metrics.gauge("bot_outbox_queue_depth", lambda: [
+    ({"priority": priority}, depth) for priority, depth in outbox.queue_depth().items()
+])
+metrics.counter("bot_outbox_sent_total", lambda: [({}, outbox.stats["sent"])])
+metrics.counter("bot_outbox_retry_after_total", lambda: [({}, outbox.stats["retry_after"])])
+metrics.gauge("bot_outbox_max_wait_seconds", lambda: [({}, round(outbox.stats["max_wait"], 3))])
+metrics.gauge("bot_outbox_active_chats", lambda: [({}, len(outbox.chat_buckets))])
+
+async def metrics_endpoint(request):
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+async def start_metrics_server():
+    """Jalankan endpoint scrape di METRICS_HOST:METRICS_PORT; kembalikan runner (None jika nonaktif)."""
+    if not METRICS_PORT:
+        return None
+    # Tiap worker punya port sendiri: METRICS_PORT, METRICS_PORT + 1, ...
+    port = METRICS_PORT + max(WORKER_INDEX - 1, 0)
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_endpoint)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=METRICS_HOST, port=port).start()
+    except OSError as e:
+        logger.error(f"Gagal membuka port metrik {port}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Metrik Prometheus tersedia di http://{METRICS_HOST}:{port}/metrics")
+    return runner
+
+def load_products():
+    with metrics.timer("bot_storage_seconds", op="load_products"):
+        return store.all_products()
+
+def get_product(product_id):
+    return store.get_product(product_id)
+
+def save_products(products):
+    try:
+        with metrics.timer("bot_storage_seconds", op="save_products"):
+            store.save_products(products)
+    except Exception as e:
+        logger.error(f"Error saving products: {e}")
+
+def build_accounts_file(product, accounts):
+    """CSV username,password di memori, siap dikirim dengan satu sendDocument."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["username", "password"])
+    writer.writerows((a["username"], a["password"]) for a in accounts)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", product["name"]).strip("_").lower() or "produk"
+    return BufferedInputFile(buffer.getvalue().encode("utf-8"), filename=f"{slug}_{len(accounts)}_akun.csv")
+
+def format_credentials(accounts):
+    """Blok detail login (tanpa header) untuk satu atau beberapa akun."""
+    if len(accounts) == 1:
+        return templates.render("credentials_single", **accounts[0])
+    items = "\n".join(
+        templates.render("credentials_item", index=i, username=a["username"], password=a["password"])
+        for i, a in enumerate(accounts, 1)
+    )
+    return templates.render("credentials_multi", quantity=len(accounts), items=items)
+
+async def deliver_credentials(user_id, product, accounts):
+    """Kirim detail login ke pembeli: inline untuk jumlah kecil, satu file CSV untuk jumlah besar."""
+    header = templates.render("delivery_header", name=product['name'], price=product['price'])
+    if len(accounts) > INLINE_DELIVERY_LIMIT:
+        await bot.send_document(
+            chat_id=user_id,
+            document=build_accounts_file(product, accounts),
+            caption=header + templates.render("credentials_file_caption", quantity=len(accounts))
+        )
+        return
+    await bot.send_message(
+        chat_id=user_id,
+        text=header + "\n" + format_credentials(accounts),
+        parse_mode=ParseMode.HTML
+    )
+
+async def deliver_product_file(user_id, product):
+    """Kirim file produk (foto/dokumen) ke pembeli jika produk punya file."""
+    if not product['file_id']:
+        return False
+    caption = templates.render("product_file_caption", name=product['name'])
+    if product['file_id'].startswith("AgAC"):  # Photo
+        await bot.send_photo(chat_id=user_id, photo=product['file_id'], caption=caption)
+    else:  # Document
+        await bot.send_document(chat_id=user_id, document=product['file_id'], caption=caption)
+    return True
+
+async def deliver_accounts(user_id, product, accounts):
+    """Kirim detail login semua akun lalu file produk (jika ada) ke pembeli."""
+    await deliver_credentials(user_id, product, accounts)
+    await deliver_product_file(user_id, product)
+
+# Jumlah digit desimal (unit terkecil) dan simbol per mata uang
+CURRENCY_EXPONENTS = {"IDR": 2, "USD": 2, "MYR": 2, "SGD": 2, "EUR": 2}
+CURRENCY_SYMBOLS = {"IDR": "Rp", "USD": "$", "MYR": "RM", "SGD": "S$", "EUR": "€"}
+# Penulisan lain mata uang yang sering dipakai ("50.000 rupiah")
+CURRENCY_ALIASES = {"RUPIAH": "IDR"}
+# Pemisah ribuan dan desimal saat menampilkan harga; default format internasional
+CURRENCY_SEPARATORS = {"IDR": (".", ",")}
+PRICE_MULTIPLIERS = {"": 1, "k": 1000, "rb": 1000, "ribu": 1000, "jt": 1000000, "juta": 1000000}
+# Awalan boleh diikuti titik singkatan ("Rp. 50.000"); ",-" di akhir ("Rp 50.000,-") diabaikan
+PRICE_PATTERN = re.compile(r"^(?:([^\d.,]*[^\d.,\s])\.?)?\s*([\d.,]+?)(?:[.,]-)?\s*([^\d.,]*)$")
+
+def _currency_code(token):
+    token = token.strip().upper()
+    if not token:
+        return None
+    token = CURRENCY_ALIASES.get(token, token)
+    if token in CURRENCY_SYMBOLS:
+        return token
+    for code, symbol in CURRENCY_SYMBOLS.items():
+        if token == symbol.upper():
+            return code
+    return False
+
+def _parse_number(number):
+    if "," in number and "." in number:
+        decimal_sep = "," if number.rfind(",") > number.rfind(".") else "."
+    elif "," in number or "." in number:
+        sep = "," if "," in number else "."
+        groups = number.split(sep)
+        # 50.000 / 1.250.000 = pemisah ribuan; 4.99 / 12,5 = desimal
+        decimal_sep = None if len(groups) > 2 or len(groups[-1]) == 3 else sep
+    else:
+        decimal_sep = None
+    for sep in ".,":
+        if sep != decimal_sep:
+            number = number.replace(sep, "")
+    if decimal_sep:
+        number = number.replace(decimal_sep, ".")
+    return Decimal(number)
+
+def parse_price(text, default_currency=CURRENCY):
+    """Ubah teks harga ("Rp 50.000", "Rp. 50.000", "50rb", "50.000 rupiah", "$4.99")
+    menjadi (jumlah unit terkecil, mata uang).
+
+    Kembalikan None jika teks bukan harga yang valid.
+    """
+    match = PRICE_PATTERN.match(str(text).strip())
+    if not match:
+        return None
+    prefix, number, suffix = match.groups()
+    currency = _currency_code(prefix or "")
+    suffix = suffix.strip().lower()
+    multiplier = PRICE_MULTIPLIERS.get(suffix)
+    if multiplier is None:
+        # Akhiran bisa juga kode mata uang: "50000 IDR"
+        suffix_currency = _currency_code(suffix)
+        if not suffix_currency or currency:
+            return None
+        currency, multiplier = suffix_currency, 1
+    if currency is False:
+        return None
+    currency = currency or default_currency
+    try:
+        value = _parse_number(number) * multiplier
+    except InvalidOperation:
+        return None
+    amount = int((value * 10 ** CURRENCY_EXPONENTS.get(currency, 2)).to_integral_value(ROUND_HALF_UP))
+    if amount <= 0:
+        return None
+    return amount, currency
+
+def format_price(amount, currency):
+    """"Rp 1.250.000", "RM 12.50", "$4.99": pemisah dan spasi simbol sesuai mata uang."""
+    exponent = CURRENCY_EXPONENTS.get(currency, 2)
+    thousands, decimal = CURRENCY_SEPARATORS.get(currency, (",", "."))
+    units, fraction = divmod(amount, 10 ** exponent)
+    text = f"{units:,}".replace(",", thousands)
+    if fraction:
+        text += f"{decimal}{fraction:0{exponent}d}"
+    symbol = CURRENCY_SYMBOLS.get(currency, currency)
+    # Simbol huruf (Rp, RM, kode ISO) diberi spasi, simbol tanda ($, €) tidak
+    return f"{symbol} {text}" if symbol[-1].isalpha() else f"{symbol}{text}"
+
+def product_price(product):
+    """(jumlah unit terkecil, mata uang) produk; produk lama diparse dari teks harga."""
+    if "price_amount" in product:
+        return product["price_amount"], product.get("currency", CURRENCY)
+    return parse_price(product.get("price") or "")
+
+def order_price(order):
+    """(total unit terkecil, mata uang) yang dicatat saat bukti transfer masuk; order lama diparse dari teksnya."""
+    if order.get("price_amount") is not None:
+        return order["price_amount"], order["currency"]
+    return parse_price(order.get("price") or "")
+
+def record_sale(product_id, sold):
+    """Tambah order terverifikasi [(order, jumlah akun), ...] ke agregat harian.
+
+    Pendapatan diambil dari harga yang dicatat di order, bukan harga produk
+    saat ini. Tidak pernah menggagalkan verifikasi.
+    """
+    try:
+        totals = {}
+        for order, units in sold:
+            price = order_price(order)
+            if price is None:
+                logger.error(f"Harga order #{order['code']} tidak bisa dibaca ({order.get('price')!r}), pendapatan dicatat 0")
+                price = (0, CURRENCY)
+            amount, currency = price
+            total = totals.setdefault(currency, [0, 0, 0])
+            total[0] += units
+            total[1] += amount
+            total[2] += 1
+        for currency, (units, revenue, order_count) in totals.items():
+            sales.record(product_id, units, revenue, currency, order_count)
+    except Exception as e:
+        logger.error(f"Error recording sale: {e}")
+
+def format_restock_report(report):
+    lines = [f"🔸 Akun baru: {report['added']}"]
+    duplicates = report["in_stock"] + report["sold"] + report["in_batch"]
+    if duplicates:
+        lines.append(
+            f"🔸 Duplikat dilewati: {duplicates} "
+            f"(sudah di stok: {report['in_stock']}, sudah terjual: {report['sold']}, "
+            f"ganda di kiriman ini: {report['in_batch']})"
+        )
+    return "\n".join(lines)
+
+def parse_account_line(line, csv_format=False):
+    """Ubah satu baris "username:password" (atau CSV username,password) menjadi akun."""
+    line = line.strip()
+    if csv_format:
+        fields = next(csv.reader([line]), [])
+        if len(fields) < 2:
+            return None
+        username, password = fields[0], fields[1]
+    elif ":" in line:
+        username, password = line.split(":", 1)
+    else:
+        return None
+    username = username.strip()
+    if not username:
+        return None
+    return {"username": username, "password": password.strip()}
+
+async def iter_document_lines(document):
+    """Unduh dokumen Telegram secara streaming dan hasilkan isinya baris demi baris."""
+    file = await bot.get_file(document.file_id)
+    url = bot.session.api.file_url(bot.token, file.file_path)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for chunk in bot.session.stream_content(url=url, timeout=60, chunk_size=65536, raise_for_status=True):
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+# Template pesan pelanggan: nama -> (teks default, field yang boleh dipakai).
+# Admin bisa mengganti teksnya dengan /template; field ditulis {nama}.
+DEFAULT_TEMPLATES = {
+    "welcome": (
+        "👋 Selamat datang di Toko Digital!\n"
+        "Silakan pilih produk yang tersedia:",
+        ()
+    ),
+    "shop_menu": ("Silakan pilih produk yang tersedia:", ()),
+    "out_of_stock": ("😞 Maaf, stok produk sedang habis.", ()),
+    "product_detail": (
+        "📛 <b>{name}</b>\n\n"
+        "📝 Deskripsi:\n{description}\n\n"
+        "💵 Harga: {price}\n"
+        "🛒 Stok: {stock}\n\n"
+        "Jika berminat, klik tombol di bawah 👇",
+        ("name", "description", "price", "stock")
+    ),
+    "order_quantity": (
+        "📌 Kamu memesan <b>{name}</b>\n"
+        "💵 Harga: {price} / akun\n"
+        "🛒 Stok: {stock}\n\n"
+        "Berapa akun yang ingin dibeli? Pilih di bawah atau ketik jumlahnya:",
+        ("name", "price", "stock")
+    ),
+    "payment_instructions": (
+        "📌 Kamu memesan <b>{name}</b>\n"
+        "📦 Jumlah: {quantity} akun\n"
+        "💵 Total: {total}\n\n"
+        "Silakan transfer ke:\n\n"
+        "<b>BCA 123456789 a.n. Toko Digital</b>\n"
+        "atau Dana: 08123456789\n\n"
+        "Setelah transfer, kirim bukti transfer di sini.",
+        ("name", "quantity", "total")
+    ),
+    "payment_prompt": ("📤 Kirim bukti transfer sekarang (foto/screenshot):", ()),
+    "proof_received": (
+        "✅ Bukti pembayaran telah dikirim ke admin. "
+        "Tunggu verifikasi dalam 1x24 jam.\n"
+        "🧾 ID Order: <code>#{order_code}</code>\n\n"
+        "Jika ada pertanyaan, hubungi @admin",
+        ("order_code",)
+    ),
+    "delivery_header": (
+        "🎉 Pembayaran diverifikasi!\n\n"
+        "📛 Produk: {name}\n"
+        "💵 Harga: {price}\n",
+        ("name", "price")
+    ),
+    "credentials_single": (
+        "🔑 Login details:\n"
+        "👤 Username: <code>{username}</code>\n"
+        "🔒 Password: <code>{password}</code>\n\n"
+        "⚠️ Jangan bagikan data login ke siapapun!",
+        ("username", "password")
+    ),
+    "credentials_item": (
+        "{index}. 👤 <code>{username}</code> 🔒 <code>{password}</code>",
+        ("index", "username", "password")
+    ),
+    "credentials_multi": (
+        "📦 Jumlah: {quantity} akun\n\n"
+        "🔑 Login details:\n{items}\n\n"
+        "⚠️ Jangan bagikan data login ke siapapun!",
+        ("quantity", "items")
+    ),
+    "credentials_file_caption": (
+        "📦 Jumlah: {quantity} akun\n\n"
+        "🔑 Detail login ada di file terlampir (username,password).\n"
+        "⚠️ Jangan bagikan data login ke siapapun!",
+        ("quantity",)
+    ),
+    "product_file_caption": (
+        "📦 Produk Anda: {name}\n"
+        "Terima kasih telah berbelanja!",
+        ("name",)
+    ),
+    "snk": ("📜 <b>Syarat & Ketentuan</b>\n\n{snk}", ("snk",)),
+}
+SNK_DEFAULT = "Belum ada Syarat & Ketentuan yang ditetapkan."
+
+# Satu Formatter untuk semua template; template diparse sekali saat dimuat
+TEMPLATE_FORMATTER = string.Formatter()
+
+def compile_template(source, fields):
+    """Parse template menjadi potongan (teks, field, spec, konversi); tolak field tak dikenal."""
+    parts = []
+    for literal, field, spec, conversion in TEMPLATE_FORMATTER.parse(source):
+        if field is not None and field not in fields:
+            raise ValueError(f"field {{{field}}} tidak dikenal (boleh: {', '.join(fields) or '-'})")
+        if spec and "{" in spec:
+            raise ValueError("format bertingkat tidak didukung")
+        parts.append((literal, field, spec or "", conversion))
+    return parts
+
+class TemplateStore:
+    """Template pesan pelanggan dan teks SNK yang sudah dikompilasi di memori.
+
+    Override admin disimpan di templates.json dan SNK di snk.txt. Render tidak
+    membaca disk: file hanya di-stat paling sering tiap TEMPLATE_CHECK_INTERVAL
+    detik dan dimuat ulang jika mtime/size berubah, sedangkan perubahan lewat
+    bot langsung memperbarui cache.
+    """
+
+    def __init__(self, path=TEMPLATES_FILE, snk_path=SNK_FILE):
+        self.path = path
+        self.snk_path = snk_path
+        self.overrides = {}
+        self._compiled = {}
+        self._snk = SNK_DEFAULT
+        self._signatures = {}
+        self._checked_at = time.monotonic()
+        self._load_templates()
+        self._load_snk()
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
 
-class OrderState(StatesGroup):
-    waiting_for_payment = State()
+    def _compile_all(self):
+        compiled = {}
+        for name, (default, fields) in DEFAULT_TEMPLATES.items():
+            try:
+                compiled[name] = compile_template(self.overrides.get(name, default), fields)
+            except ValueError as e:
+                logger.error(f"Template {name} tidak valid, memakai default: {e}")
+                compiled[name] = compile_template(default, fields)
+        self._compiled = compiled
 
-class RestockState(StatesGroup):
-    input_accounts = State()
+    def _load_templates(self):
+        self._signatures[self.path] = self._signature(self.path)
+        overrides = {}
+        if self._signatures[self.path] is not None:
+            try:
+                with open(self.path, "r") as f:
+                    overrides = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading templates: {e}")
+        self.overrides = {
+            name: text for name, text in overrides.items()
+            if name in DEFAULT_TEMPLATES and isinstance(text, str)
+        }
+        self._compile_all()
 
-# === UTILITY FUNCTIONS ===
-def load_products():
-    try:
-        if not os.path.exists("products.json"):
-            with open("products.json", "w") as f:
-                json.dump([], f)
-            return []
-        
-        with open("products.json", "r") as f:
-            products = json.load(f)
-            return products
-    except Exception as e:
-        logger.error(f"Error loading products: {e}")
-        return []
+    def _load_snk(self):
+        self._signatures[self.snk_path] = self._signature(self.snk_path)
+        self._snk = SNK_DEFAULT
+        if self._signatures[self.snk_path] is None:
+            return
+        try:
+            with open(self.snk_path, "r") as f:
+                self._snk = f.read()
+        except Exception as e:
+            logger.error(f"Error loading SNK: {e}")
 
-def save_products(products):
-    try:
-        with open("products.json", "w") as f:
-            json.dump(products, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Error saving products: {e}")
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < TEMPLATE_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self._signature(self.path) != self._signatures.get(self.path):
+            self._load_templates()
+        if self._signature(self.snk_path) != self._signatures.get(self.snk_path):
+            self._load_snk()
 
-def load_snk():
-    try:
-        if not os.path.exists("snk.txt"):
-            return "Belum ada Syarat & Ketentuan yang ditetapkan."
-        with open("snk.txt", "r") as f:
-            return f.read()
-    except Exception as e:
-        logger.error(f"Error loading SNK: {e}")
-        return "Belum ada Syarat & Ketentuan yang ditetapkan."
+    def render(self, template, /, **values):
+        self._ensure_fresh()
+        out = []
+        for literal, field, spec, conversion in self._compiled[template]:
+            out.append(literal)
+            if field is not None:
+                value = values.get(field, "")
+                if conversion:
+                    value = TEMPLATE_FORMATTER.convert_field(value, conversion)
+                out.append(TEMPLATE_FORMATTER.format_field(value, spec))
+        return "".join(out)
+
+    def snk(self):
+        self._ensure_fresh()
+        return self._snk
+
+    def source(self, name):
+        return self.overrides.get(name, DEFAULT_TEMPLATES[name][0])
+
+    def _write(self, path, text):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        self._signatures[path] = self._signature(path)
+
+    def set_snk(self, text):
+        self._write(self.snk_path, text)
+        self._snk = text
+
+    def set_template(self, name, text):
+        """Simpan override template; ValueError jika field tidak dikenal/format salah."""
+        compiled = compile_template(text, DEFAULT_TEMPLATES[name][1])
+        overrides = dict(self.overrides, **{name: text})
+        self._write(self.path, json.dumps(overrides, indent=4, ensure_ascii=False))
+        self.overrides = overrides
+        self._compiled[name] = compiled
+
+    def reset_template(self, name):
+        overrides = {k: v for k, v in self.overrides.items() if k != name}
+        self._write(self.path, json.dumps(overrides, indent=4, ensure_ascii=False))
+        self.overrides = overrides
+        self._compiled[name] = compile_template(*DEFAULT_TEMPLATES[name])
+
+backups.ensure_intact(TEMPLATES_FILE, "json")
+templates = TemplateStore()
 
 # === ADMIN COMMANDS ===
 @dp.message(Command("admin"))
 async def admin_panel(message: types.Message):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         await message.answer("❌ Akses ditolak!")
         return
     
@@ -103,7 +2945,7 @@ async def admin_panel(message: types.Message):
 # === ADD PRODUCT FLOW ===
 @dp.message(F.text == "➕ Tambah Produk")
 async def add_product_start(message: types.Message, state: FSMContext):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         return
     
     await state.set_state(AddProductState.waiting_for_name)
@@ -123,7 +2965,12 @@ async def process_product_description(message: types.Message, state: FSMContext)
 
 @dp.message(AddProductState.waiting_for_price)
 async def process_product_price(message: types.Message, state: FSMContext):
-    await state.update_data(price=message.text)
+    price = parse_price(message.text or "")
+    if not price:
+        await message.answer("❌ Harga tidak valid! Contoh: Rp 50.000, 50rb, atau $4.99")
+        return
+    amount, currency = price
+    await state.update_data(price=format_price(amount, currency), price_amount=amount, currency=currency)
     await state.set_state(AddProductState.waiting_for_stock)
     await message.answer("Masukkan stok produk (angka):")
 
@@ -141,9 +2988,6 @@ async def process_product_stock(message: types.Message, state: FSMContext):
 async def process_product_file(message: types.Message, state: FSMContext):
     data = await state.get_data()
     
-    products = load_products()
-    new_id = max([p['id'] for p in products], default=0) + 1
-    
     file_id = None
     if message.document:
         file_id = message.document.file_id
@@ -151,16 +2995,16 @@ async def process_product_file(message: types.Message, state: FSMContext):
         file_id = message.photo[-1].file_id
     
     new_product = {
-        "id": new_id,
         "name": data['name'],
         "description": data['description'],
         "price": data['price'],
+        "price_amount": data['price_amount'],
+        "currency": data['currency'],
         "stock": data['stock'],
         "file_id": file_id
     }
     
-    products.append(new_product)
-    save_products(products)
+    store.add_product(new_product)
     
     await state.clear()
     await message.answer(f"✅ Produk {data['name']} berhasil ditambahkan!")
@@ -168,29 +3012,75 @@ async def process_product_file(message: types.Message, state: FSMContext):
 # === EDIT SNK ===
 @dp.message(F.text == "📝 Edit SNK")
 async def edit_snk_start(message: types.Message, state: FSMContext):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         return
     
     await message.answer(
         "Kirim teks Syarat & Ketentuan baru:\n"
-        f"SNK Saat Ini:\n{load_snk()}"
+        f"SNK Saat Ini:\n{templates.snk()}"
     )
-    await state.set_state("waiting_for_snk")
+    await state.set_state(SnkState.waiting_for_text)
 
-@dp.message(F.text, F.state == "waiting_for_snk")
+@dp.message(SnkState.waiting_for_text, F.text)
 async def save_snk(message: types.Message, state: FSMContext):
     try:
-        with open("snk.txt", "w") as f:
-            f.write(message.text)
+        templates.set_snk(message.text)
         await message.answer("✅ SNK berhasil diperbarui!")
         await state.clear()
     except Exception as e:
         await message.answer(f"❌ Gagal menyimpan SNK: {e}")
 
+# === EDIT TEMPLATE PESAN ===
+@dp.message(Command("template"))
+async def edit_template(message: types.Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    if not command.args:
+        text = "🧩 <b>Template Pesan</b>\n\n"
+        for name, (_, fields) in DEFAULT_TEMPLATES.items():
+            marker = "✏️" if name in templates.overrides else "▫️"
+            text += f"{marker} <code>{name}</code> {' '.join('{' + f + '}' for f in fields)}\n"
+        text += (
+            "\nLihat: /template nama\n"
+            "Ubah: /template nama teks baru\n"
+            "Kembalikan default: /template nama reset"
+        )
+        await message.answer(text, parse_mode=ParseMode.HTML)
+        return
+    
+    name, *rest = command.args.split(maxsplit=1)
+    source = rest[0] if rest else ""
+    if name not in DEFAULT_TEMPLATES:
+        await message.answer(f"❌ Template {name} tidak ada. Ketik /template untuk daftar.", parse_mode=None)
+        return
+    
+    if not source:
+        await message.answer(
+            f"🧩 Template {name}:\n\n{templates.source(name)}\n\n"
+            f"Field: {', '.join(DEFAULT_TEMPLATES[name][1]) or '-'}",
+            parse_mode=None
+        )
+        return
+    
+    try:
+        if source == "reset":
+            templates.reset_template(name)
+            await message.answer(f"✅ Template {name} dikembalikan ke default.", parse_mode=None)
+        else:
+            templates.set_template(name, source)
+            await message.answer(f"✅ Template {name} diperbarui.", parse_mode=None)
+    except ValueError as e:
+        await message.answer(f"❌ Template tidak valid: {e}", parse_mode=None)
+    except Exception as e:
+        logger.error(f"Error saving template {name}: {e}")
+        await message.answer(f"❌ Gagal menyimpan template: {e}", parse_mode=None)
+
 # === VIEW PRODUCTS ===
 @dp.message(F.text == "📊 Lihat Produk")
 async def view_products(message: types.Message):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         return
     
     products = load_products()
@@ -206,64 +3096,109 @@ async def view_products(message: types.Message):
 
 # === START COMMAND ===
 @dp.message(CommandStart())
-async def start(message: types.Message):
-    products = [p for p in load_products() if p['stock'] > 0]
+async def start(message: types.Message, command: CommandObject):
+    # Deep link dari hasil inline search: /start product_<id>
+    if command.args and command.args.startswith("product_") and command.args[8:].isdigit():
+        product = get_product(int(command.args[8:]))
+        if product:
+            text, markup = product_detail(product)
+            await message.answer(text, reply_markup=markup)
+            return
     
-    if not products:
-        await message.answer("😞 Maaf, stok produk sedang habis.")
-        return
+    markup, _ = storefront.page(0)
     
-    kb = InlineKeyboardBuilder()
-    for product in products:
-        kb.add(types.InlineKeyboardButton(
-            text=f"{product['name']} ({product['stock']})",
-            callback_data=f"product_{product['id']}"
-        ))
-    kb.adjust(2)
+    if not markup:
+        await message.answer(templates.render("out_of_stock"))
+        return
     
-    await message.answer(
-        "👋 Selamat datang di Toko Digital!\n"
-        "Silakan pilih produk yang tersedia:",
-        reply_markup=kb.as_markup()
-    )
+    await message.answer(templates.render("welcome"), reply_markup=markup)
 
-# === SHOW PRODUCT DETAIL ===
-@dp.callback_query(F.data.startswith("product_"))
-async def show_product(callback: types.CallbackQuery):
-    product_id = int(callback.data.split("_")[1])
-    product = next((p for p in load_products() if p["id"] == product_id), None)
+@dp.callback_query(F.data.startswith("shop_page_"))
+async def show_shop_page(callback: types.CallbackQuery):
+    markup, _ = storefront.page(int(callback.data.split("_")[2]))
     
-    if not product:
-        await callback.message.answer("Produk tidak ditemukan.")
+    if not markup:
+        await callback.answer(templates.render("out_of_stock"), show_alert=True)
         return
     
-    text = (
-        f"📛 <b>{product['name']}</b>\n\n"
-        f"📝 Deskripsi:\n{product['description']}\n\n"
-        f"💵 Harga: {product['price']}\n"
-        f"🛒 Stok: {product['stock']}\n\n"
-        "Jika berminat, klik tombol di bawah 👇"
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
+@dp.callback_query(F.data == "shop_noop")
+async def shop_noop(callback: types.CallbackQuery):
+    await callback.answer()
+
+# === SHOW PRODUCT DETAIL ===
+def product_detail(product):
+    text = templates.render(
+        "product_detail",
+        name=product['name'], description=product['description'], price=product['price'], stock=product['stock']
     )
     
     kb = InlineKeyboardBuilder()
     kb.add(types.InlineKeyboardButton(
         text="✅ Beli Sekarang",
-        callback_data=f"order_{product_id}"
+        callback_data=f"order_{product['id']}"
     ))
     kb.add(types.InlineKeyboardButton(
         text="📜 Syarat & Ketentuan",
         callback_data="show_snk"
     ))
     kb.adjust(1)
+    return text, kb.as_markup()
+
+@dp.callback_query(F.data.startswith("product_"))
+async def show_product(callback: types.CallbackQuery):
+    product_id = int(callback.data.split("_")[1])
+    product = get_product(product_id)
+    
+    if not product:
+        await callback.message.answer("Produk tidak ditemukan.")
+        return
+    
+    text, markup = product_detail(product)
+    await callback.message.edit_text(text, reply_markup=markup)
+
+# === INLINE SEARCH ===
+@dp.inline_query()
+async def inline_search(inline_query: types.InlineQuery):
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    products, next_offset = product_search.search(inline_query.query, offset)
+    username = (await bot.me()).username
+    
+    results = []
+    for product in products:
+        description = product.get("description") or ""
+        if len(description) > 200:
+            description = description[:200] + "…"
+        results.append(types.InlineQueryResultArticle(
+            id=str(product["id"]),
+            title=product["name"],
+            description=f"{product['price']} • Stok: {product['stock']}",
+            input_message_content=types.InputTextMessageContent(
+                message_text=(
+                    f"📛 <b>{product['name']}</b>\n\n"
+                    f"{description}\n\n"
+                    f"💵 Harga: {product['price']}"
+                ),
+                parse_mode=ParseMode.HTML
+            ),
+            reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[
+                types.InlineKeyboardButton(text="🛒 Beli di bot", url=f"https://t.me/{username}?start=product_{product['id']}")
+            ]])
+        ))
     
-    await callback.message.edit_text(text, reply_markup=kb.as_markup())
+    await inline_query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        next_offset=str(next_offset) if next_offset is not None else ""
+    )
 
 # === SHOW SNK ===
 @dp.callback_query(F.data == "show_snk")
 async def show_snk(callback: types.CallbackQuery):
-    snk_text = load_snk()
     await callback.message.answer(
-        f"📜 <b>Syarat & Ketentuan</b>\n\n{snk_text}",
+        templates.render("snk", snk=templates.snk()),
         reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[
             types.InlineKeyboardButton(text="🔙 Kembali", callback_data="back_to_menu")
         ]])
@@ -273,7 +3208,7 @@ async def show_snk(callback: types.CallbackQuery):
 @dp.callback_query(F.data.startswith("order_"))
 async def order_product(callback: types.CallbackQuery, state: FSMContext):
     product_id = int(callback.data.split("_")[1])
-    product = next((p for p in load_products() if p["id"] == product_id), None)
+    product = get_product(product_id)
     
     if not product:
         await callback.message.answer("Produk tidak ditemukan.")
@@ -283,20 +3218,66 @@ async def order_product(callback: types.CallbackQuery, state: FSMContext):
         await callback.message.answer("Maaf, stok produk ini habis.")
         return
     
-    await state.set_state(OrderState.waiting_for_payment)
+    await state.set_state(OrderState.waiting_for_quantity)
     await state.update_data(product_id=product_id, user_id=callback.from_user.id)
     
-    payment_text = (
-        f"📌 Kamu memesan <b>{product['name']}</b>\n"
-        f"💵 Harga: {product['price']}\n\n"
-        "Silakan transfer ke:\n\n"
-        "<b>BCA 123456789 a.n. Toko Digital</b>\n"
-        "atau Dana: 08123456789\n\n"
-        "Setelah transfer, kirim bukti transfer di sini."
+    kb = InlineKeyboardBuilder()
+    for quantity in ORDER_QUANTITY_PRESETS:
+        if quantity <= product['stock']:
+            kb.button(text=str(quantity), callback_data=f"qty_{product_id}_{quantity}")
+    kb.adjust(len(ORDER_QUANTITY_PRESETS))
+    
+    await callback.message.answer(
+        templates.render("order_quantity", name=product['name'], price=product['price'], stock=product['stock']),
+        reply_markup=kb.as_markup()
     )
+
+def order_total(product, quantity):
+    price = product_price(product)
+    if not price:
+        return product['price'] if quantity == 1 else f"{quantity} × {product['price']}"
+    amount, currency = price
+    return format_price(amount * quantity, currency)
+
+async def confirm_quantity(message, state, product_id, quantity):
+    """Validasi jumlah lalu tampilkan instruksi pembayaran dengan total harga."""
+    product = get_product(product_id)
+    if not product:
+        await message.answer("Produk tidak ditemukan.")
+        await state.clear()
+        return
+    if quantity < 1 or quantity > MAX_ORDER_QUANTITY:
+        await message.answer(f"❌ Jumlah harus antara 1 dan {MAX_ORDER_QUANTITY}.")
+        return
+    if quantity > product['stock']:
+        await message.answer(f"❌ Stok tidak cukup. Stok tersedia: {product['stock']}")
+        return
+    
+    await state.set_state(OrderState.waiting_for_payment)
+    await state.update_data(quantity=quantity)
     
-    await callback.message.answer(payment_text)
-    await callback.message.answer("📤 Kirim bukti transfer sekarang (foto/screenshot):")
+    await message.answer(templates.render(
+        "payment_instructions", name=product['name'], quantity=quantity, total=order_total(product, quantity)
+    ))
+    await message.answer(templates.render("payment_prompt"))
+
+@dp.callback_query(OrderState.waiting_for_quantity, F.data.startswith("qty_"))
+async def select_quantity(callback: types.CallbackQuery, state: FSMContext):
+    _, product_id, quantity = callback.data.split("_")
+    data = await state.get_data()
+    if data.get('product_id') != int(product_id):
+        await callback.answer("⚠️ Pesanan ini sudah tidak aktif.", show_alert=True)
+        return
+    await callback.answer()
+    await confirm_quantity(callback.message, state, int(product_id), int(quantity))
+
+@dp.message(OrderState.waiting_for_quantity, F.text)
+async def input_quantity(message: types.Message, state: FSMContext):
+    if not message.text.strip().isdigit():
+        await message.answer("Harap masukkan jumlah berupa angka!")
+        return
+    data = await state.get_data()
+    await confirm_quantity(message, state, data['product_id'], int(message.text.strip()))
 
 # === PAYMENT PROOF HANDLER ===
 @dp.message(OrderState.waiting_for_payment, F.photo | F.document)
@@ -304,8 +3285,9 @@ async def handle_payment_proof(message: types.Message, state: FSMContext):
     data = await state.get_data()
     product_id = data['product_id']
     user_id = data['user_id']
+    quantity = data.get('quantity', 1)
     
-    product = next((p for p in load_products() if p["id"] == product_id), None)
+    product = get_product(product_id)
     if not product:
         await message.answer("Produk tidak ditemukan.")
         await state.clear()
@@ -318,12 +3300,30 @@ async def handle_payment_proof(message: types.Message, state: FSMContext):
     elif message.document:
         file_id = message.document.file_id
     
-    # Send to admin
+    # Catat order di ledger; callback admin hanya membawa ID order.
+    # Harga ikut disimpan agar statistik tidak berubah jika harga produk diedit sebelum verifikasi.
+    price = product_price(product)
+    order = orders.create(
+        user_id=user_id,
+        product_id=product_id,
+        product_name=product['name'],
+        price=order_total(product, quantity),
+        price_amount=price[0] * quantity if price else None,
+        currency=price[1] if price else None,
+        quantity=quantity,
+        proof_file_id=file_id,
+        proof_type="photo" if message.photo else "document" if message.document else None,
+        buyer_name=message.from_user.full_name,
+        buyer_username=message.from_user.username
+    )
+    
     admin_caption = (
         f"🧾 <b>Bukti Pembayaran Baru</b>\n\n"
+        f"🧾 Order: <code>#{order['code']}</code>\n"
         f"🆔 Produk ID: {product_id}\n"
         f"📛 Produk: {product['name']}\n"
-        f"💵 Harga: {product['price']}\n\n"
+        f"📦 Jumlah: {quantity} akun\n"
+        f"💵 Total: {order['price']}\n\n"
         f"👤 Pembeli: <a href='tg://user?id={user_id}'>{message.from_user.full_name}</a>\n"
         f"📱 Username: @{message.from_user.username or 'N/A'}\n"
         f"🆔 User ID: <code>{user_id}</code>"
@@ -332,100 +3332,124 @@ async def handle_payment_proof(message: types.Message, state: FSMContext):
     admin_kb = InlineKeyboardBuilder()
     admin_kb.add(types.InlineKeyboardButton(
         text="✅ Verifikasi",
-        callback_data=f"verify_{user_id}_{product_id}"
+        callback_data=f"verify_{order['code']}"
     ))
     admin_kb.add(types.InlineKeyboardButton(
         text="❌ Tolak",
-        callback_data=f"reject_{user_id}"
+        callback_data=f"reject_{order['code']}"
     ))
     
-    if file_id:
-        if message.photo:
-            await bot.send_photo(
-                chat_id=ADMIN_ID,
-                photo=file_id,
-                caption=admin_caption,
-                reply_markup=admin_kb.as_markup()
-            )
+    async def send_to_admin(admin_id):
+        if file_id:
+            if message.photo:
+                await bot.send_photo(
+                    chat_id=admin_id,
+                    photo=file_id,
+                    caption=admin_caption,
+                    reply_markup=admin_kb.as_markup()
+                )
+            else:
+                await bot.send_document(
+                    chat_id=admin_id,
+                    document=file_id,
+                    caption=admin_caption,
+                    reply_markup=admin_kb.as_markup()
+                )
         else:
-            await bot.send_document(
-                chat_id=ADMIN_ID,
-                document=file_id,
-                caption=admin_caption,
+            await bot.send_message(
+                chat_id=admin_id,
+                text=admin_caption + "\n\n⚠️ Tidak ada bukti transfer terlampir!",
                 reply_markup=admin_kb.as_markup()
             )
-    else:
-        await bot.send_message(
-            chat_id=ADMIN_ID,
-            text=admin_caption + "\n\n⚠️ Tidak ada bukti transfer terlampir!",
-            reply_markup=admin_kb.as_markup()
-        )
     
-    await message.answer(
-        "✅ Bukti pembayaran telah dikirim ke admin. "
-        "Tunggu verifikasi dalam 1x24 jam.\n\n"
-        "Jika ada pertanyaan, hubungi @admin"
-    )
+    # Kirim ke admin online yang bebannya paling ringan (hanya notifikasi, bukan klaim);
+    # jika gagal (admin memblokir bot, error jaringan) coba admin berikutnya
+    failed = set()
+    while True:
+        admin_id = admin_router.assign(order['id'], exclude=failed)
+        if admin_id is None:
+            break
+        try:
+            await send_to_admin(admin_id)
+            break
+        except Exception as e:
+            logger.error(f"Gagal meneruskan bukti order #{order['code']} ke admin {admin_id}: {e}")
+            failed.add(admin_id)
+    
     await state.clear()
+    if admin_id is None:
+        # Order tetap pending di /antrian; pembeli tidak perlu (dan jangan) mengirim bukti ulang
+        orders.update(order['id'], assigned_to=None)
+        await message.answer(
+            f"⚠️ Bukti transfer tersimpan sebagai order #{order['code']}, tetapi admin belum bisa "
+            "dihubungi saat ini. Order Anda tetap di antrean dan akan diproses; jika belum ada kabar, "
+            f"hubungi @admin dengan menyebut #{order['code']}."
+        )
+        return
+    
+    await message.answer(templates.render("proof_received", order_code=order['code']))
 
 # === ADMIN VERIFICATION ===
 @dp.callback_query(F.data.startswith("verify_"))
 @dp.callback_query(F.data.startswith("verify_"))
+@with_priority(PRIORITY_DELIVERY)
 async def verify_payment(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id, ROLE_VERIFIER):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
+    
     try:
-        _, user_id, product_id = callback.data.split("_")
-        user_id = int(user_id)
-        product_id = int(product_id)
+        order_id = orders.parse_id(callback.data.split("_", 1)[1])
+        order = orders.get(order_id) if order_id is not None else None
+        
+        if not order:
+            await callback.answer(
+                "⚠️ Order tidak ditemukan (pesan versi lama?). Gunakan /kirimulang <user_id> <product_id>",
+                show_alert=True
+            )
+            return
+        
+        if not await claim_order(callback, order):
+            return
+        
+        # Klaim order: tap ganda atau bukti yang sama tidak bisa diverifikasi dua kali
+        if not orders.transition(order_id, ORDER_PENDING, ORDER_VERIFIED):
+            await callback.answer(f"⚠️ Order #{order['code']} sudah {order['status']}.", show_alert=True)
+            return
+        
+        user_id = order["user_id"]
+        product_id = order["product_id"]
         
         # Memberitahu admin bahwa proses verifikasi sedang berjalan
         await callback.answer("Memproses verifikasi...")
         
-        products = load_products()
-        product = next((p for p in products if p["id"] == product_id), None)
+        product = get_product(product_id)
         
         if not product:
+            orders.transition(order_id, ORDER_VERIFIED, ORDER_PENDING, claimed_by=None, claimed_at=None)
             await callback.message.reply("❌ Produk tidak ditemukan!")
             return
         
-        # Periksa ketersediaan akun
-        if "accounts" not in product or not product["accounts"]:
+        # Ambil semua akun order sekaligus (semua-atau-tidak; stok ikut diperbarui oleh store)
+        accounts = await inventory.take(product_id, order["quantity"])
+        if not accounts:
+            # Kembalikan ke antrean agar bisa diverifikasi setelah restock
+            orders.transition(order_id, ORDER_VERIFIED, ORDER_PENDING, claimed_by=None, claimed_at=None)
             await callback.message.reply(
-                "❌ Tidak ada akun tersedia untuk produk ini.\n"
+                f"❌ Akun tersedia kurang dari {order['quantity']} untuk produk ini.\n"
                 "Silakan tambahkan akun terlebih dahulu dengan /restock"
             )
             return
+        orders.update(order_id, accounts=accounts)
+        record_sale(product_id, [(order, len(accounts))])
         
-        # Ambil akun pertama
-        account = product["accounts"].pop(0)
-        
-        # Update stok produk berdasarkan jumlah akun yang tersisa
-        product["stock"] = len(product["accounts"])
-        
-        # Simpan perubahan
-        save_products(products)
-        
-        # Buat pesan konfirmasi untuk pengguna
-        confirmation_text = (
-            f"🎉 Pembayaran diverifikasi!\n\n"
-            f"📛 Produk: {product['name']}\n"
-            f"💵 Harga: {product['price']}\n\n"
-            f"🔑 Login details:\n"
-            f"👤 Username: <code>{account['username']}</code>\n"
-            f"🔒 Password: <code>{account['password']}</code>\n\n"
-            "⚠️ Jangan bagikan data login ke siapapun!"
-        )
-        
-        # Kirim pesan konfirmasi ke pengguna
-        sent_message = await bot.send_message(
-            chat_id=user_id,
-            text=confirmation_text,
-            parse_mode=ParseMode.HTML
-        )
+        # Kirim detail login ke pengguna (file CSV jika jumlahnya besar)
+        await deliver_credentials(user_id, product, accounts)
         
         # Beri tahu admin bahwa konfirmasi berhasil dikirim
         admin_response = (
-            f"✅ Akun berhasil dikirim ke user!\n"
-            f"🔸 Sisa akun: {len(product['accounts'])}\n"
+            f"✅ {len(accounts)} akun order #{order['code']} berhasil dikirim ke user!\n"
+            f"🔸 Sisa akun: {store.count_accounts(product_id)}\n"
             f"🔸 Stok diperbarui: {product['stock']}"
         )
         
@@ -435,25 +3459,7 @@ async def verify_payment(callback: types.CallbackQuery):
         # Kirim file produk ke pengguna jika ada
         if product['file_id']:
             try:
-                # Teks caption untuk file
-                caption_text = (
-                    f"📦 Produk Anda: {product['name']}\n"
-                    f"Terima kasih telah berbelanja!"
-                )
-                
-                # Kirim file sesuai tipenya
-                if product['file_id'].startswith("AgAC"):  # Photo
-                    await bot.send_photo(
-                        chat_id=user_id,
-                        photo=product['file_id'],
-                        caption=caption_text
-                    )
-                else:  # Document
-                    await bot.send_document(
-                        chat_id=user_id,
-                        document=product['file_id'],
-                        caption=caption_text
-                    )
+                await deliver_product_file(user_id, product)
                 
                 # Beri tahu admin bahwa file berhasil dikirim
                 await callback.message.reply("✅ File produk berhasil dikirim ke user!")
@@ -469,24 +3475,57 @@ async def verify_payment(callback: types.CallbackQuery):
     except Exception as e:
         logger.error(f"Error dalam proses verifikasi: {e}")
         error_message = f"❌ Terjadi kesalahan dalam proses verifikasi: {str(e)}"
-        if 'user_id' in locals() and 'account' in locals() and account:
-            error_message += f"\nKirim manual: {account['username']}:{account['password']} ke user ID: {user_id}"
+        if 'user_id' in locals() and 'accounts' in locals() and accounts:
+            credentials_text = ", ".join(f"{a['username']}:{a['password']}" for a in accounts[:BULK_REPORT_LIMIT])
+            if len(accounts) > BULK_REPORT_LIMIT:
+                credentials_text += f", ... (+{len(accounts) - BULK_REPORT_LIMIT}, lihat order #{order['code']})"
+            error_message += f"\nKirim manual: {credentials_text} ke user ID: {user_id}"
         await callback.message.reply(error_message)
 
+async def claim_order(callback, order):
+    """Klaim order untuk admin yang menekan tombol; False (dan beri tahu) jika dipegang admin lain."""
+    if order["status"] != ORDER_PENDING or orders.claim(order["id"], callback.from_user.id):
+        return True
+    holder = OrderLedger.claim_holder(orders.get(order["id"]) or order)
+    if holder is None:
+        # Klaim dilepas/kedaluwarsa di antara dua query atau status berubah; biarkan transition yang memutuskan
+        return True
+    await callback.answer(f"🔒 Order #{order['code']} sedang ditangani admin {holder}.", show_alert=True)
+    return False
+
 # === ADMIN REJECT ===
 @dp.callback_query(F.data.startswith("reject_"))
 async def reject_payment(callback: types.CallbackQuery):
-    user_id = int(callback.data.split("_")[1])
+    if not is_admin(callback.from_user.id, ROLE_VERIFIER):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
+    
+    order_id = orders.parse_id(callback.data.split("_", 1)[1])
+    order = orders.get(order_id) if order_id is not None else None
+    
+    if not order:
+        await callback.answer("⚠️ Order tidak ditemukan.", show_alert=True)
+        return
+    
+    if not await claim_order(callback, order):
+        return
+    
+    if not orders.transition(order_id, ORDER_PENDING, ORDER_REJECTED):
+        await callback.answer(f"⚠️ Order #{order['code']} sudah {order['status']}.", show_alert=True)
+        return
+    
+    user_id = order["user_id"]
     
     try:
         await bot.send_message(
             chat_id=user_id,
-            text="❌ Maaf, pembayaran Anda ditolak oleh admin.\n"
+            text=f"❌ Maaf, pembayaran Anda untuk order #{order['code']} ditolak oleh admin.\n"
                  "Silakan hubungi @admin untuk informasi lebih lanjut."
         )
-        await callback.message.edit_text(
-            "❌ Pembayaran telah ditolak dan user telah diberitahu.",
-            reply_markup=None
+        # Pesan admin bisa berupa foto/dokumen, jadi cukup lepas tombolnya
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.message.reply(
+            f"❌ Order #{order['code']} telah ditolak dan user telah diberitahu."
         )
     except Exception as e:
         logger.error(f"Error rejecting payment: {e}")
@@ -494,10 +3533,196 @@ async def reject_payment(callback: types.CallbackQuery):
             f"Gagal mengirim notifikasi ke user. Silakan hubungi manual: {user_id}"
         )
 
+# === ANTREAN ORDER === #
+@dp.message(Command("antrian"))
+async def pending_orders(message: types.Message):
+    if not is_admin(message.from_user.id, ROLE_VERIFIER):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    text, markup = render_pending_orders(0)
+    await message.answer(text, reply_markup=markup, parse_mode=ParseMode.HTML)
+
+@dp.callback_query(F.data.startswith("antrian_"))
+async def pending_orders_page(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id, ROLE_VERIFIER):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
+    text, markup = render_pending_orders(int(callback.data.split("_")[1]))
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
+    await callback.answer()
+
+def render_pending_orders(page):
+    total = orders.count_by_status(ORDER_PENDING)
+    if not total:
+        return "✅ Tidak ada order yang menunggu verifikasi.", None
+    
+    pages = -(-total // ORDER_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    pending = orders.list_by_status(ORDER_PENDING, ORDER_PAGE_SIZE, page * ORDER_PAGE_SIZE)
+    
+    text = f"🧾 <b>Order Menunggu Verifikasi</b> ({total})\n\n"
+    builder = InlineKeyboardBuilder()
+    now = time.time()
+    for order in pending:
+        waited = int((now - order["created_at"]) // 60)
+        quantity = f" ×{order['quantity']}" if order["quantity"] > 1 else ""
+        holder = OrderLedger.claim_holder(order, now)
+        claimed = f" • 🔒 <code>{holder}</code>" if holder is not None else ""
+        text += (
+            f"<code>#{order['code']}</code> • {order['product_name']}{quantity} • {order['price']}\n"
+            f"   👤 {order['buyer_name'] or '-'} (<code>{order['user_id']}</code>) • {waited} menit lalu{claimed}\n"
+        )
+        builder.button(text=f"✅ #{order['code']}", callback_data=f"verify_{order['code']}")
+        builder.button(text=f"❌ #{order['code']}", callback_data=f"reject_{order['code']}")
+    builder.adjust(2)
+    
+    if pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(types.InlineKeyboardButton(text="⬅️ Sebelumnya", callback_data=f"antrian_{page - 1}"))
+        nav.append(types.InlineKeyboardButton(text=f"📄 {page + 1}/{pages}", callback_data="shop_noop"))
+        if page < pages - 1:
+            nav.append(types.InlineKeyboardButton(text="Berikutnya ➡️", callback_data=f"antrian_{page + 1}"))
+        builder.row(*nav)
+    
+    return text, builder.as_markup()
+
+# === ADMIN ONLINE === #
+@dp.message(Command("online", "offline"))
+async def set_admin_online(message: types.Message, command: CommandObject):
+    if not is_admin(message.from_user.id, ROLE_VERIFIER):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    online = command.command == "online"
+    admin_router.set_online(message.from_user.id, online)
+    if online:
+        await message.answer("🟢 Anda online. Bukti transfer baru akan dibagikan ke Anda.")
+        return
+    # Order yang sedang dipegang dilepas agar bisa diambil admin lain
+    released = orders.release_claims(message.from_user.id)
+    await message.answer(
+        "⚪ Anda offline. Bukti transfer baru tidak akan dikirim ke Anda.\n"
+        f"🔸 Klaim dilepas: {released} order (lihat /antrian)"
+    )
+
+@dp.message(Command("daftaradmin"))
+async def list_admins(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    text = f"👥 <b>Daftar Admin</b> (pembagian: {admin_router.strategy})\n\n"
+    for admin_id, (online, pending) in admin_router.status().items():
+        text += (
+            f"{'🟢' if online else '⚪'} <code>{admin_id}</code> • {ADMIN_ROLES[admin_id]} • "
+            f"{pending} order ditugaskan\n"
+        )
+    await message.answer(text, parse_mode=ParseMode.HTML)
+
+# === VERIFIKASI MASSAL === #
+@dp.message(Command("verifsemua"))
+@with_priority(PRIORITY_DELIVERY)
+async def bulk_verify(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    args = message.text.split()[1:]
+    if args and all(arg.startswith("#") for arg in args):
+        selected = [orders.get(orders.parse_id(arg)) for arg in args]
+        targets = [o for o in selected if o and o["status"] == ORDER_PENDING]
+    elif len(args) == 1 and args[0].isdigit():
+        targets = orders.list_pending_for_product(int(args[0]))
+    else:
+        await message.answer(
+            "❌ Format salah!\n\n"
+            "Gunakan: /verifsemua <product_id> (semua order pending produk itu)\n"
+            "atau: /verifsemua #ID1 #ID2 ... (order tertentu)"
+        )
+        return
+    
+    if not targets:
+        await message.answer("✅ Tidak ada order pending yang cocok.")
+        return
+    
+    status = await message.answer(f"⏳ Memverifikasi {len(targets)} order...")
+    report = await verify_orders(targets, message.from_user.id)
+    
+    text = (
+        "📋 <b>Laporan Verifikasi Massal</b>\n\n"
+        f"🔸 Diproses: {len(targets)} order\n"
+        f"🔸 Terverifikasi & terkirim: {report['delivered']}\n"
+    )
+    if report["skipped"]:
+        text += f"🔸 Dilewati (sudah diproses/diklaim admin lain): {report['skipped']}\n"
+    if report["no_stock"]:
+        text += f"🔸 Kembali ke antrean (stok kurang): {len(report['no_stock'])} — {format_order_codes(report['no_stock'])}\n"
+    if report["failed"]:
+        text += f"\n❌ Gagal kirim ({len(report['failed'])}), kirim manual:\n"
+        for order, accounts in report["failed"][:BULK_REPORT_LIMIT]:
+            credentials_text = ", ".join(f"{a['username']}:{a['password']}" for a in accounts)
+            text += f"<code>#{order['code']}</code> → <code>{order['user_id']}</code>: <code>{credentials_text}</code>\n"
+        if len(report["failed"]) > BULK_REPORT_LIMIT:
+            text += f"... dan {len(report['failed']) - BULK_REPORT_LIMIT} lainnya (lihat log)\n"
+    
+    await status.edit_text(text, parse_mode=ParseMode.HTML)
+
+def format_order_codes(order_list):
+    codes = [f"#{o['code']}" for o in order_list[:BULK_REPORT_LIMIT]]
+    if len(order_list) > BULK_REPORT_LIMIT:
+        codes.append("...")
+    return ", ".join(codes)
+
+async def verify_orders(targets, admin_id):
+    """Verifikasi banyak order: satu alokasi akun per produk, pengiriman paralel terbatas.
+
+    Order yang sedang diklaim admin lain dilewati.
+    """
+    report = {"delivered": 0, "skipped": 0, "no_stock": [], "failed": []}
+    
+    by_product = {}
+    for order in targets:
+        if orders.claim(order["id"], admin_id) and orders.transition(order["id"], ORDER_PENDING, ORDER_VERIFIED):
+            by_product.setdefault(order["product_id"], []).append(order)
+        else:
+            report["skipped"] += 1
+    
+    deliveries = []
+    for product_id, group in by_product.items():
+        product = get_product(product_id)
+        allocations = await inventory.take_many(product_id, [o["quantity"] for o in group]) if product else []
+        with orders.batch():
+            for order, accounts in zip(group, allocations):
+                orders.update(order["id"], accounts=accounts)
+                deliveries.append((order, product, accounts))
+            for order in group[len(allocations):]:
+                orders.transition(order["id"], ORDER_VERIFIED, ORDER_PENDING, claimed_by=None, claimed_at=None)
+                report["no_stock"].append(order)
+        if allocations:
+            record_sale(product_id, [(order, len(accounts)) for order, accounts in zip(group, allocations)])
+    
+    semaphore = asyncio.Semaphore(BULK_DELIVERY_CONCURRENCY)
+    
+    async def deliver(order, product, accounts):
+        async with semaphore:
+            try:
+                await deliver_accounts(order["user_id"], product, accounts)
+                return None
+            except Exception as e:
+                logger.error(f"Gagal mengirim order #{order['code']} ke {order['user_id']}: {e}")
+                return order, accounts
+    
+    results = await asyncio.gather(*(deliver(*d) for d in deliveries))
+    report["failed"] = [r for r in results if r]
+    report["delivered"] = len(deliveries) - len(report["failed"])
+    return report
+
 # === RESTOK AKUN === #
 @dp.message(F.text == "📦 Restock")
 async def restock_start(message: types.Message, state: FSMContext):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         return
     
     products = load_products()
@@ -509,7 +3734,7 @@ async def restock_start(message: types.Message, state: FSMContext):
     builder = InlineKeyboardBuilder()
     for product in products:
         # Tampilkan info stok akun
-        account_count = len(product.get('accounts', []))
+        account_count = store.count_accounts(product['id'])
         builder.button(
             text=f"{product['name']} (Stok: {product['stock']}, Akun: {account_count})", 
             callback_data=f"restock_{product['id']}"
@@ -520,8 +3745,12 @@ async def restock_start(message: types.Message, state: FSMContext):
 
 @dp.callback_query(F.data.startswith("restock_"))
 async def select_restock_method(callback: types.CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
+    
     product_id = int(callback.data.split("_")[1])
-    product = next((p for p in load_products() if p["id"] == product_id), None)
+    product = get_product(product_id)
     
     if not product:
         await callback.answer("❌ Produk tidak ditemukan!")
@@ -531,7 +3760,7 @@ async def select_restock_method(callback: types.CallbackQuery, state: FSMContext
     await state.update_data(product_id=product_id)
     
     current_stock = product.get('stock', 0)
-    current_accounts = len(product.get('accounts', []))
+    current_accounts = store.count_accounts(product_id)
     
     await callback.message.edit_text(
         f"📥 Restock {product['name']}\n\n"
@@ -542,17 +3771,114 @@ async def select_restock_method(callback: types.CallbackQuery, state: FSMContext
         "<code>username2:password2</code>\n\n"
         "Contoh:\n"
         "<code>spotifyuser:spotifypass123</code>\n"
-        "<code>premiumacc:password456</code>",
+        "<code>premiumacc:password456</code>\n\n"
+        "📎 Untuk jumlah besar, kirim file .txt (satu akun per baris) "
+        "atau .csv (kolom username,password).",
         parse_mode=ParseMode.HTML
     )
 
+@dp.message(RestockState.input_accounts, F.document)
+async def process_restock_file(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    product_id = data["product_id"]
+    
+    product = get_product(product_id)
+    
+    if not product:
+        await message.answer("❌ Produk tidak ditemukan!")
+        await state.clear()
+        return
+    
+    document = message.document
+    if document.file_size and document.file_size > MAX_DOWNLOAD_SIZE:
+        await message.answer("❌ File terlalu besar! Maksimal 20 MB, pecah menjadi beberapa file.")
+        return
+    
+    csv_format = (document.file_name or "").lower().endswith(".csv")
+    status = await message.answer("⏳ Mengunduh dan memproses file...")
+    
+    # File dibaca per potongan dan akun valid disimpan per RESTOCK_BATCH_SIZE,
+    # jadi memori tidak bergantung pada ukuran file. Duplikat antar batch
+    # terhitung "sudah di stok" karena batch sebelumnya sudah tersimpan.
+    batch = []
+    report = {"added": 0, "in_stock": 0, "sold": 0, "in_batch": 0, "total": 0}
+    valid_count = 0
+    line_count = 0
+    invalid_count = 0
+    invalid_lines = []
+    last_report = time.monotonic()
+    
+    async def add_batch():
+        batch_report = await inventory.add(product_id, batch)
+        for key in report:
+            report[key] = batch_report[key] if key == "total" else report[key] + batch_report[key]
+        batch.clear()
+    
+    try:
+        async for line in iter_document_lines(document):
+            line_count += 1
+            if not line.strip():
+                continue
+            
+            # Lewati header CSV (username,password)
+            if csv_format and not valid_count and not invalid_count and line.strip().lower().startswith("username,"):
+                continue
+            
+            account = parse_account_line(line, csv_format)
+            if account is None:
+                invalid_count += 1
+                if len(invalid_lines) < 10:
+                    invalid_lines.append(str(line_count))
+                continue
+            batch.append(account)
+            valid_count += 1
+            if len(batch) >= RESTOCK_BATCH_SIZE:
+                await add_batch()
+            
+            if time.monotonic() - last_report >= RESTOCK_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await status.edit_text(
+                    f"⏳ Memproses file... {line_count} baris dibaca, "
+                    f"{valid_count} akun valid, {invalid_count} tidak valid"
+                )
+        if batch:
+            await add_batch()
+    except Exception as e:
+        logger.error(f"Error membaca file restock: {e}")
+        await status.edit_text(
+            f"❌ Gagal membaca file: {e}\n"
+            f"🔸 Akun yang sudah tersimpan sebelum error: {report['added']}"
+        )
+        return
+    
+    invalid_text = f"🔸 Baris tidak valid: {invalid_count}"
+    if invalid_lines:
+        invalid_text += f" (baris {', '.join(invalid_lines)}{', ...' if invalid_count > len(invalid_lines) else ''})"
+    
+    if not valid_count:
+        await status.edit_text(
+            "❌ Tidak ada akun valid di file!\n"
+            f"{invalid_text}\n\n"
+            "Gunakan username:password (.txt) atau username,password (.csv), satu akun per baris."
+        )
+        return
+    
+    await status.edit_text(
+        f"✅ {report['added']} akun dari file berhasil ditambahkan ke {product['name']}!\n"
+        f"🔸 Baris dibaca: {line_count}\n"
+        f"{invalid_text}\n"
+        f"{format_restock_report(report)}\n"
+        f"🔸 Total akun: {report['total']}\n"
+        f"🔸 Stok diperbarui menjadi: {product['stock']}"
+    )
+    await state.clear()
+
 @dp.message(RestockState.input_accounts)
 async def process_restock(message: types.Message, state: FSMContext):
     data = await state.get_data()
     product_id = data["product_id"]
     
-    products = load_products()
-    product = next((p for p in products if p["id"] == product_id), None)
+    product = get_product(product_id)
     
     if not product:
         await message.answer("❌ Produk tidak ditemukan!")
@@ -575,38 +3901,316 @@ async def process_restock(message: types.Message, state: FSMContext):
 
     # Parsing akun
     for line in raw_lines:
-        line = line.strip()
-        if ":" in line:
-            username, password = line.split(":", 1)
-            accounts.append({"username": username.strip(), "password": password.strip()})
+        account = parse_account_line(line)
+        if account:
+            accounts.append(account)
 
     # Validasi apakah ada akun
     if not accounts:
         await message.answer("❌ Format salah! Gunakan username:password, pisahkan dengan baris atau koma.")
         return
     
-    # Tambahkan ke produk
-    if "accounts" not in product:
-        product["accounts"] = []
+    # Tambahkan ke produk (stok ikut disesuaikan dengan jumlah akun)
+    report = await inventory.add(product_id, accounts)
+    
+    await message.answer(
+        f"✅ {report['added']} akun berhasil ditambahkan ke {product['name']}!\n"
+        f"{format_restock_report(report)}\n"
+        f"🔸 Total akun: {report['total']}\n"
+        f"🔸 Stok diperbarui menjadi: {product['stock']}"
+    )
+    await state.clear()
+    
+# === IMPOR / EKSPOR KATALOG === #
+# Kolom file katalog; ekspor dengan akun menambah baris akun (id, username, password)
+CATALOG_FIELDS = ("id", "name", "description", "price", "currency", "stock", "low_stock_threshold", "file_id")
+CATALOG_ACCOUNT_FIELDS = ("username", "password")
+CATALOG_REPORT_LIMIT = 10
+# Baris ekspor yang dikumpulkan sebelum ditulis ke file di thread lain
+CATALOG_EXPORT_CHUNK = 5000
+
+def catalog_row(product):
+    row = {field: product.get(field) for field in CATALOG_FIELDS}
+    price = product_price(product)
+    row["currency"] = price[1] if price else None
+    return row
+
+async def write_catalog_export(f, fmt, with_accounts):
+    """Tulis katalog ke file terbuka per potongan CATALOG_EXPORT_CHUNK baris.
+
+    Baris (dan akun, per halaman id) diambil dari store di event loop;
+    serialisasi CSV/JSON dan tulis ke disk berjalan lewat asyncio.to_thread.
+    """
+    writer = csv.writer(f) if fmt == "csv" else None
+    
+    def write(rows):
+        if writer is not None:
+            writer.writerows(rows)
+        else:
+            f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
     
-    product["accounts"].extend(accounts)
+    rows = []
+    if writer is not None:
+        rows.append(CATALOG_FIELDS + (CATALOG_ACCOUNT_FIELDS if with_accounts else ()))
+    padding = [""] * (len(CATALOG_FIELDS) - 1)
+    for product in list(load_products()):
+        row = catalog_row(product)
+        if writer is not None:
+            row = [row[field] for field in CATALOG_FIELDS] + (["", ""] if with_accounts else [])
+        rows.append(row)
+        after_id = None
+        while with_accounts:
+            accounts = store.page_accounts(product["id"], CATALOG_EXPORT_CHUNK, after_id)
+            if not accounts:
+                break
+            after_id = accounts[-1]["id"]
+            if writer is not None:
+                rows.extend([product["id"], *padding, a["username"], a["password"]] for a in accounts)
+            else:
+                rows.extend(
+                    {"product_id": product["id"], "username": a["username"], "password": a["password"]}
+                    for a in accounts
+                )
+            if len(rows) >= CATALOG_EXPORT_CHUNK:
+                await asyncio.to_thread(write, rows)
+                rows = []
+        if len(rows) >= CATALOG_EXPORT_CHUNK:
+            await asyncio.to_thread(write, rows)
+            rows = []
+    if rows:
+        await asyncio.to_thread(write, rows)
+
+@dp.message(Command("ekspor"))
+async def export_catalog(message: types.Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
     
-    # Update stok produk berdasarkan jumlah akun
-    product["stock"] = len(product["accounts"])
+    args = (command.args or "").lower().split()
+    fmt = "jsonl" if "jsonl" in args or "json" in args else "csv"
+    with_accounts = "akun" in args
     
-    save_products(products)
+    # Ditulis ke file sementara lalu diunggah langsung dari disk
+    f = tempfile.NamedTemporaryFile("w", suffix=f".{fmt}", delete=False, newline="", encoding="utf-8")
+    try:
+        with f:
+            await write_catalog_export(f, fmt, with_accounts)
+        size = os.path.getsize(f.name)
+        if size > MAX_UPLOAD_SIZE:
+            await message.answer(
+                f"❌ File ekspor terlalu besar ({size / 1024 / 1024:.1f} MB). "
+                "Ekspor tanpa akun atau gunakan /backup."
+            )
+            return
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        caption = f"📤 Katalog {len(load_products())} produk"
+        if with_accounts:
+            caption += "\n⚠️ Berisi data login akun, simpan dengan aman!"
+        await message.answer_document(
+            FSInputFile(f.name, filename=f"katalog{'_akun' if with_accounts else ''}-{stamp}.{fmt}"),
+            caption=caption
+        )
+    except Exception as e:
+        logger.error(f"Error exporting catalog: {e}")
+        await message.answer(f"❌ Gagal mengekspor katalog: {e}", parse_mode=None)
+    finally:
+        os.remove(f.name)
+
+@dp.message(Command("impor"))
+async def import_catalog_start(message: types.Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
     
+    await state.set_state(CatalogImportState.waiting_for_file)
     await message.answer(
-        f"✅ {len(accounts)} akun berhasil ditambahkan ke {product['name']}!\n"
-        f"🔸 Total akun: {len(product['accounts'])}\n"
-        f"🔸 Stok diperbarui menjadi: {product['stock']}"
+        "📥 Kirim file katalog .csv atau .jsonl.\n\n"
+        f"Kolom: {', '.join(CATALOG_FIELDS)}\n"
+        "• name dan price wajib; produk dicocokkan dengan id, lalu dengan nama\n"
+        "• stock diabaikan (stok mengikuti jumlah akun, tambah akun lewat /restock)\n"
+        "• baris akun dari /ekspor akun dilewati",
+        parse_mode=None
     )
-    await state.clear()
+
+async def iter_catalog_records(document, fmt):
+    """Hasilkan (nomor baris, dict) dari dokumen CSV/JSONL; dict None untuk baris rusak."""
+    line_no = 0
+    if fmt == "jsonl":
+        async for line in iter_document_lines(document):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_no, record if isinstance(record, dict) else None
+        return
     
+    header = None
+    pending = ""
+    async for line in iter_document_lines(document):
+        line_no += 1
+        pending = f"{pending}\n{line}" if pending else line
+        # Field ber-quote boleh memuat baris baru: tunggu sampai quote tertutup
+        if pending.count('"') % 2:
+            continue
+        fields, pending = next(csv.reader([pending]), []), ""
+        if not any(field.strip() for field in fields):
+            continue
+        if header is None:
+            header = [field.strip().lower() for field in fields]
+            continue
+        yield line_no, dict(zip(header, fields))
+
+def validate_catalog_record(record):
+    """Ubah satu record impor menjadi field produk; kembalikan (field, error)."""
+    name = str(record.get("name") or "").strip()
+    if not name:
+        return None, "name kosong"
+    price = parse_price(record.get("price") or "", str(record.get("currency") or "").strip().upper() or CURRENCY)
+    if not price:
+        return None, f"harga tidak valid: {record.get('price')!r}"
+    fields = {
+        "name": name,
+        "description": str(record.get("description") or "").strip(),
+        "price": format_price(*price),
+        "price_amount": price[0],
+        "currency": price[1],
+    }
+    for key in ("id", "low_stock_threshold"):
+        value = record.get(key)
+        if value in (None, ""):
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return None, f"{key} bukan angka: {value!r}"
+        if value < 0:
+            return None, f"{key} negatif"
+        fields[key] = value
+    if record.get("file_id"):
+        fields["file_id"] = str(record["file_id"]).strip()
+    return fields, None
+
+async def merge_catalog(imported):
+    """Gabungkan field hasil impor ke katalog terbaru; kembalikan (produk baru, produk diperbarui).
+
+    Produk dicocokkan dengan id lalu nama. Produk yang sudah ada dikunci
+    lewat inventory.lock lalu dibaca ulang sebelum digabung, sehingga
+    perubahan selama file diunduh (/ambangstok, restock, penjualan, worker
+    lain) tidak tertimpa. Seluruh katalog tetap ditulis sekali; error
+    penulisan diteruskan ke pemanggil.
+    """
+    current = load_products()
+    by_id = {p["id"]: p for p in current}
+    by_name = {p["name"].casefold(): p["id"] for p in current}
+    touched = {
+        fields["id"] if fields.get("id") in by_id else by_name.get(fields["name"].casefold())
+        for fields in imported
+    }
+    touched.discard(None)
+    
+    async with AsyncExitStack() as stack:
+        # Urutan id tetap agar dua proses impor tidak saling menunggu
+        for product_id in sorted(touched):
+            await stack.enter_async_context(inventory.lock(product_id))
+        
+        # Tidak ada await setelah baca ulang ini sampai save_products
+        products = [dict(p) for p in load_products()]
+        by_id = {p["id"]: p for p in products}
+        by_name = {p["name"].casefold(): p for p in products}
+        next_id = max(by_id, default=0) + 1
+        created = updated = 0
+        for fields in imported:
+            fields = dict(fields)
+            product_id = fields.pop("id", None)
+            product = by_id.get(product_id) or by_name.get(fields["name"].casefold())
+            if product is None:
+                product = {"id": product_id or next_id, "stock": 0, "file_id": None}
+                next_id = max(next_id, product["id"] + 1)
+                products.append(product)
+                by_id[product["id"]] = product
+                created += 1
+            else:
+                by_name.pop(product["name"].casefold(), None)
+                updated += 1
+            product.update(fields)
+            product["stock"] = store.count_accounts(product["id"])
+            by_name[product["name"].casefold()] = product
+        # Bukan save_products(): kegagalan harus sampai ke admin, bukan hanya ke log
+        with metrics.timer("bot_storage_seconds", op="save_products"):
+            store.save_products(products)
+    return created, updated
+
+@dp.message(CatalogImportState.waiting_for_file, F.document)
+async def import_catalog_file(message: types.Message, state: FSMContext):
+    document = message.document
+    name = (document.file_name or "").lower()
+    if name.endswith(".csv"):
+        fmt = "csv"
+    elif name.endswith((".jsonl", ".json", ".ndjson")):
+        fmt = "jsonl"
+    else:
+        await message.answer("❌ Format file harus .csv atau .jsonl")
+        return
+    if document.file_size and document.file_size > MAX_DOWNLOAD_SIZE:
+        await message.answer("❌ File terlalu besar! Maksimal 20 MB.")
+        return
+    
+    status = await message.answer("⏳ Mengunduh dan memvalidasi katalog...")
+    imported = []
+    skipped_accounts = 0
+    errors = []
+    error_count = 0
+    
+    try:
+        async for line_no, record in iter_catalog_records(document, fmt):
+            if record is None:
+                error_count += 1
+                if len(errors) < CATALOG_REPORT_LIMIT:
+                    errors.append(f"baris {line_no}: format rusak")
+                continue
+            if record.get("username") or "product_id" in record:
+                skipped_accounts += 1
+                continue
+            fields, error = validate_catalog_record(record)
+            if error:
+                error_count += 1
+                if len(errors) < CATALOG_REPORT_LIMIT:
+                    errors.append(f"baris {line_no}: {error}")
+                continue
+            imported.append(fields)
+    except Exception as e:
+        logger.error(f"Error membaca file katalog: {e}")
+        await status.edit_text(f"❌ Gagal membaca file: {e}", parse_mode=None)
+        return
+    
+    try:
+        created, updated = await merge_catalog(imported) if imported else (0, 0)
+    except Exception as e:
+        logger.error(f"Error menyimpan katalog impor: {e}")
+        await status.edit_text(f"❌ Gagal menyimpan katalog, tidak ada produk yang diubah: {e}", parse_mode=None)
+        return
+    
+    report = (
+        f"{'✅' if created or updated else '❌'} Impor katalog selesai\n"
+        f"🔸 Produk baru: {created}\n"
+        f"🔸 Produk diperbarui: {updated}\n"
+        f"🔸 Baris tidak valid: {error_count}"
+    )
+    if skipped_accounts:
+        report += f"\n🔸 Baris akun dilewati: {skipped_accounts}"
+    if errors:
+        report += "\n\n" + "\n".join(errors) + ("\n..." if error_count > len(errors) else "")
+    await status.edit_text(report, parse_mode=None)
+    await state.clear()
+
 # === KIRIM ULANG DATA === #
 @dp.message(Command("kirimulang"))
+@with_priority(PRIORITY_DELIVERY)
 async def resend_account(message: types.Message):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         await message.answer("❌ Akses ditolak!")
         return
         
@@ -615,60 +4219,32 @@ async def resend_account(message: types.Message):
     if len(args) < 3:
         await message.answer(
             "❌ Format salah!\n\n"
-            "Gunakan: /kirimulang <user_id> <product_id>"
+            "Gunakan: /kirimulang <user_id> <product_id> [jumlah]"
         )
         return
         
     try:
         user_id = int(args[1])
         product_id = int(args[2])
+        quantity = int(args[3]) if len(args) > 3 else 1
         
-        products = load_products()
-        product = next((p for p in products if p["id"] == product_id), None)
+        product = get_product(product_id)
         
         if not product:
             await message.answer("❌ Produk tidak ditemukan!")
             return
             
-        # Cek apakah ada akun tersedia
-        if "accounts" not in product or not product["accounts"]:
+        # Ambil akun sejumlah yang diminta jika stok cukup
+        accounts = await inventory.take(product_id, quantity) if 0 < quantity <= MAX_ORDER_QUANTITY else []
+        if not accounts:
             await message.answer(
-                "❌ Tidak ada akun tersedia untuk produk ini.\n"
+                f"❌ Akun tersedia kurang dari {quantity} untuk produk ini.\n"
                 "Silakan tambahkan akun terlebih dahulu dengan /restock"
             )
             return
-            
-        # Ambil akun pertama
-        account = product["accounts"].pop(0)
-        save_products(products)
-        
-        # Kirim akun ke user
-        await bot.send_message(
-            chat_id=user_id,
-            text=f"🎉 Pembayaran diverifikasi!\n\n"
-                 f"📛 Produk: {product['name']}\n"
-                 f"💵 Harga: {product['price']}\n\n"
-                 f"🔑 Login details:\n"
-                 f"👤 Username: <code>{account['username']}</code>\n"
-                 f"🔒 Password: <code>{account['password']}</code>\n\n"
-                 "⚠️ Jangan bagikan data login ke siapapun!",
-            parse_mode=ParseMode.HTML
-        )
         
-        # Kirim produk jika ada
-        if product['file_id']:
-            if product['file_id'].startswith("AgAC"):  # Photo
-                await bot.send_photo(
-                    chat_id=user_id,
-                    photo=product['file_id'],
-                    caption=f"📦 Produk Anda: {product['name']}\nTerima kasih telah berbelanja!"
-                )
-            else:  # Document
-                await bot.send_document(
-                    chat_id=user_id,
-                    document=product['file_id'],
-                    caption=f"📦 Produk Anda: {product['name']}\nTerima kasih telah berbelanja!"
-                )
+        # Kirim akun dan produk (jika ada) ke user
+        await deliver_accounts(user_id, product, accounts)
         
         await message.answer(f"✅ Akun dan produk berhasil dikirim ulang ke user ID: {user_id}")
         
@@ -678,13 +4254,14 @@ async def resend_account(message: types.Message):
         
 # === mengirim akun secara manual === #
 @dp.message(Command("kirimakun"))
+@with_priority(PRIORITY_DELIVERY)
 async def send_manual_account(message: types.Message):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         await message.answer("❌ Akses ditolak!")
         return
         
     # Cek format perintah
-    args = message.get_args().split()
+    args = message.text.split()[1:]
     if len(args) < 3:
         await message.answer(
             "❌ Format salah!\n\n"
@@ -699,10 +4276,7 @@ async def send_manual_account(message: types.Message):
         
         await bot.send_message(
             chat_id=user_id,
-            text=f"🔑 Login details:\n"
-                 f"👤 Username: <code>{username}</code>\n"
-                 f"🔒 Password: <code>{password}</code>\n\n"
-                 "⚠️ Jangan bagikan data login ke siapapun!",
+            text=format_credentials([{"username": username, "password": password}]),
             parse_mode=ParseMode.HTML
         )
         
@@ -711,10 +4285,136 @@ async def send_manual_account(message: types.Message):
     except Exception as e:
         logger.error(f"Error dalam pengiriman akun manual: {e}")
         await message.answer(f"❌ Gagal mengirim akun: {str(e)}")
+# STATUS ANTREAN KIRIM #
+@dp.message(Command("statuskirim"))
+async def outbox_status(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    depth = outbox.queue_depth()
+    await message.answer(
+        "📮 <b>Antrean Pengiriman</b>\n\n"
+        f"🔸 Antre: delivery {depth['delivery']}, normal {depth['normal']}, admin {depth['admin']}\n"
+        f"🔸 Terkirim: {outbox.stats['sent']}\n"
+        f"🔸 Kena flood control: {outbox.stats['retry_after']}\n"
+        f"🔸 Tunggu terlama: {outbox.stats['max_wait']:.1f} detik\n"
+        f"🔸 Chat aktif: {len(outbox.chat_buckets)}",
+        parse_mode=ParseMode.HTML
+    )
+
+# === METRIK === #
+def format_latency_table(histograms, counters=None, limit=15):
+    rows = sorted(histograms.items(), key=lambda item: item[1].count, reverse=True)[:limit]
+    lines = []
+    for labels, histogram in rows:
+        name = labels[0][1] if labels else "-"
+        errors = (counters or {}).get(labels, 0)
+        line = (
+            f"🔸 <code>{name}</code>: {histogram.count}x, "
+            f"p50 {histogram.quantile(0.5) * 1000:.1f} ms, p99 {histogram.quantile(0.99) * 1000:.1f} ms"
+        )
+        if errors:
+            line += f", error {errors}"
+        lines.append(line)
+    return "\n".join(lines) or "🔸 Belum ada data"
+
+@dp.message(Command("metrics"))
+async def metrics_summary(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    updates = sum(metrics.counters_of("bot_updates_total").values())
+    errors = sum(metrics.counters_of("bot_update_errors_total").values())
+    await message.answer(
+        "📈 <b>Metrik Bot</b>\n\n"
+        f"Update diterima: {updates} (gagal: {errors})\n"
+        f"Dibatasi throttle: {message_throttle.stats['throttled']} pesan, "
+        f"{callback_throttle.stats['throttled']} callback "
+        f"({len(message_throttle.buckets) + len(callback_throttle.buckets)} entri aktif)\n\n"
+        "<b>Handler</b>\n"
+        f"{format_latency_table(metrics.histograms_of('bot_handler_seconds'), metrics.counters_of('bot_handler_errors_total'))}\n\n"
+        "<b>Penyimpanan</b>\n"
+        f"{format_latency_table(metrics.histograms_of('bot_storage_seconds'))}\n\n"
+        "<b>Bot API</b>\n"
+        f"{format_latency_table(metrics.histograms_of('bot_api_seconds'), limit=8)}",
+        parse_mode=ParseMode.HTML
+    )
+
+# === BACKUP === #
+@dp.message(Command("backup"))
+async def send_backup(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    try:
+        manifest = await backups.run()
+        archive = await asyncio.get_running_loop().run_in_executor(None, backups.build_archive, manifest)
+    except Exception as e:
+        logger.error(f"Error creating backup: {e}")
+        await message.answer(f"❌ Gagal membuat backup: {e}", parse_mode=None)
+        return
+    
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(manifest["created"]))
+    summary = "\n".join(
+        f"• {name} ({entry['size'] / 1024:.1f} KB)" for name, entry in manifest["files"].items()
+    )
+    if len(archive) > MAX_UPLOAD_SIZE:
+        await message.answer(
+            f"⚠️ Backup {stamp} tersimpan di folder {BACKUP_DIR}, tetapi terlalu besar untuk dikirim "
+            f"({len(archive) / 1024 / 1024:.1f} MB).\n{summary}",
+            parse_mode=None
+        )
+        return
+    
+    await message.answer_document(
+        BufferedInputFile(archive, filename=f"backup-{stamp}.zip"),
+        caption=f"🗄️ Backup {stamp}\n{summary}\n\n⚠️ Berisi data login akun, simpan dengan aman!",
+        parse_mode=None
+    )
+
+# === STATISTIK PENJUALAN === #
+STATS_PERIODS = (("Hari ini", 1), ("7 hari", 7), ("30 hari", 30))
+
+def format_revenue(rows):
+    totals = {}
+    for row in rows:
+        totals[row["currency"]] = totals.get(row["currency"], 0) + row["revenue"]
+    return " + ".join(format_price(amount, currency) for currency, amount in sorted(totals.items())) or format_price(0, CURRENCY)
+
+@dp.message(Command("statistik"))
+async def sales_statistics(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
+    
+    text = "📊 <b>Statistik Penjualan</b>\n\n"
+    for label, days in STATS_PERIODS:
+        rows = sales.summary(days)
+        text += (
+            f"📅 {label}: {sum(r['orders'] for r in rows)} order • "
+            f"{sum(r['units'] for r in rows)} akun • {format_revenue(rows)}\n"
+        )
+    
+    by_product = {}
+    for row in sales.summary(STATS_PERIODS[-1][1]):
+        by_product.setdefault(row["product_id"], []).append(row)
+    top = sorted(by_product.items(), key=lambda item: sum(r["units"] for r in item[1]), reverse=True)[:5]
+    if top:
+        text += f"\n🏆 <b>Produk terlaris ({STATS_PERIODS[-1][0]})</b>\n"
+        for rank, (product_id, rows) in enumerate(top, 1):
+            product = get_product(product_id)
+            name = product["name"] if product else f"Produk #{product_id}"
+            text += f"{rank}. {name} — {sum(r['units'] for r in rows)} akun • {format_revenue(rows)}\n"
+    
+    await message.answer(text, parse_mode=ParseMode.HTML)
+
 # CEK STOCK #
 @dp.message(Command("cekstok"))
 async def check_account_stock(message: types.Message):
-    if message.from_user.id != ADMIN_ID:
+    if not is_admin(message.from_user.id):
         await message.answer("❌ Akses ditolak!")
         return
     
@@ -723,33 +4423,73 @@ async def check_account_stock(message: types.Message):
         await message.answer("❌ Tidak ada produk tersedia.")
         return
     
-    text = "📊 <b>Stok Produk & Akun</b>\n\n"
-    
+    # Hanya baca: penyamaan stok dilakukan StockMonitor di background
+    markers = {STOCK_OK: "🟢", STOCK_LOW: "⚠️", STOCK_OUT: "❌"}
+    lines = ["📊 <b>Stok Produk & Akun</b>\n"]
     for product in products:
-        account_count = len(product.get('accounts', []))
-        
-        # Sinkronkan stok dengan jumlah akun jika berbeda
-        if product.get('stock', 0) != account_count:
-            product['stock'] = account_count
-            
-        text += (
-            f"📛 <b>{product['name']}</b>\n"
+        account_count = store.count_accounts(product['id'])
+        lines.append(
+            f"{markers[stock_level(product, account_count)]} <b>{product['name']}</b> (ID {product['id']})\n"
             f"💵 {product['price']}\n"
-            f"🛒 Stok: {product['stock']}\n"
-            f"👤 Akun tersedia: {account_count}\n\n"
+            f"🛒 Stok: {product.get('stock', 0)}\n"
+            f"👤 Akun tersedia: {account_count} (ambang {stock_threshold(product)})\n"
         )
     
-    # Simpan perubahan jika ada penyesuaian stok
-    save_products(products)
+    await message.answer("\n".join(lines), parse_mode=ParseMode.HTML)
+
+@dp.message(Command("ambangstok"))
+async def set_stock_threshold(message: types.Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Akses ditolak!")
+        return
     
-    await message.answer(text, parse_mode=ParseMode.HTML)
+    args = (command.args or "").split()
+    if len(args) != 2 or not all(arg.isdigit() for arg in args):
+        await message.answer(
+            "Format: /ambangstok <id_produk> <jumlah>\n"
+            f"Peringatan stok menipis dikirim saat akun tersisa <= jumlah (default {LOW_STOCK_THRESHOLD}, 0 = hanya saat habis).",
+            parse_mode=None
+        )
+        return
+    
+    product = get_product(int(args[0]))
+    if not product:
+        await message.answer("❌ Produk tidak ditemukan!")
+        return
+    
+    product["low_stock_threshold"] = int(args[1])
+    store.update_product(product)
+    await message.answer(
+        f"✅ Ambang stok <b>{product['name']}</b> diatur ke {args[1]} akun.",
+        parse_mode=ParseMode.HTML
+    )
 
 # Hapus Akun + Stock #
+HAPUSAKUN_USAGE = (
+    "Format hapus massal:\n"
+    "/hapusakun <id_produk> prefix <awalan_username>\n"
+    "/hapusakun <id_produk> halaman <a>-<b>\n"
+    "/hapusakun <id_produk> id <a>-<b>"
+)
+
+def parse_number_range(text):
+    """'3-5' -> (3, 5), '7' -> (7, 7); None jika tidak valid."""
+    low, _, high = text.partition("-")
+    try:
+        low, high = int(low), int(high or low)
+    except ValueError:
+        return None
+    return (low, high) if 0 < low <= high else None
+
 @dp.message(Command("hapusakun"))
-async def remove_account_start(message: types.Message, state: FSMContext):
-    if message.from_user.id != ADMIN_ID:
+async def remove_account_start(message: types.Message, state: FSMContext, command: CommandObject):
+    if not is_admin(message.from_user.id):
         await message.answer("❌ Akses ditolak!")
         return
+    
+    if command.args:
+        await remove_accounts_bulk(message, command.args)
+        return
         
     products = load_products()
     if not products:
@@ -758,102 +4498,181 @@ async def remove_account_start(message: types.Message, state: FSMContext):
     
     # Pilih produk untuk menghapus akun
     builder = InlineKeyboardBuilder()
+    with_accounts = 0
     for product in products:
-        account_count = len(product.get('accounts', []))
+        account_count = store.count_accounts(product['id'])
         if account_count > 0:
+            with_accounts += 1
             builder.button(
                 text=f"{product['name']} ({account_count} akun)", 
                 callback_data=f"rmaccount_{product['id']}"
             )
     builder.adjust(1)
     
-    if len(builder.buttons) == 0:
+    if with_accounts == 0:
         await message.answer("❌ Tidak ada produk yang memiliki akun.")
         return
     
     await message.answer("🗑️ Pilih produk untuk mengelola akun:", reply_markup=builder.as_markup())
 
-@dp.callback_query(F.data.startswith("rmaccount_"))
-async def show_account_list(callback: types.CallbackQuery, state: FSMContext):
-    product_id = int(callback.data.split("_")[1])
-    products = load_products()
-    product = next((p for p in products if p["id"] == product_id), None)
+async def remove_accounts_bulk(message: types.Message, args):
+    parts = args.split(maxsplit=2)
+    if len(parts) < 3 or not parts[0].isdigit():
+        await message.answer(HAPUSAKUN_USAGE, parse_mode=None)
+        return
     
-    if not product or not product.get('accounts', []):
-        await callback.message.edit_text("❌ Tidak ada akun tersedia.")
+    product_id, mode, value = int(parts[0]), parts[1].lower(), parts[2].strip()
+    product = get_product(product_id)
+    if not product:
+        await message.answer("❌ Produk tidak ditemukan!")
+        return
+    
+    if mode == "prefix":
+        deleted = await inventory.delete(product_id, prefix=value)
+        scope = f"dengan username berawalan <code>{value}</code>"
+    elif mode in ("halaman", "id") and parse_number_range(value):
+        low, high = parse_number_range(value)
+        if mode == "halaman":
+            deleted = await inventory.delete_positions(
+                product_id, (low - 1) * ACCOUNT_PAGE_SIZE, high * ACCOUNT_PAGE_SIZE
+            )
+            scope = f"di halaman {low}-{high}"
+        else:
+            deleted = await inventory.delete(product_id, low, high)
+            scope = f"dengan ID {low}-{high}"
+    else:
+        await message.answer(HAPUSAKUN_USAGE, parse_mode=None)
         return
     
-    # Tampilkan 5 akun pertama dengan tombol hapus
-    text = f"🗑️ <b>Hapus Akun - {product['name']}</b>\n\n"
+    await message.answer(
+        f"✅ {len(deleted)} akun {scope} dihapus dari <b>{product['name']}</b>.\n"
+        f"Sisa stok: {store.count_accounts(product_id)}",
+        parse_mode=ParseMode.HTML
+    )
+
+async def render_account_page(callback: types.CallbackQuery, product_id, after_id=None, before_id=None):
+    """Tampilkan satu halaman akun; navigasi memakai cursor id (bukan indeks) agar tetap benar saat stok berubah."""
+    product = get_product(product_id)
+    total_accounts = store.count_accounts(product_id)
     
-    builder = InlineKeyboardBuilder()
+    if not product or not total_accounts:
+        await callback.message.edit_text("❌ Tidak ada akun tersedia.")
+        return
+    
+    # Ambil satu akun ekstra untuk tahu apakah masih ada halaman berikutnya/sebelumnya
+    accounts = store.page_accounts(product_id, ACCOUNT_PAGE_SIZE + 1, after_id, before_id)
+    if before_id is not None:
+        has_prev, has_next = len(accounts) > ACCOUNT_PAGE_SIZE, True
+        accounts = accounts[-ACCOUNT_PAGE_SIZE:]
+    else:
+        has_prev, has_next = after_id is not None, len(accounts) > ACCOUNT_PAGE_SIZE
+        accounts = accounts[:ACCOUNT_PAGE_SIZE]
+    if not accounts:
+        # Halaman kosong (akun sudah terjual/dihapus): kembali ke awal
+        if after_id is not None or before_id is not None:
+            await render_account_page(callback, product_id)
+            return
+        await callback.message.edit_text("❌ Tidak ada akun tersedia.")
+        return
     
-    # Hanya tampilkan maksimal 10 akun untuk menghindari tombol terlalu banyak
-    shown_accounts = product['accounts'][:10]
+    text = (
+        f"🗑️ <b>Hapus Akun - {product['name']}</b>\n"
+        f"Total {total_accounts} akun\n\n"
+    )
     
-    for i, account in enumerate(shown_accounts):
-        text += f"{i+1}. Username: <code>{account['username']}</code>\n"
+    builder = InlineKeyboardBuilder()
+    anchor = accounts[0]['id'] - 1
+    for account in accounts:
+        text += f"#{account['id']} Username: <code>{account['username']}</code>\n"
         builder.button(
-            text=f"🗑️ Hapus #{i+1}", 
-            callback_data=f"delaccount_{product_id}_{i}"
+            text=f"🗑️ Hapus #{account['id']}", 
+            callback_data=f"delaccount_{product_id}_{account['id']}_{anchor}"
         )
+    builder.adjust(2)
     
-    total_accounts = len(product['accounts'])
-    if total_accounts > 10:
-        text += f"\n... dan {total_accounts - 10} akun lainnya"
+    nav = []
+    if has_prev:
+        nav.append(types.InlineKeyboardButton(text="⬅️ Sebelumnya", callback_data=f"accpage_{product_id}_b{accounts[0]['id']}"))
+    if has_next:
+        nav.append(types.InlineKeyboardButton(text="Berikutnya ➡️", callback_data=f"accpage_{product_id}_a{accounts[-1]['id']}"))
+    if nav:
+        builder.row(*nav)
     
     # Tambahkan tombol untuk menghapus semua akun
-    builder.button(
-        text="🗑️ Hapus Semua Akun", 
-        callback_data=f"delallaccount_{product_id}"
-    )
-    
-    builder.button(
-        text="🔙 Kembali", 
-        callback_data="admin_menu"
+    builder.row(
+        types.InlineKeyboardButton(text="🗑️ Hapus Semua Akun", callback_data=f"delallaccount_{product_id}"),
+        types.InlineKeyboardButton(text="🔙 Kembali", callback_data="admin_menu")
     )
     
-    builder.adjust(2)
-    
     await callback.message.edit_text(
         text,
         reply_markup=builder.as_markup(),
         parse_mode=ParseMode.HTML
     )
 
-@dp.callback_query(F.data.startswith("delaccount_"))
-async def delete_account(callback: types.CallbackQuery):
-    _, product_id, account_index = callback.data.split("_")
-    product_id = int(product_id)
-    account_index = int(account_index)
-    
-    products = load_products()
-    product = next((p for p in products if p["id"] == product_id), None)
+@dp.callback_query(F.data.startswith("rmaccount_"))
+async def show_account_list(callback: types.CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
     
-    if not product or not product.get('accounts', []) or account_index >= len(product['accounts']):
-        await callback.answer("❌ Akun tidak ditemukan!")
+    product_id = int(callback.data.split("_")[1])
+    await render_account_page(callback, product_id)
+
+@dp.callback_query(F.data.startswith("accpage_"))
+async def show_account_page(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
         return
     
-    # Hapus akun
-    deleted_account = product['accounts'].pop(account_index)
+    parts = callback.data.split("_")
+    # Tombol versi lama (accpage_<produk>_<halaman>) tidak punya kursor a/b
+    if len(parts) != 3 or parts[2][:1] not in ("a", "b") or not parts[2][1:].isdigit():
+        await callback.answer("⚠️ Tombol kedaluwarsa, buka lagi daftar akun.", show_alert=True)
+        return
+    _, product_id, cursor = parts
+    account_id = int(cursor[1:])
+    if cursor[0] == "a":
+        await render_account_page(callback, int(product_id), after_id=account_id)
+    else:
+        await render_account_page(callback, int(product_id), before_id=account_id)
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("delaccount_"))
+async def delete_account(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
     
-    # Update stok
-    product['stock'] = len(product['accounts'])
+    parts = callback.data.split("_")
+    # Tombol versi lama (delaccount_<produk>_<posisi>) menunjuk posisi, bukan id akun
+    if len(parts) != 4 or not all(part.isdigit() for part in parts[1:]):
+        await callback.answer("⚠️ Tombol kedaluwarsa, buka lagi daftar akun.", show_alert=True)
+        return
+    _, product_id, account_id, anchor = parts
+    product_id = int(product_id)
+    account_id = int(account_id)
     
-    # Simpan perubahan
-    save_products(products)
+    # Hapus akun (stok ikut diperbarui oleh store)
+    deleted = await inventory.delete(product_id, account_id, account_id)
     
-    await callback.answer(f"✅ Akun {deleted_account['username']} dihapus!")
+    if not deleted:
+        await callback.answer("❌ Akun tidak ditemukan!")
+    else:
+        await callback.answer(f"✅ Akun {deleted[0]['username']} dihapus!")
     
-    # Tampilkan ulang daftar akun
-    await show_account_list(callback, None)
+    # Tampilkan ulang halaman yang sama
+    await render_account_page(callback, product_id, after_id=int(anchor) if int(anchor) > 0 else None)
 
 @dp.callback_query(F.data.startswith("delallaccount_"))
 async def delete_all_accounts(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
+    
     product_id = int(callback.data.split("_")[1])
     
-    products = load_products()
-    product = next((p for p in products if p["id"] == product_id), None)
+    product = get_product(product_id)
     
     if not product:
         await callback.answer("❌ Produk tidak ditemukan!")
@@ -873,7 +4692,7 @@ async def delete_all_accounts(callback: types.CallbackQuery):
     await callback.message.edit_text(
         f"⚠️ <b>KONFIRMASI</b> ⚠️\n\n"
         f"Anda akan menghapus SEMUA akun untuk produk <b>{product['name']}</b>.\n"
-        f"Total {len(product.get('accounts', []))} akun akan dihapus.\n\n"
+        f"Total {store.count_accounts(product_id)} akun akan dihapus.\n\n"
         f"Apakah Anda yakin?",
         reply_markup=builder.as_markup(),
         parse_mode=ParseMode.HTML
@@ -881,25 +4700,20 @@ async def delete_all_accounts(callback: types.CallbackQuery):
 
 @dp.callback_query(F.data.startswith("confirmdelall_"))
 async def confirm_delete_all(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
+    
     product_id = int(callback.data.split("_")[1])
     
-    products = load_products()
-    product = next((p for p in products if p["id"] == product_id), None)
+    product = get_product(product_id)
     
     if not product:
         await callback.answer("❌ Produk tidak ditemukan!")
         return
     
-    account_count = len(product.get('accounts', []))
-    
-    # Hapus semua akun
-    product['accounts'] = []
-    
-    # Update stok
-    product['stock'] = 0
-    
-    # Simpan perubahan
-    save_products(products)
+    # Hapus semua akun, stok menjadi 0
+    account_count = await inventory.clear(product_id)
     
     await callback.message.edit_text(
         f"✅ Berhasil menghapus {account_count} akun dari produk <b>{product['name']}</b>.\n"
@@ -910,6 +4724,10 @@ async def confirm_delete_all(callback: types.CallbackQuery):
 # Tombol kembali ke menu admin
 @dp.callback_query(F.data == "admin_menu")
 async def back_to_admin_menu(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Akses ditolak!", show_alert=True)
+        return
+    
     kb = ReplyKeyboardBuilder()
     kb.button(text="➕ Tambah Produk")
     kb.button(text="📝 Edit SNK")
@@ -926,28 +4744,255 @@ async def back_to_admin_menu(callback: types.CallbackQuery):
 # === BACK TO MENU === #
 @dp.callback_query(F.data == "back_to_menu")
 async def back_to_menu(callback: types.CallbackQuery):
-    products = [p for p in load_products() if p['stock'] > 0]
+    markup, _ = storefront.page(0)
     
-    if not products:
-        await callback.message.answer("😞 Maaf, stok produk sedang habis.")
+    if not markup:
+        await callback.message.answer(templates.render("out_of_stock"))
         return
     
-    kb = InlineKeyboardBuilder()
-    for product in products:
-        kb.add(types.InlineKeyboardButton(
-            text=f"{product['name']} ({product['stock']})",
-            callback_data=f"product_{product['id']}"
-        ))
-    kb.adjust(2)
-    
-    await callback.message.edit_text(
-        "Silakan pilih produk yang tersedia:",
-        reply_markup=kb.as_markup()
-    )
+    await callback.message.edit_text(templates.render("shop_menu"), reply_markup=markup)
+
+# === SCHEDULER ===
+class Scheduler:
+    """Jalankan coroutine berkala di background selama bot hidup.
+
+    Setiap job punya task sendiri; exception dicatat tanpa menghentikan job.
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self._tasks = []
+
+    def every(self, interval, func, name=None):
+        self.jobs.append((interval, func, name or func.__name__))
+
+    async def _loop(self, interval, func, name):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await func()
+            except Exception as e:
+                logger.error(f"Error job {name}: {e}")
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._loop(*job)) for job in self.jobs]
+        logger.info(f"Scheduler berjalan: {', '.join(job[2] for job in self.jobs)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+STOCK_OK, STOCK_LOW, STOCK_OUT = "ok", "low", "out"
+STOCK_LEVELS = (STOCK_OK, STOCK_LOW, STOCK_OUT)
+
+def stock_threshold(product):
+    return product.get("low_stock_threshold", LOW_STOCK_THRESHOLD)
+
+def stock_level(product, count):
+    if count <= 0:
+        return STOCK_OUT
+    if count <= stock_threshold(product):
+        return STOCK_LOW
+    return STOCK_OK
+
+class StockMonitor:
+    """Rekonsiliasi stok dan peringatan stok menipis/habis ke admin.
+
+    Setiap putaran hanya memeriksa produk dari store.pop_changed(): field
+    stock disamakan dengan jumlah akun jika berbeda, lalu admin diberi tahu
+    saat level stok turun (ok -> menipis -> habis). Putaran pertama hanya
+    mencatat level awal agar restart tidak mengirim ulang peringatan lama.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.levels = {}
+        self.stats = {"runs": 0, "checked": 0, "fixed": 0, "alerts": 0}
+        self._primed = False
+
+    async def run(self):
+        alerts = []
+        changed = set()
+        if not self._primed:
+            # Katalog JSON baru dimuat saat pertama diakses; tanpa ini level awal tidak tercatat
+            changed.update(p["id"] for p in self.store.all_products())
+        changed |= self.store.pop_changed()
+        for product_id in sorted(changed):
+            product = self.store.get_product(product_id)
+            if product is None:
+                self.levels.pop(product_id, None)
+                continue
+            count = self.store.count_accounts(product_id)
+            if product.get("stock", 0) != count:
+                logger.info(f"Stok {product['name']} disamakan: {product.get('stock', 0)} -> {count}")
+                product["stock"] = count
+                self.store.update_product(product)
+                self.stats["fixed"] += 1
+            level = stock_level(product, count)
+            previous = self.levels.get(product_id, STOCK_OK)
+            self.levels[product_id] = level
+            # Hanya kirim saat level memburuk; restock cukup mereset level
+            if self._primed and STOCK_LEVELS.index(level) > STOCK_LEVELS.index(previous):
+                alerts.append((product, count, level))
+            self.stats["checked"] += 1
+        self._primed = True
+        self.stats["runs"] += 1
+        
+        for product, count, level in alerts:
+            if level == STOCK_OUT:
+                text = f"❌ <b>Stok habis:</b> {product['name']} (ID {product['id']})\nRestock dengan /restock."
+            else:
+                text = (
+                    f"⚠️ <b>Stok menipis:</b> {product['name']} (ID {product['id']})\n"
+                    f"Sisa {count} akun (ambang {stock_threshold(product)})."
+                )
+            for admin_id, role in ADMIN_ROLES.items():
+                if role != ROLE_OWNER:
+                    continue
+                try:
+                    await bot.send_message(admin_id, text, parse_mode=ParseMode.HTML)
+                    self.stats["alerts"] += 1
+                except Exception as e:
+                    logger.error(f"Gagal mengirim peringatan stok ke {admin_id}: {e}")
+
+stock_monitor = StockMonitor(store)
+scheduler = Scheduler()
+scheduler.every(STOCK_CHECK_INTERVAL, stock_monitor.run, "rekonsiliasi_stok")
+if BACKUP_INTERVAL > 0:
+    scheduler.every(BACKUP_INTERVAL, backups.run, "backup")
+
+metrics.counter("bot_stock_checks_total", lambda: [({}, stock_monitor.stats["checked"])])
+metrics.counter("bot_stock_fixed_total", lambda: [({}, stock_monitor.stats["fixed"])])
+metrics.counter("bot_stock_alerts_total", lambda: [({}, stock_monitor.stats["alerts"])])
 
 # === RUN BOT ===
-async def main():
+async def on_shutdown():
+    await store.flush()
+    await credentials.flush()
+    logger.info("Semua perubahan produk sudah disimpan")
+
+class GracefulRequestHandler(SimpleRequestHandler):
+    """Saat shutdown, tunggu update yang masih diproses sebelum sesi bot ditutup."""
+
+    async def close(self):
+        if self._background_feed_update_tasks:
+            logger.info(f"Menunggu {len(self._background_feed_update_tasks)} update selesai diproses...")
+            await asyncio.wait(self._background_feed_update_tasks, timeout=WEBHOOK_DRAIN_TIMEOUT)
+        await super().close()
+
+async def on_startup_webhook(bot: Bot):
+    if WORKER_INDEX > 1:
+        # Cukup worker pertama yang mendaftarkan webhook
+        return
+    if not WEBHOOK_URL:
+        logger.info("WEBHOOK_URL kosong, webhook tidak didaftarkan ulang")
+        return
+    await bot.set_webhook(
+        url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info(f"Webhook terdaftar di {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+def create_webhook_app():
+    app = web.Application()
+    GracefulRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET or None
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook():
+    dp.startup.register(on_startup_webhook)
+    runner = web.AppRunner(create_webhook_app())
+    await runner.setup()
+    # SO_REUSEPORT: semua worker listen di port yang sama, kernel membagi koneksi
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=WORKERS > 1)
+    await site.start()
+    worker = f" (worker {WORKER_INDEX})" if WORKER_INDEX else ""
+    logger.info(f"Webhook server berjalan di {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}{worker}")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Menghentikan webhook server...")
+        await runner.cleanup()
+
+async def run_polling():
+    # Webhook yang masih aktif membuat getUpdates ditolak Telegram
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
+async def run_workers():
+    """Proses induk mode multi-worker: jalankan WORKERS proses webhook dan awasi.
+
+    Semua worker memakai database SQLite yang sama (produk, akun, order, FSM)
+    dan port webhook yang sama. Worker yang mati dijalankan ulang; SIGINT/
+    SIGTERM diteruskan agar tiap worker menyelesaikan update yang berjalan.
+    """
+    procs = {}
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def spawn(index):
+        procs[index] = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), env=dict(os.environ, BOT_WORKER=str(index))
+        )
+        logger.info(f"Worker {index} berjalan (pid {procs[index].pid})")
+
+    async def watch(index):
+        while True:
+            code = await procs[index].wait()
+            if stop.is_set():
+                return
+            logger.error(f"Worker {index} berhenti (kode {code}), dijalankan ulang")
+            await asyncio.sleep(1)
+            await spawn(index)
+
+    for index in range(1, WORKERS + 1):
+        await spawn(index)
+    watchers = [asyncio.create_task(watch(index)) for index in procs]
+    await stop.wait()
+    logger.info("Menghentikan semua worker...")
+    for proc in procs.values():
+        if proc.returncode is None:
+            proc.send_signal(signal.SIGTERM)
+    await asyncio.gather(*(proc.wait() for proc in procs.values()))
+    for watcher in watchers:
+        watcher.cancel()
+
+async def main():
+    if WORKERS > 1 and not WORKER_INDEX:
+        if BOT_MODE != "webhook" or STORAGE_BACKEND != "sqlite":
+            logger.error("WORKERS > 1 hanya didukung dengan MODE webhook dan STORAGE sqlite")
+            return
+        await run_workers()
+        return
+    dp.shutdown.register(on_shutdown)
+    metrics_runner = await start_metrics_server()
+    # Mode multi-worker: cukup worker pertama yang merekonsiliasi dan mengirim peringatan
+    if WORKER_INDEX <= 1:
+        await stock_monitor.run()
+        scheduler.start()
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await run_polling()
+    finally:
+        await scheduler.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
 if __name__ == "__main__":
     asyncio.run(main())
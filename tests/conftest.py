@@ -0,0 +1,81 @@
+"""Fixture bersama: main.py diimpor di direktori sementara dengan config uji.
+
+Bot API diganti sesi tiruan dari benchmark.py, jadi tidak ada request
+jaringan. Semua coroutine dijalankan di satu event loop per sesi karena
+objek main (lock, task flush) terikat ke loop tempat mereka pertama dipakai.
+
+main.py diimpor dua kali di direktori yang sama: `main` dengan STORAGE
+sqlite (shop.db) dan `json_main` dengan backend default products.json. File
+order/FSM/backup instance JSON diberi nama lain agar keduanya tidak berbagi
+data.
+"""
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import benchmark
+
+def write_config(directory, **overrides):
+    config = {"BOT_TOKEN": benchmark.BOT_TOKEN, "ADMIN_ID": benchmark.ADMIN_ID, "METRICS_PORT": 0}
+    config.update(overrides)
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        json.dump(config, f)
+
+def load_main(directory, name, **config):
+    """Impor main.py sebagai modul `name` dengan config.json dari `config`."""
+    write_config(directory, **config)
+    os.chdir(directory)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_DIR, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    module.bot.session = benchmark.make_stub_session(module)
+    return module
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    # Task flush tertunda (write-behind, index kredensial) dibatalkan sebelum loop ditutup
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    if pending:
+        loop.run_until_complete(asyncio.wait(pending))
+    loop.close()
+
+@pytest.fixture(scope="session")
+def run(loop):
+    return loop.run_until_complete
+
+@pytest.fixture(scope="session")
+def shop_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("bot")
+
+@pytest.fixture(scope="session")
+def sqlite_main(shop_dir):
+    return load_main(shop_dir, "main", STORAGE="sqlite")
+
+@pytest.fixture(scope="session")
+def json_main(shop_dir, sqlite_main):
+    # Diimpor setelah instance SQLite agar products.json tidak ikut dimigrasikan ke shop.db
+    return load_main(
+        shop_dir, "main_json", STORAGE="json", DATABASE_FILE="json-shop.db",
+        FSM_DATABASE_FILE="json-fsm.db", BACKUP_DIR="json-backups"
+    )
+
+@pytest.fixture(scope="session")
+def main(sqlite_main):
+    return sqlite_main
+
+@pytest.fixture
+def stub(main):
+    main.bot.session.calls.clear()
+    return main.bot.session
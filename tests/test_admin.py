@@ -0,0 +1,127 @@
+"""Akses admin: callback admin tidak boleh bisa dipakai pembeli, pembagian bukti ke admin."""
+import time
+
+import pytest
+
+import benchmark
+
+BUYER = 30_001
+
+@pytest.mark.parametrize("data", [
+    "restock_{pid}", "rmaccount_{pid}", "accpage_{pid}_a0", "delaccount_{pid}_1_0",
+    "delallaccount_{pid}", "confirmdelall_{pid}", "admin_menu",
+])
+def test_account_callbacks_require_admin(main, run, stub, data):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=3))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    run(main.dp.feed_update(main.bot, factory.callback(BUYER, data.format(pid=product_id))))
+    
+    assert main.store.count_accounts(product_id) == 3
+    assert stub.calls == {"answerCallbackQuery": 1}
+
+def test_admin_can_clear_accounts(main, run, stub):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=3))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    run(main.dp.feed_update(main.bot, factory.callback(benchmark.ADMIN_ID, f"confirmdelall_{product_id}")))
+    assert main.store.count_accounts(product_id) == 0
+
+@pytest.mark.parametrize("data", ["delaccount_{pid}_0", "accpage_{pid}_2", "delaccount_{pid}_x_0"])
+def test_stale_account_buttons_are_rejected(main, run, stub, data):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=3))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    run(main.dp.feed_update(main.bot, factory.callback(benchmark.ADMIN_ID, data.format(pid=product_id))))
+    
+    assert main.store.count_accounts(product_id) == 3
+    assert stub.calls == {"answerCallbackQuery": 1}
+
+VERIFIER = 2
+
+@pytest.fixture
+def two_admins(main, monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_ROLES", {benchmark.ADMIN_ID: main.ROLE_OWNER, VERIFIER: main.ROLE_VERIFIER})
+    monkeypatch.setattr(main, "ADMIN_IDS", frozenset(main.ADMIN_ROLES))
+    monkeypatch.setattr(main, "admin_router", main.AdminRouter(main.DATABASE_FILE))
+    # Owner baru saja diberi tugas, jadi order berikutnya jatuh ke verifier
+    main.admin_router.conn.execute(
+        "UPDATE admins SET last_assigned = ? WHERE user_id = ?", (time.time(), benchmark.ADMIN_ID)
+    )
+    yield main.admin_router
+    main.admin_router.conn.execute("DELETE FROM admins WHERE user_id = ?", (VERIFIER,))
+
+def send_proof(main, run, factory, user_id, product_id):
+    run(main.dp.feed_update(main.bot, factory.callback(user_id, f"order_{product_id}")))
+    run(main.dp.feed_update(main.bot, factory.callback(user_id, f"qty_{product_id}_1")))
+    run(main.dp.feed_update(main.bot, factory.message(
+        user_id, photo=[{"file_id": "AgACtest", "file_unique_id": "t", "width": 1, "height": 1}]
+    )))
+    return main.orders.list_by_user(user_id, limit=1)[0]
+
+def test_routing_only_assigns_and_owner_can_bulk_verify(main, run, stub, two_admins):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=3))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    order = send_proof(main, run, factory, 30_101, product_id)
+    assert order["assigned_to"] == VERIFIER
+    assert order["claimed_by"] is None
+    assert two_admins.status()[VERIFIER] == (True, 1)
+    
+    run(main.dp.feed_update(main.bot, factory.message(benchmark.ADMIN_ID, f"/verifsemua {product_id}")))
+    assert main.orders.get(order["id"])["status"] == main.ORDER_VERIFIED
+
+def test_bulk_verify_skips_orders_claimed_by_button(main, run, stub, two_admins):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=3))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    order = send_proof(main, run, factory, 30_102, product_id)
+    assert main.orders.claim(order["id"], VERIFIER)
+    
+    run(main.dp.feed_update(main.bot, factory.message(benchmark.ADMIN_ID, f"/verifsemua {product_id}")))
+    assert main.orders.get(order["id"])["status"] == main.ORDER_PENDING
+    run(main.dp.feed_update(main.bot, factory.callback(VERIFIER, f"verify_{order['code']}")))
+    assert main.orders.get(order["id"])["status"] == main.ORDER_VERIFIED
+
+def test_verifier_cannot_use_owner_commands(main, run, stub, two_admins):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=3))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    run(main.dp.feed_update(main.bot, factory.callback(VERIFIER, f"confirmdelall_{product_id}")))
+    assert main.store.count_accounts(product_id) == 3
+
+def fail_sends_to(stub, monkeypatch, unreachable):
+    make_request = stub.make_request
+    sent = []
+    
+    async def flaky(bot, method, timeout=None):
+        if getattr(method, "chat_id", None) in unreachable:
+            raise RuntimeError("Forbidden: bot was blocked by the user")
+        sent.append((method.__api_method__, getattr(method, "chat_id", None), getattr(method, "text", None)))
+        return await make_request(bot, method, timeout)
+    
+    monkeypatch.setattr(stub, "make_request", flaky)
+    return sent
+
+def test_proof_falls_back_to_next_admin(main, run, stub, two_admins, monkeypatch):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=1))[0]
+    sent = fail_sends_to(stub, monkeypatch, {VERIFIER})
+    order = send_proof(main, run, benchmark.UpdateFactory(main.bot), 30_103, product_id)
+    
+    assert ("sendPhoto", benchmark.ADMIN_ID, None) in sent
+    assert order["assigned_to"] == benchmark.ADMIN_ID
+
+def test_buyer_is_told_when_no_admin_is_reachable(main, run, stub, two_admins, monkeypatch):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=1))[0]
+    sent = fail_sends_to(stub, monkeypatch, {VERIFIER, benchmark.ADMIN_ID})
+    order = send_proof(main, run, benchmark.UpdateFactory(main.bot), 30_104, product_id)
+    
+    assert order["status"] == main.ORDER_PENDING
+    assert order["assigned_to"] is None
+    assert f"#{order['code']}" in sent[-1][2] and "admin belum bisa" in sent[-1][2]
+
+def test_queue_page_indicator_is_a_no_op(main, run, stub, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "orders", main.OrderLedger(str(tmp_path / "orders.db")))
+    for user_id in range(main.ORDER_PAGE_SIZE + 1):
+        main.orders.create(user_id=user_id, product_id=1, product_name="Produk", price="Rp 1.000", quantity=1)
+    _, markup = main.render_pending_orders(0)
+    indicator = markup.inline_keyboard[-1][0]
+    assert indicator.text == "📄 1/2"
+    
+    factory = benchmark.UpdateFactory(main.bot)
+    run(main.dp.feed_update(main.bot, factory.callback(benchmark.ADMIN_ID, indicator.callback_data)))
+    assert stub.calls == {"answerCallbackQuery": 1}
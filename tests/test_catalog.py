@@ -0,0 +1,82 @@
+"""Impor/ekspor katalog."""
+import csv
+import json
+import sqlite3
+
+import benchmark
+
+def test_merge_keeps_fields_changed_after_download(main, run):
+    product = main.store.add_product({"name": "Impor Lama", "description": "", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    fields, error = main.validate_catalog_record({"id": str(product["id"]), "name": "Impor Baru", "price": "Rp. 2.000"})
+    assert error is None
+    
+    # Diubah admin lain selagi file impor diunduh
+    product["low_stock_threshold"] = 7
+    main.store.update_product(product)
+    run(main.inventory.add(product["id"], [{"username": "imp1", "password": "p"}]))
+    
+    assert run(main.merge_catalog([fields])) == (0, 1)
+    merged = main.get_product(product["id"])
+    assert (merged["name"], merged["price_amount"]) == ("Impor Baru", 200000)
+    assert merged["low_stock_threshold"] == 7
+    assert merged["stock"] == 1
+
+def test_merge_matches_by_name_and_creates_new(main, run):
+    main.store.add_product({"name": "Nama Sama", "description": "", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    records = [{"name": "nama sama", "price": "5rb"}, {"name": "Produk Impor Baru", "price": "Rp 3.000"}]
+    imported = [main.validate_catalog_record(record)[0] for record in records]
+    
+    assert run(main.merge_catalog(imported)) == (1, 1)
+    names = {p["name"] for p in main.load_products()}
+    assert {"nama sama", "Produk Impor Baru"} <= names
+    assert "Nama Sama" not in names
+
+def test_export_writes_accounts_in_chunks(main, run, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "CATALOG_EXPORT_CHUNK", 2)
+    product = main.store.add_product({"name": "Ekspor", "description": "a, \"b\"", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    run(main.inventory.add(product["id"], [{"username": f"ex{i}", "password": "p,q"} for i in range(5)]))
+    
+    path = tmp_path / "katalog.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        run(main.write_catalog_export(f, "csv", True))
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    mine = [row for row in rows if row["id"] == str(product["id"])]
+    assert mine[0]["description"] == "a, \"b\""
+    assert [row["username"] for row in mine[1:]] == [f"ex{i}" for i in range(5)]
+    assert {row["password"] for row in mine[1:]} == {"p,q"}
+    
+    path = tmp_path / "katalog.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        run(main.write_catalog_export(f, "jsonl", False))
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == len(main.load_products())
+    assert all("username" not in record for record in records)
+
+def test_failed_import_write_is_reported(main, run, stub, monkeypatch):
+    async def records(document, fmt):
+        yield 2, {"name": "Impor Gagal", "price": "Rp 1.000"}
+    
+    def locked(products):
+        raise sqlite3.OperationalError("database is locked")
+    
+    edits = []
+    make_request = stub.make_request
+    
+    async def recording(bot, method, timeout=None):
+        if method.__api_method__ == "editMessageText":
+            edits.append(method.text)
+        return await make_request(bot, method, timeout)
+    
+    monkeypatch.setattr(main, "iter_catalog_records", records)
+    monkeypatch.setattr(main.store, "save_products", locked)
+    monkeypatch.setattr(stub, "make_request", recording)
+    factory = benchmark.UpdateFactory(main.bot)
+    run(main.dp.feed_update(main.bot, factory.message(benchmark.ADMIN_ID, "/impor")))
+    run(main.dp.feed_update(main.bot, factory.message(benchmark.ADMIN_ID, document={
+        "file_id": "BQACimpor", "file_unique_id": "i", "file_name": "katalog.csv", "file_size": 10
+    })))
+    
+    assert edits[-1].startswith("❌ Gagal menyimpan katalog") and "database is locked" in edits[-1]
+    assert "Impor Gagal" not in {p["name"] for p in main.load_products()}
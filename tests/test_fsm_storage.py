@@ -0,0 +1,46 @@
+"""SQLiteStorage: state FSM tahan restart dan kedaluwarsa setelah TTL."""
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+KEY = StorageKey(bot_id=1, chat_id=500, user_id=500)
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "fsm.db")
+
+def test_state_and_data_survive_restart(main, run, path):
+    storage = main.SQLiteStorage(path)
+    run(storage.set_state(KEY, main.OrderState.waiting_for_payment))
+    run(storage.set_data(KEY, {"product_id": 3, "quantity": 2}))
+    run(storage.close())
+
+    restarted = main.SQLiteStorage(path)
+    assert run(restarted.get_state(KEY)) == main.OrderState.waiting_for_payment.state
+    assert run(restarted.get_data(KEY)) == {"product_id": 3, "quantity": 2}
+
+def test_cleared_state_is_deleted(main, run, path):
+    storage = main.SQLiteStorage(path)
+    run(storage.set_state(KEY, "restock"))
+    run(storage.set_state(KEY, None))
+    assert storage.conn.execute("SELECT COUNT(*) FROM fsm").fetchone()[0] == 0
+    assert run(storage.get_state(KEY)) is None
+
+def test_expired_state_reads_as_empty(main, run, path):
+    storage = main.SQLiteStorage(path, ttl=60)
+    run(storage.set_state(KEY, "restock"))
+    storage.conn.execute("UPDATE fsm SET updated_at = updated_at - 120")
+    storage._cache[storage._key(KEY)][2] -= 120
+    assert run(storage.get_state(KEY)) is None
+    assert run(storage.get_data(KEY)) == {}
+    # Restart juga membuang state yang sudah lewat TTL
+    run(storage.set_state(KEY, "restock"))
+    storage.conn.execute("UPDATE fsm SET updated_at = updated_at - 120")
+    assert run(main.SQLiteStorage(path, ttl=60).get_state(KEY)) is None
+
+def test_shared_storage_sees_writes_from_other_process(main, run, path):
+    first = main.SQLiteStorage(path, shared=True)
+    second = main.SQLiteStorage(path, shared=True)
+    run(first.set_state(KEY, "restock"))
+    assert run(second.get_state(KEY)) == "restock"
+    run(second.set_data(KEY, {"step": 2}))
+    assert run(first.get_data(KEY)) == {"step": 2}
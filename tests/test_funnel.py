@@ -0,0 +1,82 @@
+"""Alur pembelian lengkap lewat dispatcher dengan Bot API tiruan, di kedua backend."""
+import pytest
+
+import benchmark
+
+@pytest.fixture(params=["json", "sqlite"])
+def main(request):
+    return request.getfixturevalue(f"{request.param}_main")
+
+def test_purchase_funnel_delivers_accounts(main, run, stub):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=5))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    latencies = {step: [] for step in benchmark.STEPS + ("funnel",)}
+    
+    for user_id in (20_001, 20_002):
+        run(benchmark.run_funnel(main, main.dp, main.bot, factory, user_id, product_id, 2, latencies))
+    
+    for user_id in (20_001, 20_002):
+        order = main.orders.list_by_user(user_id, limit=1)[0]
+        assert order["status"] == main.ORDER_VERIFIED
+        assert len(order["accounts"]) == 2
+    assert main.store.count_accounts(product_id) == 1
+    assert main.get_product(product_id)["stock"] == 1
+    # Bukti transfer diteruskan ke admin, kredensial dikirim ke pembeli
+    assert stub.calls["sendPhoto"] == 2
+    assert stub.calls["sendMessage"] >= 2
+    assert all(len(latencies[step]) == 2 for step in benchmark.STEPS)
+
+def test_verify_without_stock_keeps_order_pending(main, run, stub):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=2))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    user_id = 20_003
+    
+    run(main.dp.feed_update(main.bot, factory.callback(user_id, f"order_{product_id}")))
+    run(main.dp.feed_update(main.bot, factory.callback(user_id, f"qty_{product_id}_2")))
+    run(main.dp.feed_update(main.bot, factory.message(
+        user_id, photo=[{"file_id": "AgACtest", "file_unique_id": "t", "width": 1, "height": 1}]
+    )))
+    # Stok habis di antara bukti transfer dan verifikasi
+    run(main.inventory.take(product_id, 1))
+    order = main.orders.list_by_user(user_id, limit=1)[0]
+    run(main.dp.feed_update(main.bot, factory.callback(benchmark.ADMIN_ID, f"verify_{order['code']}")))
+    
+    assert main.orders.get(order["id"])["status"] == main.ORDER_PENDING
+    assert main.store.count_accounts(product_id) == 1
+
+def test_verify_twice_delivers_once(main, run, stub):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=3))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    latencies = {step: [] for step in benchmark.STEPS + ("funnel",)}
+    
+    run(benchmark.run_funnel(main, main.dp, main.bot, factory, 20_004, product_id, 1, latencies))
+    order = main.orders.list_by_user(20_004, limit=1)[0]
+    run(main.dp.feed_update(main.bot, factory.callback(benchmark.ADMIN_ID, f"verify_{order['code']}")))
+    
+    assert main.store.count_accounts(product_id) == 2
+
+def test_sales_use_price_recorded_on_order(main, run, stub):
+    product_id = run(benchmark.seed_catalog(main, products=1, accounts=4))[0]
+    factory = benchmark.UpdateFactory(main.bot)
+    user_id = 20_005
+    
+    run(main.dp.feed_update(main.bot, factory.callback(user_id, f"order_{product_id}")))
+    run(main.dp.feed_update(main.bot, factory.callback(user_id, f"qty_{product_id}_2")))
+    run(main.dp.feed_update(main.bot, factory.message(
+        user_id, photo=[{"file_id": "AgACtest", "file_unique_id": "t", "width": 1, "height": 1}]
+    )))
+    order = main.orders.list_by_user(user_id, limit=1)[0]
+    assert (order["price_amount"], order["currency"]) == (2000000, "IDR")
+    
+    # Harga diubah sebelum admin memverifikasi
+    product = main.get_product(product_id)
+    product.update(price="Rp 99.000", price_amount=9900000, currency="IDR")
+    main.store.update_product(product)
+    run(main.dp.feed_update(main.bot, factory.callback(benchmark.ADMIN_ID, f"verify_{order['code']}")))
+    
+    [row] = [r for r in main.sales.summary(1) if r["product_id"] == product_id]
+    assert (row["orders"], row["units"], row["revenue"]) == (1, 2, 2000000)
+
+def test_legacy_order_price_is_parsed_from_text(main):
+    assert main.order_price({"price": "Rp 20.000", "price_amount": None}) == (2000000, "IDR")
+    assert main.order_price({"price": "2 × Rp 10.000", "price_amount": None}) is None
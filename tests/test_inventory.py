@@ -0,0 +1,81 @@
+"""AccountPool, CredentialIndex dan InventoryAllocator."""
+
+def accounts(*names):
+    return [{"username": name, "password": "p"} for name in names]
+
+def test_account_pool_take_is_fifo_and_all_or_nothing(main):
+    pool = main.AccountPool(accounts("a", "b", "c"))
+    assert [a["username"] for a in pool.take(2)] == ["a", "b"]
+    assert pool.take(2) == []
+    assert len(pool) == 1
+    pool.extend(accounts("d"))
+    assert [a["username"] for a in pool.take(2)] == ["c", "d"]
+
+def test_account_pool_ids_keep_increasing(main):
+    pool = main.AccountPool(accounts("a", "b"))
+    pool.take(2)
+    pool.extend(accounts("c"))
+    assert pool.page(10)[0]["id"] == 3
+    assert main.AccountPool(pool.snapshot(), pool.next_id).next_id == 4
+
+def test_account_pool_compacts_sold_head(main):
+    pool = main.AccountPool(accounts(*(f"u{i}" for i in range(3000))))
+    pool.take(2000)
+    assert len(pool._items) == 1000
+    assert pool.page(1)[0]["username"] == "u2000"
+
+def test_account_pool_pages_by_cursor(main):
+    pool = main.AccountPool(accounts(*(f"u{i}" for i in range(10))))
+    pool.take(2)
+    first = pool.page(3)
+    assert [a["id"] for a in first] == [3, 4, 5]
+    assert [a["id"] for a in pool.page(3, after_id=5)] == [6, 7, 8]
+    assert [a["id"] for a in pool.page(3, before_id=6)] == [3, 4, 5]
+    assert pool.page(3, before_id=4) == first[:1]
+    assert pool.id_span(1, 3) == (4, 5)
+    assert pool.id_span(8, 9) is None
+
+def test_account_pool_delete_by_range_and_prefix(main):
+    pool = main.AccountPool(accounts("keep1", "drop1", "drop2", "keep2", "drop3"))
+    removed = pool.delete(first_id=2, last_id=4, prefix="drop")
+    assert [a["username"] for a in removed] == ["drop1", "drop2"]
+    assert [a["username"] for a in pool.page(10)] == ["keep1", "keep2", "drop3"]
+    assert pool.page(10, after_id=1)[0]["id"] == 4
+
+def test_credential_index_classifies_duplicates(main, tmp_path):
+    index = main.CredentialIndex(str(tmp_path / "credentials.idx"))
+    index.mark(accounts("stocked"), main.CredentialIndex.IN_STOCK)
+    index.mark(accounts("sold"), main.CredentialIndex.SOLD)
+    fresh, report = index.classify(accounts("new", "stocked", "sold", "new"))
+    assert [a["username"] for a in fresh] == ["new"]
+    assert report == {"added": 1, "in_stock": 1, "sold": 1, "in_batch": 1}
+
+def test_credential_index_survives_reload(main, tmp_path):
+    path = str(tmp_path / "credentials.idx")
+    index = main.CredentialIndex(path)
+    index.mark(accounts("a", "b"), main.CredentialIndex.IN_STOCK)
+    index.mark(accounts("a"), main.CredentialIndex.SOLD)
+    index.mark(accounts("b"), main.CredentialIndex.REMOVED)
+    # Record terakhir terpotong (crash saat menulis) dibuang saat dimuat
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02")
+    
+    reloaded = main.CredentialIndex(path)
+    assert len(reloaded) == 1
+    _, report = reloaded.classify(accounts("a", "b"))
+    assert report["sold"] == 1 and report["added"] == 1
+
+def test_allocator_take_is_all_or_nothing(main, run):
+    product_id = main.store.add_product({"name": "Alokasi", "price": "Rp 1.000", "stock": 0, "file_id": None})["id"]
+    run(main.inventory.add(product_id, accounts("x1", "x2", "x3")))
+    assert run(main.inventory.take(product_id, 5)) == []
+    allocations = run(main.inventory.take_many(product_id, [2, 2, 1]))
+    assert [[a["username"] for a in group] for group in allocations] == [["x1", "x2"]]
+    assert main.store.count_accounts(product_id) == 1
+
+def test_allocator_rejects_restock_of_sold_accounts(main, run):
+    product_id = main.store.add_product({"name": "Restok", "price": "Rp 1.000", "stock": 0, "file_id": None})["id"]
+    run(main.inventory.add(product_id, accounts("r1", "r2")))
+    run(main.inventory.take(product_id, 1))
+    report = run(main.inventory.add(product_id, accounts("r1", "r2", "r3")))
+    assert (report["added"], report["sold"], report["in_stock"], report["total"]) == (1, 1, 1, 2)
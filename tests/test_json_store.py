@@ -0,0 +1,78 @@
+"""JsonProductStore dan WriteBehindWriter: penulisan products.json di belakang layar."""
+import asyncio
+import json
+
+def accounts(*names):
+    return [{"username": name, "password": "p"} for name in names]
+
+def test_writer_coalesces_mutations_into_one_write(main, run, tmp_path):
+    path = tmp_path / "data.json"
+    state = {"value": 0}
+    writer = main.WriteBehindWriter(str(path), lambda: dict(state), delay=0.01)
+    writes = []
+    write = writer._write
+
+    def recording(data):
+        writes.append(data)
+        write(data)
+
+    writer._write = recording
+
+    async def mutate():
+        for value in range(1, 6):
+            state["value"] = value
+            writer.schedule()
+        assert writer.pending and not path.exists()
+        await asyncio.sleep(0.05)
+
+    run(mutate())
+    assert writes == [{"value": 5}]
+    assert json.loads(path.read_text()) == {"value": 5}
+    assert not writer.pending
+
+def test_writer_keeps_data_dirty_after_failed_write(main, run, tmp_path):
+    path = tmp_path / "data.json"
+    writer = main.WriteBehindWriter(str(path), lambda: {"value": 1}, delay=0.01)
+    write = writer._write
+    failures = [OSError("disk penuh")]
+
+    def flaky(data):
+        if failures:
+            raise failures.pop()
+        write(data)
+
+    writer._write = flaky
+    writer._dirty = True
+    run(writer.flush())
+    assert writer.pending and not path.exists()
+    run(writer.flush())
+    assert json.loads(path.read_text()) == {"value": 1}
+
+def test_store_survives_restart(main, run, tmp_path):
+    path = str(tmp_path / "products.json")
+    store = main.JsonProductStore(path)
+    product_id = store.add_product({"name": "Awet", "price": "Rp 1.000", "stock": 0, "file_id": None})["id"]
+    store.add_accounts(product_id, accounts("a", "b", "c"))
+    store.take_accounts(product_id, 1)
+    run(store.flush())
+
+    restarted = main.JsonProductStore(path)
+    assert restarted.get_product(product_id)["stock"] == 2
+    assert [a["username"] for a in restarted.iter_accounts(product_id)] == ["b", "c"]
+    # Id akun tidak dipakai ulang setelah restart
+    restarted.add_accounts(product_id, accounts("d"))
+    assert restarted.page_accounts(product_id, 10)[-1]["id"] == 4
+
+def test_store_reloads_file_changed_outside(main, run, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "CATALOG_CHECK_INTERVAL", 0)
+    path = tmp_path / "products.json"
+    store = main.JsonProductStore(str(path))
+    store.add_product({"name": "Lama", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    run(store.flush())
+    store.pop_changed()
+
+    data = json.loads(path.read_text())
+    data[0]["name"] = "Baru"
+    path.write_text(json.dumps(data) + "\n")
+    assert store.get_product(1)["name"] == "Baru"
+    assert store.pop_changed() == {1}
@@ -0,0 +1,16 @@
+"""MetricsRegistry: format teks Prometheus."""
+
+def test_monotonic_stats_are_exported_as_counters(main):
+    text = main.metrics.render()
+    for name in (
+        "bot_throttle_allowed_total", "bot_throttle_evicted_total", "bot_outbox_sent_total",
+        "bot_outbox_retry_after_total", "bot_stock_checks_total", "bot_stock_fixed_total", "bot_stock_alerts_total",
+    ):
+        assert f"# TYPE {name} counter\n" in text
+    assert "# TYPE bot_outbox_queue_depth gauge\n" in text
+
+def test_counter_collector_keeps_described_help(main):
+    registry = main.MetricsRegistry()
+    registry.describe("jobs_total", "counter", "Job selesai")
+    registry.counter("jobs_total", lambda: [({"kind": "a"}, 3)])
+    assert registry.render() == '# HELP jobs_total Job selesai\n# TYPE jobs_total counter\njobs_total{kind="a"} 3\n'
@@ -0,0 +1,51 @@
+"""OrderLedger: kode order dan perubahan status compare-and-set."""
+import pytest
+
+@pytest.fixture
+def ledger(main, tmp_path):
+    return main.OrderLedger(str(tmp_path / "orders.db"))
+
+def new_order(ledger, user_id=1):
+    return ledger.create(user_id=user_id, product_id=1, product_name="Produk", price="Rp 1.000", quantity=1)
+
+def test_order_code_round_trip(main):
+    for order_id in (1, 35, 36, 123456789):
+        code = main.OrderLedger.format_id(order_id)
+        assert main.OrderLedger.parse_id(f"#{code}") == order_id
+    # Callback lama verify_<user>_<produk> tidak boleh terbaca sebagai ID
+    assert main.OrderLedger.parse_id("123_4") is None
+
+def test_transition_is_compare_and_set(main, ledger):
+    order = new_order(ledger)
+    assert order["status"] == main.ORDER_PENDING
+    assert ledger.transition(order["id"], main.ORDER_PENDING, main.ORDER_VERIFIED)
+    assert not ledger.transition(order["id"], main.ORDER_PENDING, main.ORDER_REJECTED)
+    assert ledger.get(order["id"])["status"] == main.ORDER_VERIFIED
+
+def test_accounts_are_stored_as_json(main, ledger):
+    order = new_order(ledger)
+    ledger.update(order["id"], accounts=[{"username": "a", "password": "b"}])
+    assert ledger.get(order["id"])["accounts"] == [{"username": "a", "password": "b"}]
+
+def test_pending_listing_and_counts(main, ledger):
+    first, second = new_order(ledger, 1), new_order(ledger, 2)
+    ledger.transition(first["id"], main.ORDER_PENDING, main.ORDER_REJECTED)
+    assert ledger.count_by_status(main.ORDER_PENDING) == 1
+    assert [o["id"] for o in ledger.list_pending_for_product(1)] == [second["id"]]
+    assert [o["id"] for o in ledger.list_by_user(2)] == [second["id"]]
+
+def test_claim_blocks_other_admins_until_released(main, ledger):
+    order = new_order(ledger)
+    assert ledger.claim(order["id"], 10)
+    assert ledger.claim(order["id"], 10)
+    assert not ledger.claim(order["id"], 20)
+    assert main.OrderLedger.claim_holder(ledger.get(order["id"])) == 10
+    assert ledger.release_claims(10) == 1
+    assert ledger.claim(order["id"], 20)
+
+def test_expired_claim_can_be_taken_over(main, ledger):
+    order = new_order(ledger)
+    ledger.claim(order["id"], 10)
+    ledger.update(order["id"], claimed_at=0)
+    assert main.OrderLedger.claim_holder(ledger.get(order["id"])) is None
+    assert ledger.claim(order["id"], 20)
@@ -0,0 +1,71 @@
+"""OutboundDispatcher: antrean kiriman per prioritas dan penanganan retry_after."""
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+
+import benchmark
+
+class Recorder:
+    def __init__(self, fail_once=()):
+        self.sent = []
+        self.fail_once = set(fail_once)
+
+    async def __call__(self, bot, method):
+        if method.chat_id in self.fail_once:
+            self.fail_once.discard(method.chat_id)
+            raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=1)
+        self.sent.append((method.chat_id, time.monotonic()))
+        return True
+
+def test_queue_serves_delivery_before_normal_before_admin(main, run):
+    outbox = main.OutboundDispatcher(global_rate=20)
+    recorder = Recorder()
+    # Bucket global kosong: ketiga kiriman pasti mengantre bersama
+    outbox.global_bucket.tokens = 0
+
+    async def delivery():
+        main.send_priority.set(main.PRIORITY_DELIVERY)
+        await outbox(recorder, None, SendMessage(chat_id=300, text="akun"))
+
+    async def scenario():
+        await asyncio.gather(
+            outbox(recorder, None, SendMessage(chat_id=benchmark.ADMIN_ID, text="bukti")),
+            outbox(recorder, None, SendMessage(chat_id=200, text="menu")),
+            delivery(),
+        )
+
+    run(scenario())
+    assert [chat_id for chat_id, _ in recorder.sent] == [300, 200, benchmark.ADMIN_ID]
+    assert outbox.stats["sent"] == 3
+
+def test_retry_after_blocks_only_that_chat(main, run):
+    outbox = main.OutboundDispatcher(global_rate=30)
+    recorder = Recorder(fail_once={400})
+
+    async def scenario():
+        start = time.monotonic()
+        await asyncio.gather(
+            outbox(recorder, None, SendMessage(chat_id=400, text="dibatasi")),
+            outbox(recorder, None, SendMessage(chat_id=401, text="lancar")),
+        )
+        return start
+
+    start = run(scenario())
+    sent = dict(recorder.sent)
+    assert outbox.stats["retry_after"] == 1
+    assert sent[400] - start >= 1
+    assert sent[401] < sent[400]
+
+def test_unlimited_methods_skip_the_queue(main, run):
+    outbox = main.OutboundDispatcher(global_rate=1)
+    outbox.global_bucket.tokens = 0
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method.__api_method__)
+        return True
+
+    assert run(outbox(make_request, None, AnswerCallbackQuery(callback_query_id="1")))
+    assert calls == ["answerCallbackQuery"] and outbox.stats["queued"] == 0
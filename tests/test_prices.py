@@ -0,0 +1,43 @@
+"""parse_price / format_price."""
+import pytest
+
+@pytest.mark.parametrize("text, expected", [
+    ("Rp 50.000", (5000000, "IDR")),
+    ("Rp. 50.000", (5000000, "IDR")),
+    ("Rp.50.000", (5000000, "IDR")),
+    ("rp50000", (5000000, "IDR")),
+    ("Rp 50.000,-", (5000000, "IDR")),
+    ("Rp 1.250.000", (125000000, "IDR")),
+    ("50.000 rupiah", (5000000, "IDR")),
+    ("50.000 IDR", (5000000, "IDR")),
+    ("50000 idr", (5000000, "IDR")),
+    ("50rb", (5000000, "IDR")),
+    ("50k", (5000000, "IDR")),
+    ("1,5jt", (150000000, "IDR")),
+    ("$4.99", (499, "USD")),
+    ("4.99 USD", (499, "USD")),
+    ("€ 10,50", (1050, "EUR")),
+    ("RM 12.5", (1250, "MYR")),
+])
+def test_parse_price(main, text, expected):
+    assert main.parse_price(text) == expected
+
+@pytest.mark.parametrize("text", ["", "abc", "Rp", "Rp 0", "50.000 dolar", "Rp 50.000 USD", "50 kg"])
+def test_parse_price_rejects_invalid(main, text):
+    assert main.parse_price(text) is None
+
+@pytest.mark.parametrize("amount, currency, expected", [
+    (5000000, "IDR", "Rp 50.000"),
+    (125000050, "IDR", "Rp 1.250.000,50"),
+    (499, "USD", "$4.99"),
+    (123456700, "USD", "$1,234,567"),
+    (1250, "MYR", "RM 12.50"),
+    (1050, "EUR", "€10.50"),
+    (1000, "JPY", "JPY 10"),
+])
+def test_format_price(main, amount, currency, expected):
+    assert main.format_price(amount, currency) == expected
+
+def test_format_then_parse_round_trips(main):
+    for amount, currency in ((5000000, "IDR"), (499, "USD"), (123456789, "USD"), (1050, "EUR")):
+        assert main.parse_price(main.format_price(amount, currency)) == (amount, currency)
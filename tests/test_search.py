@@ -0,0 +1,29 @@
+"""ProductSearch: index pencarian inline mengikuti perubahan katalog."""
+
+def test_search_ranks_name_matches_first(main, run):
+    main.store.add_product({"name": "Zeta Premium", "description": "akun musik", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    in_name = main.store.add_product({"name": "Zeta Musik", "description": "-", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    assert main.product_search.ranked("zeta mus")[0] == in_name["id"]
+
+def test_stock_changes_do_not_resync_index(main, run, monkeypatch):
+    product = main.store.add_product({"name": "Omega Stream", "description": "", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    results, _ = main.product_search.search("omega")
+    assert results == []
+    
+    resynced = []
+    original = main.product_search._index
+    monkeypatch.setattr(main.product_search, "_index", lambda *args: resynced.append(args) or original(*args))
+    run(main.inventory.add(product["id"], [{"username": "omega1", "password": "p"}]))
+    
+    results, _ = main.product_search.search("omega")
+    assert [p["id"] for p in results] == [product["id"]]
+    assert resynced == []
+    assert main.store.catalog.search_version == main.product_search._version
+
+def test_renamed_product_is_reindexed(main):
+    product = main.store.add_product({"name": "Kappa Lama", "description": "", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    assert main.product_search.ranked("kappa") == [product["id"]]
+    product["name"] = "Sigma Baru"
+    main.store.update_product(product)
+    assert main.product_search.ranked("kappa") == []
+    assert main.product_search.ranked("sigma") == [product["id"]]
@@ -0,0 +1,61 @@
+"""StockMonitor: rekonsiliasi stok dan peringatan stok menipis/habis."""
+import pytest
+
+def accounts(prefix, count):
+    return [{"username": f"{prefix}{i}", "password": "p"} for i in range(count)]
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "products.json")
+
+def seed(main, run, path, stocks):
+    store = main.JsonProductStore(path)
+    ids = []
+    for n, count in enumerate(stocks):
+        product_id = store.add_product({"name": f"Stok {n}", "price": "Rp 1.000", "stock": 0, "file_id": None})["id"]
+        store.add_accounts(product_id, accounts(f"p{product_id}_", count))
+        ids.append(product_id)
+    run(store.flush())
+    return ids
+
+def test_restart_does_not_resend_alerts(main, run, stub, path):
+    low, out, ok = seed(main, run, path, [2, 0, 20])
+    # Proses baru: katalog JSON belum dimuat sampai ada yang mengaksesnya
+    monitor = main.StockMonitor(main.JsonProductStore(path))
+    run(monitor.run())
+    run(monitor.run())
+
+    assert stub.calls.get("sendMessage", 0) == 0
+    assert monitor.levels == {low: main.STOCK_LOW, out: main.STOCK_OUT, ok: main.STOCK_OK}
+
+def test_alerts_once_per_worsening_level(main, run, stub, path):
+    [product_id] = seed(main, run, path, [7])
+    store = main.JsonProductStore(path)
+    monitor = main.StockMonitor(store)
+    run(monitor.run())
+
+    store.take_accounts(product_id, 3)
+    run(monitor.run())
+    store.take_accounts(product_id, 1)
+    run(monitor.run())
+    assert stub.calls["sendMessage"] == 1
+    store.take_accounts(product_id, 3)
+    run(monitor.run())
+    assert stub.calls["sendMessage"] == 2
+    # Restock mereset level; habis lagi berarti peringatan baru
+    store.add_accounts(product_id, accounts("baru", 10))
+    run(monitor.run())
+    store.take_accounts(product_id, 10)
+    run(monitor.run())
+    assert stub.calls["sendMessage"] == 3
+
+def test_stock_field_is_reconciled(main, run, stub, path):
+    [product_id] = seed(main, run, path, [8])
+    store = main.JsonProductStore(path)
+    monitor = main.StockMonitor(store)
+    product = store.get_product(product_id)
+    product["stock"] = 99
+    run(monitor.run())
+
+    assert store.get_product(product_id)["stock"] == 8
+    assert monitor.stats["fixed"] == 1
@@ -0,0 +1,42 @@
+"""TemplateStore dan alur edit SNK lewat bot."""
+import json
+
+import pytest
+
+import benchmark
+
+@pytest.fixture
+def templates(main, tmp_path, monkeypatch):
+    store = main.TemplateStore(str(tmp_path / "templates.json"), str(tmp_path / "snk.txt"))
+    monkeypatch.setattr(main, "templates", store)
+    return store
+
+def test_override_is_rendered_and_survives_restart(main, templates, tmp_path):
+    templates.set_template("proof_received", "Order #{order_code} diterima")
+    assert templates.render("proof_received", order_code="AB12") == "Order #AB12 diterima"
+    restarted = main.TemplateStore(str(tmp_path / "templates.json"), str(tmp_path / "snk.txt"))
+    assert restarted.render("proof_received", order_code="CD34") == "Order #CD34 diterima"
+    restarted.reset_template("proof_received")
+    assert restarted.source("proof_received") == main.DEFAULT_TEMPLATES["proof_received"][0]
+
+def test_unknown_field_is_rejected(main, templates):
+    with pytest.raises(ValueError):
+        templates.set_template("welcome", "Halo {nama}")
+    assert templates.render("welcome") == main.DEFAULT_TEMPLATES["welcome"][0]
+
+def test_files_changed_outside_are_reloaded(main, templates, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "TEMPLATE_CHECK_INTERVAL", 0)
+    (tmp_path / "snk.txt").write_text("SNK dari file")
+    # Override rusak di file memakai default tanpa mematikan bot
+    (tmp_path / "templates.json").write_text(json.dumps({"welcome": "Halo", "shop_menu": "{rusak}"}))
+    assert templates.snk() == "SNK dari file"
+    assert templates.render("welcome") == "Halo"
+    assert templates.render("shop_menu") == main.DEFAULT_TEMPLATES["shop_menu"][0]
+
+def test_admin_edits_snk_through_bot(main, run, stub, templates, tmp_path):
+    factory = benchmark.UpdateFactory(main.bot)
+    run(main.dp.feed_update(main.bot, factory.message(benchmark.ADMIN_ID, "📝 Edit SNK")))
+    run(main.dp.feed_update(main.bot, factory.message(benchmark.ADMIN_ID, "Tidak ada refund.")))
+
+    assert templates.snk() == "Tidak ada refund."
+    assert (tmp_path / "snk.txt").read_text() == "Tidak ada refund."
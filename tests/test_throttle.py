@@ -0,0 +1,32 @@
+"""ThrottleMiddleware: token bucket per user."""
+from types import SimpleNamespace
+
+def test_bucket_allows_burst_then_refills(main):
+    throttle = main.ThrottleMiddleware("message", rate=1, burst=3)
+    assert [throttle.allow(7, 0.0) for _ in range(4)] == [True, True, True, False]
+    assert not throttle.allow(7, 0.5)
+    assert throttle.allow(7, 1.0)
+    # Bucket user lain terpisah
+    assert throttle.allow(8, 1.0)
+
+def test_idle_entries_are_swept(main):
+    throttle = main.ThrottleMiddleware("message", rate=1, burst=3)
+    throttle.allow(7, 0.0)
+    throttle.allow(8, 400.0)
+    throttle._sweep(401.0)
+    assert set(throttle.buckets) == {8}
+    assert throttle.stats["evicted"] == 1
+
+def test_admins_and_unknown_senders_are_not_throttled(main, run):
+    throttle = main.ThrottleMiddleware("message", rate=1, burst=1)
+    handled = []
+    
+    async def handler(event, data):
+        handled.append(data.get("event_from_user"))
+    
+    admin = SimpleNamespace(id=main.ADMIN_ID)
+    for _ in range(3):
+        run(throttle(handler, SimpleNamespace(), {"event_from_user": admin}))
+        run(throttle(handler, SimpleNamespace(), {}))
+    assert len(handled) == 6
+    assert throttle.buckets == {}
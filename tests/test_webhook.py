@@ -0,0 +1,116 @@
+"""Mode webhook end-to-end: main.py di proses sendiri, Bot API palsu lewat API_SERVER.
+
+Endpoint Telegram palsu (aiohttp) mencatat setiap method yang dipanggil bot
+dan menjawab seperti Bot API. Update dikirim ke server webhook bot dengan
+header secret token, persis seperti Telegram.
+"""
+import asyncio
+import os
+import signal
+import socket
+import sys
+import time
+
+from aiohttp import ClientSession, web
+
+import benchmark
+from conftest import REPO_DIR, write_config
+
+SECRET = "rahasia-webhook"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_update(update_id, user_id):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": "/start",
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Pembeli"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+    }}
+
+async def start_fake_api(calls):
+    async def handle(request):
+        method = request.match_info["method"]
+        payload = dict(await request.post())
+        calls.append((method, payload))
+        if method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "Toko", "username": "toko_bot"}
+        elif method.startswith("send"):
+            result = {
+                "message_id": len(calls), "date": int(time.time()), "text": payload.get("text", ""),
+                "chat": {"id": int(payload["chat_id"]), "type": "private"}
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post(f"/bot{benchmark.BOT_TOKEN}/{{method}}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+async def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("waktu habis menunggu kondisi")
+        await asyncio.sleep(0.05)
+
+async def wait_until_listening(port, proc, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.returncode is not None:
+            raise AssertionError(f"bot berhenti dengan kode {proc.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return
+    raise AssertionError("server webhook tidak pernah listen")
+
+def test_webhook_serves_updates_and_stops_cleanly(run, tmp_path):
+    async def scenario():
+        calls = []
+        api_runner, api_port = await start_fake_api(calls)
+        webhook_port = free_port()
+        write_config(
+            tmp_path, MODE="webhook", API_SERVER=f"http://127.0.0.1:{api_port}",
+            WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=webhook_port, WEBHOOK_SECRET=SECRET,
+            STOCK_CHECK_INTERVAL=3600, BACKUP_INTERVAL=0
+        )
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(REPO_DIR, "main.py"), cwd=tmp_path,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            await wait_until_listening(webhook_port, proc)
+            url = f"http://127.0.0.1:{webhook_port}/webhook"
+            async with ClientSession() as http:
+                async with http.post(url, json=start_update(1, 777),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": "salah"}) as response:
+                    assert response.status == 401
+                async with http.post(url, json=start_update(2, 777),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                    assert response.status == 200
+            await wait_for(lambda: any(m == "sendMessage" and p["chat_id"] == "777" for m, p in calls))
+            # Update dengan secret salah tidak pernah sampai ke handler
+            assert sum(m == "sendMessage" for m, _ in calls) == 1
+
+            proc.send_signal(signal.SIGTERM)
+            assert await asyncio.wait_for(proc.wait(), timeout=15) == 0
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            await api_runner.cleanup()
+
+    run(scenario())
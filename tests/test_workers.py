@@ -0,0 +1,90 @@
+"""Mode multi-worker: dua proses berebut stok produk yang sama.
+
+Setiap proses mengimpor main.py sendiri (WORKERS=2, STORAGE sqlite) sehingga
+InventoryAllocator memakai ProcessLock di atas database yang sama, persis
+seperti worker webhook di produksi.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import REPO_DIR, write_config
+
+SEED_SCRIPT = """
+import asyncio, sys
+sys.path.insert(0, sys.argv[1])
+import main
+
+async def seed():
+    product = main.store.add_product({"name": "Rebutan", "price": "Rp 1.000", "stock": 0, "file_id": None})
+    await main.inventory.add(product["id"], [{"username": f"u{i}", "password": "p"} for i in range(int(sys.argv[2]))])
+    await main.credentials.flush()
+    print(product["id"])
+
+asyncio.run(seed())
+"""
+
+WORKER_SCRIPT = """
+import asyncio, json, os, sys, time
+sys.path.insert(0, sys.argv[1])
+import main
+
+async def drain(product_id, quantity):
+    taken = []
+    while True:
+        accounts = await main.inventory.take(product_id, quantity)
+        if not accounts:
+            # Sisa stok lebih sedikit dari quantity: ambil satu per satu
+            if quantity == 1:
+                break
+            quantity = 1
+            continue
+        taken.extend(a["username"] for a in accounts)
+        # Jeda seperti handler sungguhan agar worker lain sempat mendapat lock
+        await asyncio.sleep(0.001)
+    await main.credentials.flush()
+    return {"taken": taken, "left": main.store.count_accounts(product_id)}
+
+print("ready", flush=True)
+while not os.path.exists("go"):
+    time.sleep(0.005)
+print(json.dumps(asyncio.run(drain(int(sys.argv[2]), int(sys.argv[3])))))
+"""
+
+ACCOUNTS = 300
+
+def test_two_workers_never_allocate_the_same_account(tmp_path):
+    write_config(tmp_path, STORAGE="sqlite", WORKERS=2)
+    env = dict(os.environ, BOT_WORKER="1")
+    seed = subprocess.run(
+        [sys.executable, "-c", SEED_SCRIPT, REPO_DIR, str(ACCOUNTS)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+    product_id = seed.stdout.split()[-1]
+    
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", WORKER_SCRIPT, REPO_DIR, product_id, str(quantity)],
+            cwd=tmp_path, env=dict(os.environ, BOT_WORKER=str(index)),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        for index, quantity in ((1, 1), (2, 3))
+    ]
+    for worker in workers:
+        assert worker.stdout.readline().strip() == "ready"
+    (tmp_path / "go").touch()
+    
+    results = []
+    for worker in workers:
+        stdout, stderr = worker.communicate(timeout=120)
+        assert worker.returncode == 0, stderr
+        results.append(json.loads(stdout.strip().splitlines()[-1]))
+    
+    first, second = (set(result["taken"]) for result in results)
+    assert first and second
+    assert len(first) == len(results[0]["taken"]) and len(second) == len(results[1]["taken"])
+    assert not first & second
+    assert len(first | second) == ACCOUNTS
+    # Cache stok tiap proses ikut melihat pengambilan oleh proses lain
+    assert [result["left"] for result in results] == [0, 0]